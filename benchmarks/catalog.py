@@ -0,0 +1,28 @@
+from time import perf_counter
+from src.xml_element import XMLElement
+
+genres = ["Computer", "Fantasy", "Romance", "Horror"]
+
+
+def build_catalog(no_books: int) -> XMLElement:
+    """Return a catalog tree of ``no_books`` books, each with an author, title, genre and price, which has ``5 * no_books + 1`` elements."""
+    specs = [(0, "catalog", None, None)]
+    for i in range(no_books):
+        specs += [
+            (1, "book", {"id": f"bk{i}", "lang": "en"}, None),
+            (2, "author", None, f"Author {i % 1000}"),
+            (2, "title", None, f"Title {i} & more"),
+            (2, "genre", None, genres[i % len(genres)]),
+            (2, "price", None, 5 + i % 50 + 0.95),
+        ]
+    return XMLElement.build(specs)
+
+
+def best_time(function, repeat: int = 3) -> float:
+    """Return the shortest time in seconds taken by ``repeat`` calls of ``function``."""
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
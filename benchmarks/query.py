@@ -0,0 +1,105 @@
+"""Compare ``XMLElement.select`` and ``select_one`` with hand-written traversals which find the same elements.
+
+Run from the repository root with ``python -m benchmarks.query [no_books]``. Each row is the best of three runs of a query and of an explicit loop over ``children`` or a stack of descendants in document order, after checking that both find the same elements. Query plans are cached, so the times do not include compiling the query.
+
+Results on one core, Python 3.11.7, 200,001 elements (40,000 books), in milliseconds::
+
+    query                                         select     loops
+    book/title                                   119.264    28.715
+    //book[price<30]                             243.461   212.444
+    //book[@id="bk39999"]                        253.613   149.249
+    book[genre="Horror"]/title, select_one         0.018     0.007
+    //book[@id="bk39999"], indexed                 0.014   150.671
+
+Without an index, queries take 1.1 to 4.2 times as long as the loops, which is the cost of generators stacked per step and predicate. select_one stops at the first match as a loop with an early return does. With an index on ``id``, the query reads the index instead of walking the tree and is about ten thousand times faster than the loop.
+"""
+
+from sys import argv
+from benchmarks.catalog import best_time, build_catalog
+
+
+def walk(tree):
+    """Yield the descendants of ``tree`` in document order, without ``tree`` itself."""
+    stack = list(reversed(tree.children))
+    while stack:
+        xmlelt = stack.pop()
+        yield xmlelt
+        stack.extend(reversed(xmlelt.children))
+
+
+def titles(tree):
+    return [
+        child
+        for book in tree.children
+        for child in book.children
+        if child.tag == "title"
+    ]
+
+
+def cheap_books(tree):
+    return [
+        xmlelt
+        for xmlelt in walk(tree)
+        if xmlelt.tag == "book"
+        and any(
+            child.tag == "price" and float(child.value) < 30
+            for child in xmlelt.children
+        )
+    ]
+
+
+def book_by_id(tree, book_id):
+    return [
+        xmlelt
+        for xmlelt in walk(tree)
+        if xmlelt.tag == "book" and xmlelt.attributes.get("id") == book_id
+    ]
+
+
+def first_horror_title(tree):
+    for book in tree.children:
+        if any(
+            child.tag == "genre" and child.value == "Horror" for child in book.children
+        ):
+            for child in book.children:
+                if child.tag == "title":
+                    return child
+
+
+def main(no_books: int = 40000):
+    tree = build_catalog(no_books)
+    last_id = f"bk{no_books - 1}"
+    cases = [
+        ("book/title", lambda: tree.select("book/title"), lambda: titles(tree)),
+        (
+            "//book[price<30]",
+            lambda: tree.select("//book[price<30]"),
+            lambda: cheap_books(tree),
+        ),
+        (
+            f'//book[@id="{last_id}"]',
+            lambda: tree.select(f'//book[@id="{last_id}"]'),
+            lambda: book_by_id(tree, last_id),
+        ),
+        (
+            'book[genre="Horror"]/title, select_one',
+            lambda: tree.select_one('book[genre="Horror"]/title'),
+            lambda: first_horror_title(tree),
+        ),
+    ]
+    print(f"{tree.size} elements, milliseconds")
+    print(f"{'query':<42} {'select':>9} {'loops':>9}")
+    for name, query, loops in cases:
+        assert query() == loops()
+        print(
+            f"{name:<42} {best_time(query) * 1000:9.3f} {best_time(loops) * 1000:9.3f}"
+        )
+    tree.add_index("id")
+    name, query, loops = cases[2]
+    assert query() == loops()
+    name += ", indexed"
+    print(f"{name:<42} {best_time(query) * 1000:9.3f} {best_time(loops) * 1000:9.3f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, argv[1:]))
@@ -0,0 +1,41 @@
+"""Measure how writing a large tree with ``XMLElement.write(workers=N)`` scales with the number of worker processes.
+
+Run from the repository root with ``python -m benchmarks.workers [no_books]``. Each row is the best of three writes of the whole document to a StringIO, with the speedup over the serial write. The pool uses the default start method of ``multiprocessing``.
+
+Results with fork on one core, Python 3.11.7, 200,001 elements (40,000 books)::
+
+     workers  seconds  speedup
+      serial    0.487     1.00
+           2    0.979     0.50
+           4    0.650     0.75
+           8    0.827     0.59
+          16    1.107     0.44
+
+With one core the workers take turns, so a pool only adds the cost of starting processes and copying fragments back to the parent. Run the benchmark on the machine which will write the documents to choose ``workers``: a speedup needs at least as many free cores as workers.
+"""
+
+from io import StringIO
+from os import cpu_count
+from sys import argv
+from benchmarks.catalog import best_time, build_catalog
+
+
+def main(no_books: int = 40000):
+    tree = build_catalog(no_books)
+    expected = tree.to_string()
+    print(f"{tree.size} elements, {cpu_count()} cores")
+    serial = best_time(lambda: tree.write(StringIO()))
+    print(f"{'workers':>8} {'seconds':>8} {'speedup':>8}")
+    print(f"{'serial':>8} {serial:8.3f} {1:8.2f}")
+    for workers in (2, 4, 8, 16):
+        stream = StringIO()
+        tree.write(stream, workers=workers)
+        assert stream.getvalue() == expected
+        parallel = best_time(
+            lambda workers=workers: tree.write(StringIO(), workers=workers)
+        )
+        print(f"{workers:>8} {parallel:8.3f} {serial / parallel:8.2f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, argv[1:]))
@@ -0,0 +1,104 @@
+"""Compare ``XMLElement.write_xml_body`` with the recursive writer which it replaced.
+
+Run from the repository root with ``python -m benchmarks.write [no_books]``. The recursive writer is kept below as it was: for each element it called ``make_xml_tags`` up to four times, each of which found the element's depth by walking up to the root and escaped its attributes and value again, and it wrote each tag with its own ``write`` call. Each row is the best of three writes of the same catalog tree to a StringIO, after checking that both writers give the same text.
+
+Results on one core, Python 3.11.7::
+
+      elements  recursive    write  speedup
+        10,001      0.068    0.022     3.05
+       100,001      1.161    0.407     2.85
+       200,001      1.696    0.566     2.99
+
+Timings vary by about 30% between runs on this machine; the speedup stays between 2.3 and 3.5.
+"""
+
+from io import StringIO
+from sys import argv
+from benchmarks.catalog import best_time, build_catalog
+from src.xml_element import XMLElement
+
+
+def depth(xmlelt) -> int:
+    if xmlelt.parent:
+        return 1 + depth(xmlelt.parent)
+    return 0
+
+
+def insert_entity_refs(xmlelt, string: str) -> str:
+    refs = XMLElement.predef_entities | xmlelt.root.entities
+    for ref in refs:
+        no_to_replace = string.count(ref)
+        last_index = 0
+        for _ in range(no_to_replace):
+            location = string.index(ref, last_index)
+            string = (
+                string[:location]
+                + "&"
+                + refs[ref]
+                + ";"
+                + string[location + len(ref) :]
+            )
+            last_index = location
+    return string
+
+
+def attribute_string(xmlelt) -> str:
+    if not xmlelt.attributes:
+        return ""
+    attribute_string = " "
+    for key in xmlelt.attributes:
+        val = insert_entity_refs(xmlelt, str(xmlelt.attributes[key]))
+        attribute_string += f'{key}="{val}" '
+    return attribute_string[:-1]
+
+
+def make_xml_tags(xmlelt, tab_size: int, self_closing: bool = True) -> list:
+    offset = " " * depth(xmlelt) * tab_size
+    if xmlelt.is_leaf and self_closing and not xmlelt.value:
+        return [offset, f"<{xmlelt.tag}{attribute_string(xmlelt)}/>"]
+    open_tag = f"<{xmlelt.tag}{attribute_string(xmlelt)}>"
+    close_tag = f"</{xmlelt.tag}>"
+    if xmlelt.value is None:
+        val_to_write = None
+    else:
+        val_to_write = insert_entity_refs(xmlelt, str(xmlelt.value))
+    return [offset, open_tag, val_to_write, close_tag]
+
+
+def recursive_write_xml_body(xmlelt, f, tab_size: int, self_closing: bool):
+    if xmlelt.is_leaf:
+        f.write("".join(make_xml_tags(xmlelt, tab_size, self_closing)) + "\n")
+    else:
+        f.write(
+            make_xml_tags(xmlelt, tab_size, self_closing)[0]
+            + make_xml_tags(xmlelt, tab_size, self_closing)[1]
+            + "\n"
+        )
+        for child in xmlelt.children:
+            recursive_write_xml_body(child, f, tab_size, self_closing)
+        f.write(
+            make_xml_tags(xmlelt, tab_size, self_closing)[0]
+            + make_xml_tags(xmlelt, tab_size, self_closing)[3]
+        )
+        if not xmlelt.is_root:
+            f.write("\n")
+
+
+def main(*sizes: int):
+    print(f"{'elements':>10} {'recursive':>10} {'write':>8} {'speedup':>8}")
+    for no_books in sizes or (2000, 20000, 40000):
+        tree = build_catalog(no_books)
+        expected = StringIO()
+        recursive_write_xml_body(tree, expected, 2, True)
+        result = StringIO()
+        tree.write_xml_body(result, 2, True)
+        assert result.getvalue() == expected.getvalue()
+        old = best_time(
+            lambda tree=tree: recursive_write_xml_body(tree, StringIO(), 2, True)
+        )
+        new = best_time(lambda tree=tree: tree.write_xml_body(StringIO(), 2, True))
+        print(f"{tree.size:>10,} {old:10.3f} {new:8.3f} {old / new:8.2f}")
+
+
+if __name__ == "__main__":
+    main(*map(int, argv[1:]))
@@ -0,0 +1,338 @@
+from src.xml_element import XMLElement, attribute_text_form, text_form
+from bisect import bisect_left
+from collections import Counter
+from difflib import SequenceMatcher
+
+
+def diff(old_root: XMLElement, new_root: XMLElement) -> list[dict]:
+    """Return an edit script which turns the tree ``old_root`` into the tree ``new_root``. See ``apply_patch``.
+
+    Subtrees with the same ``content_hash`` in both trees are skipped without being walked. Content hashes are cached, so once they are known, eg. for a tree which is edited and diffed repeatedly, the time taken follows the size of the change rather than the size of the trees. A value can only be set on an element without children, so if an element with children has its value changed, eg. to 0, its children are deleted and inserted again around the set_value edit.
+    Each edit is a dictionary with an "op" key and the ``path`` of the element it changes. Paths are those of the tree being patched at the time the edit is applied, so edits must be applied in order.
+        - {"op": "set_tag", "path": [...], "tag": ...}
+        - {"op": "set_value", "path": [...], "value": ...}
+        - {"op": "set_attribute", "path": [...], "key": ..., "value": ...}
+        - {"op": "remove_attribute", "path": [...], "key": ...}
+        - {"op": "set_entities", "path": [], "entities": {...}}
+        - {"op": "delete", "path": [...]}
+        - {"op": "insert", "path": [...], "index": ..., "element": {...}}, where path is the parent's path and element is in the format returned by ``XMLElement.dict``
+        - {"op": "move", "path": [...], "from": ..., "to": ...}, where path is the parent's path
+
+    Arguments:
+    ``old_root`` -- the XMLElement tree to be changed.
+    ``new_root`` -- the XMLElement tree with the content wanted."""
+    script = []
+    if old_root.copy_entities() != new_root.copy_entities():
+        script.append(
+            {"op": "set_entities", "path": [], "entities": new_root.copy_entities()}
+        )
+    pairs = [(old_root, new_root, [])]
+    while pairs:
+        old, new, path = pairs.pop()
+        if old.content_hash == new.content_hash:
+            continue
+        if old.tag != new.tag:
+            script.append({"op": "set_tag", "path": path, "tag": new.tag})
+        script += diff_attributes(old, new, path)
+        matches, floating = match_children(old.children, new.children)
+        value_changed = text_form(old.value) != text_form(new.value)
+        if value_changed and any(old_index is not None for old_index in matches):
+            matches, floating = [None] * len(new.children), []
+        child_edits = diff_children(old.children, new.children, matches, floating, path)
+        if value_changed:
+            child_edits.insert(
+                len(old.children),
+                {"op": "set_value", "path": path, "value": new.value},
+            )
+        script += child_edits
+        for new_index, old_index in enumerate(matches):
+            if old_index is None:
+                continue
+            old_child = old.children[old_index]
+            new_child = new.children[new_index]
+            if old_child.content_hash != new_child.content_hash:
+                pairs.append((old_child, new_child, path + [new_index]))
+    return script
+
+
+def diff_attributes(old: XMLElement, new: XMLElement, path: list[int]) -> list[dict]:
+    """Return the edits which give the element ``old`` the attributes of ``new``."""
+    old_attributes = attribute_text_form(old.attributes)
+    script = [
+        {"op": "remove_attribute", "path": path, "key": key}
+        for key in old_attributes
+        if key not in new.attributes
+    ]
+    for key, value in new.attributes.items():
+        if old_attributes.get(key) != str(value):
+            script.append(
+                {"op": "set_attribute", "path": path, "key": key, "value": value}
+            )
+    return script
+
+
+def match_children(
+    old_children: list, new_children: list
+) -> tuple[list[int | None], list[int]]:
+    """Return, for each of ``new_children``, the index of the child in ``old_children`` which becomes it, or ``None`` if it is inserted, and the indices of the new children which are out of order.
+
+    Runs of children with unchanged content are matched first and keep their order, see ``matching_pairs``. Then children with the same content found elsewhere in the list are matched, and finally children with the same tag, in order, which are edited. The children out of order are those outside a longest run of matched children whose old indices increase, so that as few as possible are moved."""
+    old_hashes = [child.content_hash for child in old_children]
+    new_hashes = [child.content_hash for child in new_children]
+    matches = [None] * len(new_children)
+    matched_old = set()
+    for old_index, new_index in matching_pairs(old_hashes, new_hashes):
+        matches[new_index] = old_index
+        matched_old.add(old_index)
+    if len(matched_old) == len(old_children) == len(new_children):
+        return matches, []
+
+    unmatched_by_hash = {}
+    for old_index in reversed(range(len(old_children))):
+        if old_index not in matched_old:
+            unmatched_by_hash.setdefault(old_hashes[old_index], []).append(old_index)
+    for new_index, new_hash in enumerate(new_hashes):
+        if matches[new_index] is None and unmatched_by_hash.get(new_hash):
+            matches[new_index] = unmatched_by_hash[new_hash].pop()
+            matched_old.add(matches[new_index])
+
+    unmatched_by_tag = {}
+    for old_index in reversed(range(len(old_children))):
+        if old_index not in matched_old:
+            tag = old_children[old_index].tag
+            unmatched_by_tag.setdefault(tag, []).append(old_index)
+    for new_index, new_child in enumerate(new_children):
+        if matches[new_index] is None and unmatched_by_tag.get(new_child.tag):
+            matches[new_index] = unmatched_by_tag[new_child.tag].pop()
+
+    kept = [
+        new_index
+        for new_index, old_index in enumerate(matches)
+        if old_index is not None
+    ]
+    in_order = increasing_run([matches[new_index] for new_index in kept])
+    floating = sorted(set(kept) - {kept[position] for position in in_order})
+    return matches, floating
+
+
+def matching_pairs(old_hashes: list, new_hashes: list) -> list[tuple[int, int]]:
+    """Return pairs of indices ``(old_index, new_index)`` of equal hashes, increasing in both indices, which match up the unchanged children of an element.
+
+    Equal hashes at the start and end of the lists are paired first. Hashes which occur once in what remains of each list are then paired where they are in order, and the gaps between them are matched in the same way. Only gaps without such hashes are left to ``difflib.SequenceMatcher``, so the time taken follows the number of children rather than the number of children times the number of changes.
+
+    Arguments:
+    ``old_hashes``, ``new_hashes`` -- the content hashes of the children before and after the edits."""
+    pairs = []
+    gaps = [(0, len(old_hashes), 0, len(new_hashes))]
+    while gaps:
+        old_start, old_end, new_start, new_end = gaps.pop()
+        while (
+            old_start < old_end
+            and new_start < new_end
+            and old_hashes[old_start] == new_hashes[new_start]
+        ):
+            pairs.append((old_start, new_start))
+            old_start += 1
+            new_start += 1
+        while (
+            old_start < old_end
+            and new_start < new_end
+            and old_hashes[old_end - 1] == new_hashes[new_end - 1]
+        ):
+            old_end -= 1
+            new_end -= 1
+            pairs.append((old_end, new_end))
+        if old_start == old_end or new_start == new_end:
+            continue
+        old_counts = Counter(old_hashes[old_start:old_end])
+        new_counts = Counter(new_hashes[new_start:new_end])
+        old_positions = {
+            old_hashes[old_index]: old_index
+            for old_index in range(old_start, old_end)
+            if old_counts[old_hashes[old_index]] == 1
+        }
+        unique = [
+            (old_positions[new_hashes[new_index]], new_index)
+            for new_index in range(new_start, new_end)
+            if new_counts[new_hashes[new_index]] == 1
+            and new_hashes[new_index] in old_positions
+        ]
+        if not unique:
+            blocks = SequenceMatcher(
+                None,
+                old_hashes[old_start:old_end],
+                new_hashes[new_start:new_end],
+                autojunk=False,
+            )
+            for old_offset, new_offset, length in blocks.get_matching_blocks():
+                for offset in range(length):
+                    pairs.append(
+                        (
+                            old_start + old_offset + offset,
+                            new_start + new_offset + offset,
+                        )
+                    )
+            continue
+        anchors = [
+            unique[position] for position in increasing_run([old for old, _ in unique])
+        ]
+        for old_index, new_index in anchors:
+            pairs.append((old_index, new_index))
+            if old_start < old_index and new_start < new_index:
+                gaps.append((old_start, old_index, new_start, new_index))
+            old_start, new_start = old_index + 1, new_index + 1
+        gaps.append((old_start, old_end, new_start, new_end))
+    return pairs
+
+
+def increasing_run(values: list) -> list:
+    """Return the positions in ``values`` of a longest strictly increasing subsequence of ``values``, in order."""
+    tails = []
+    tail_positions = []
+    previous = [None] * len(values)
+    for position, value in enumerate(values):
+        if not tails or value > tails[-1]:
+            length = len(tails)
+        else:
+            length = bisect_left(tails, value)
+        if length == len(tails):
+            tails.append(value)
+            tail_positions.append(position)
+        else:
+            tails[length] = value
+            tail_positions[length] = position
+        if length:
+            previous[position] = tail_positions[length - 1]
+    run = []
+    position = tail_positions[-1] if tail_positions else None
+    while position is not None:
+        run.append(position)
+        position = previous[position]
+    run.reverse()
+    return run
+
+
+def diff_children(
+    old_children: list,
+    new_children: list,
+    matches: list,
+    floating: list,
+    path: list[int],
+) -> list[dict]:
+    """Return the deletes, moves and inserts which put the children of the element at ``path`` in the order of ``new_children``.
+
+    Unmatched children are deleted first. Each child which is out of order is then moved to just after the kept child which comes before it in the new order, and finally the new children are inserted.
+
+    Arguments:
+    ``old_children`` -- the children of the element before the edits.
+    ``new_children`` -- the children of the element after the edits.
+    ``matches``, ``floating`` -- as returned by ``match_children``.
+    ``path`` -- the path of the element."""
+    kept = {old_index for old_index in matches if old_index is not None}
+    script = [
+        {"op": "delete", "path": path + [old_index]}
+        for old_index in reversed(range(len(old_children)))
+        if old_index not in kept
+    ]
+    script += move_edits(matches, floating, path)
+    for new_index, old_index in enumerate(matches):
+        if old_index is None:
+            script.append(
+                {
+                    "op": "insert",
+                    "path": path,
+                    "index": new_index,
+                    "element": new_children[new_index].dict,
+                }
+            )
+    return script
+
+
+def move_edits(matches: list, floating: list, path: list[int]) -> list[dict]:
+    """Return the moves which put the kept children of the element at ``path`` in the order of ``matches``, taking each child in ``floating`` in turn to just after the kept child before it in the new order.
+
+    Positions are counted rather than searched for. The kept children which are not floating stay put and divide the children into groups. A moved child sits in the group of the kept child it follows, after the children already moved there, and the children still to be moved keep their old order after them. Each floating child therefore has a sort key for its place before and after its move, and its position is the number of children which stay put in the groups before it, plus the floating children before it, counted in a binary indexed tree over those keys.
+
+    Arguments:
+    ``matches``, ``floating`` -- as returned by ``match_children``.
+    ``path`` -- the path of the element."""
+    if not floating:
+        return []
+    is_floating = set(floating)
+    staying_new = []
+    staying_old = []
+    for new_index, old_index in enumerate(matches):
+        if old_index is not None and new_index not in is_floating:
+            staying_new.append(new_index)
+            staying_old.append(old_index)
+    old_keys = {}
+    new_keys = {}
+    for new_index in floating:
+        old_index = matches[new_index]
+        old_keys[new_index] = (bisect_left(staying_old, old_index), 1, old_index)
+        new_keys[new_index] = (bisect_left(staying_new, new_index), 0, new_index)
+    ranks = {
+        key: rank
+        for rank, key in enumerate(sorted([*old_keys.values(), *new_keys.values()]), 1)
+    }
+    counts = [0] * (len(ranks) + 1)
+
+    def add(key, change):
+        rank = ranks[key]
+        while rank < len(counts):
+            counts[rank] += change
+            rank += rank & -rank
+
+    def position_of(key):
+        position = key[0]
+        rank = ranks[key] - 1
+        while rank:
+            position += counts[rank]
+            rank -= rank & -rank
+        return position
+
+    for key in old_keys.values():
+        add(key, 1)
+    script = []
+    for new_index in floating:
+        position = position_of(old_keys[new_index])
+        add(old_keys[new_index], -1)
+        target = position_of(new_keys[new_index])
+        add(new_keys[new_index], 1)
+        if target != position:
+            script.append({"op": "move", "path": path, "from": position, "to": target})
+    return script
+
+
+def apply_patch(root: XMLElement, script: list[dict]) -> XMLElement:
+    """Apply the edits in ``script``, as returned by ``diff``, to the tree ``root`` in place and return it.
+
+    Arguments:
+    ``root`` -- the root XMLElement of the tree to be changed.
+    ``script`` -- list of edits, applied in order."""
+    for edit in script:
+        op = edit["op"]
+        xmlelt = root.get_from_path(edit["path"])
+        if op == "set_tag":
+            xmlelt.tag = edit["tag"]
+        elif op == "set_value":
+            xmlelt.value = edit["value"]
+        elif op == "set_attribute":
+            xmlelt.add_attribute({edit["key"]: edit["value"]})
+        elif op == "remove_attribute":
+            xmlelt.remove_attribute(edit["key"])
+        elif op == "set_entities":
+            for key in xmlelt.copy_entities():
+                if key not in edit["entities"]:
+                    xmlelt.remove_entity(key)
+            xmlelt.add_entity(edit["entities"])
+        elif op == "delete":
+            root.remove_paths([edit["path"]])
+        elif op == "insert":
+            new_child = XMLElement.from_dict(edit["element"])
+            xmlelt.insert_child(edit["index"], new_child)
+        elif op == "move":
+            xmlelt.children[edit["from"]].move(xmlelt, edit["to"])
+        else:
+            raise ValueError(f"Unknown edit {op}")
+    return root
@@ -1,5 +1,31 @@
-from json import dumps
-from typing import Any, TextIO, Literal
+from codecs import getincrementalencoder
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from itertools import chain, count, groupby, repeat
+from hashlib import blake2b
+from io import BufferedIOBase, BytesIO, RawIOBase, StringIO
+from json import JSONDecodeError, JSONDecoder, dumps, loads
+from json import load as load_json
+from re import compile
+from sys import getsizeof
+import sys
+from types import MappingProxyType
+from typing import Any, BinaryIO, TextIO, Literal
+from src.xml_query import compile_query
+
+
+mutation_counter = count()
+validation_policies = ("strict", "cached", "trusted")
+valid_name_pattern = compile(r"(?![Xx][Mm][Ll])[A-Za-z_][^&<>'\" ]*$")
+json_whitespace = compile(r"[ \t\n\r]*")
+json_value_ends = " \t\n\r,:]}"
+valid_name_cache = set()
+valid_name_cache_size = 4096
+write_buffer_size = 1 << 16
+read_buffer_size = 1 << 16
+fragment_cache_size = 1 << 26
+worker_tree = None
 
 
 class XMLElement:
@@ -12,13 +38,18 @@ class XMLElement:
         value: str = None,
         encoding: str = None,
         xml_version: str = None,
+        validation: str = None,
     ):
+        self.parent = None
+        self.root = self
+        self.__version = next(mutation_counter)
+        self.__indexes = {}
+        if validation not in (None, XMLElement.__validation):
+            self.validation = validation
         self.tag = tag
         self.__attributes = {}
         self.__value = value
         self.children = []
-        self.parent = None
-        self.root = self
         if attributes:
             self.add_attribute(attributes)
         self.__entities = {}
@@ -32,11 +63,44 @@ class XMLElement:
     @tag.setter
     def tag(self, new_val: str):
         """The name displayed inside the XML tags."""
-        is_valid_name(new_val, "tag name")
+        check_name(new_val, "tag name", self.validation)
         self.__tag = new_val
+        self.__touch()
+
+    __validation = "strict"
+
+    @property
+    def validation(self) -> str:
+        """Return the name validation policy of the element's tree, which is set on its root element.
+
+        Policies
+            - "strict": check every tag name and attribute key in full (the default)
+            - "cached": remember names which have passed, and check new names against a single precompiled pattern
+            - "trusted": skip the checks, eg. for trees loaded from files which are known to be valid
+        """
+        return self.root.__validation
+
+    @validation.setter
+    def validation(self, new_val: Literal["strict", "cached", "trusted"]):
+        if not self.is_root:
+            raise TypeError("Cannot set validation of non-root element")
+        if new_val not in validation_policies:
+            raise ValueError(
+                f"Validation must be one of {', '.join(validation_policies)}"
+            )
+        self.__validation = new_val
+
+    __entities_stamp = 0
+    __attribute_string_cache = None
+    __content_hash = None
+    __fragment_cache = None
 
     @property
     def entities(self):
+        """Return a read-only view of the dictionary containing the element's user-defined entity references."""
+        return MappingProxyType(self.__entities)
+
+    def copy_entities(self) -> dict:
         """Return a copy of the dictionary containing the element's user-defined entity references."""
         return self.__entities.copy()
 
@@ -53,11 +117,17 @@ class XMLElement:
                 self.__entities |= entity
             except:
                 raise TypeError("Entity must be of type dict")
+            self.__entities_stamp = next(mutation_counter)
+            self.__touch()
         else:
             raise TypeError("Cannot add entity to non-root element")
 
     @property
     def attributes(self):
+        """Return a read-only view of the dictionary containing the element's ``attributes``."""
+        return MappingProxyType(self.__attributes)
+
+    def copy_attributes(self) -> dict:
         """Return a copy of the dictionary containing the element's ``attributes``."""
         return self.__attributes.copy()
 
@@ -67,12 +137,21 @@ class XMLElement:
         Arguments:
         ``new_attribute`` -- dict object containing the new attributes to add to the element.
         """
+        policy = self.validation
         for key in new_attribute:
-            is_valid_name(key, "attribute key")
+            check_name(key, "attribute key", policy)
+        indexed_keys = [key for key in new_attribute if key in self.root.__indexes]
+        for key in indexed_keys:
+            self.root.__unindex_element(self, key)
         try:
             self.__attributes |= new_attribute
         except:
             raise TypeError("Attribute must be of type dict")
+        finally:
+            for key in indexed_keys:
+                self.root.__index_element(self, key)
+        self.__attribute_string_cache = None
+        self.__touch()
 
     def remove_attribute(self, key: str):
         """Remove the attribute with the supplied ``key`` from the XMLElement.
@@ -80,7 +159,11 @@ class XMLElement:
         Arguments:
         ``key`` -- the key of the attribute to be removed.
         """
+        if key in self.root.__indexes and key in self.__attributes:
+            self.root.__unindex_element(self, key)
         del self.__attributes[key]
+        self.__attribute_string_cache = None
+        self.__touch()
 
     def remove_entity(self, key: str):
         """Remove the entity with the supplied ``key`` from the XMLElement.
@@ -89,6 +172,115 @@ class XMLElement:
         ``key`` -- the key of the entity to be removed.
         """
         del self.__entities[key]
+        self.__entities_stamp = next(mutation_counter)
+        self.__touch()
+
+    @property
+    def version(self) -> int:
+        """Return the element's version stamp.
+
+        Every change to the element or anything below it in the tree gives the element, and each of its ancestors, a new stamp larger than any stamp issued before it."""
+        return self.__version
+
+    def changed_since(self, version: int) -> list["XMLElement"]:
+        """Return a list of the element's children which have changed, or whose descendants have changed, since ``version`` was issued.
+
+        Arguments:
+        ``version`` -- a version stamp previously read from ``version``."""
+        return [child for child in self.children if child.__version > version]
+
+    def __touch(self):
+        """Give the element and all of its ancestors a new version stamp."""
+        XMLElement.__touch_all([self])
+
+    @staticmethod
+    def __touch_all(elements: list["XMLElement"]):
+        """Give each of the ``elements`` and all of their ancestors the same new version stamp, visiting each ancestor once."""
+        stamp = next(mutation_counter)
+        for xmlelt in elements:
+            while xmlelt is not None and xmlelt.__version != stamp:
+                xmlelt.__version = stamp
+                xmlelt.__content_hash = None
+                if xmlelt.root.__fragment_cache:
+                    xmlelt.root.__fragment_cache.discard(xmlelt)
+                xmlelt = xmlelt.parent
+
+    @property
+    def content_hash(self) -> str:
+        """Return a hash of the content of the tree including and descending from the XMLElement.
+
+        The hash covers the tags, attributes and values of the element and its descendants, and the order of the children. Attribute order and user-defined entities are not included, and values and attribute values are hashed as they would appear in an XML document, so 30 and "30", and None and "", hash the same.
+        Each element's hash is built from its children's hashes and cached until the element or one of its descendants changes, so after a small change only the changed elements and their ancestors are hashed again. Store the hash of a document to check cheaply whether it has changed since.
+        """
+        if self.__content_hash is None:
+            stack = [(self, False)]
+            while stack:
+                xmlelt, children_hashed = stack.pop()
+                if children_hashed:
+                    xmlelt.__content_hash = hash_content(
+                        xmlelt.__tag,
+                        xmlelt.__attributes,
+                        xmlelt.__value,
+                        [child.__content_hash for child in xmlelt.children],
+                    )
+                elif xmlelt.__content_hash is None:
+                    stack.append((xmlelt, True))
+                    stack.extend((child, False) for child in xmlelt.children)
+        return self.__content_hash
+
+    def equals(self, other: "XMLElement") -> bool:
+        """Return ``True`` if the tree including and descending from ``other`` has the same content as this element's tree. See ``content_hash``.
+
+        Elements are compared top-down and the comparison stops at the first difference. Subtrees whose content hashes are already cached are compared by hash without walking them.
+
+        Arguments:
+        ``other`` -- the XMLElement to compare with."""
+        pairs = [(self, other)]
+        while pairs:
+            first, second = pairs.pop()
+            if first is second:
+                continue
+            if first.__content_hash and second.__content_hash:
+                if first.__content_hash != second.__content_hash:
+                    return False
+                continue
+            if (
+                first.__tag != second.__tag
+                or len(first.children) != len(second.children)
+                or text_form(first.__value) != text_form(second.__value)
+                or attribute_text_form(first.__attributes)
+                != attribute_text_form(second.__attributes)
+            ):
+                return False
+            pairs.extend(zip(first.children, second.children))
+        return True
+
+    def duplicate_subtrees(self) -> list[list["XMLElement"]]:
+        """Return groups of two or more elements below the XMLElement whose subtrees have the same content. See ``content_hash``.
+
+        Only the largest duplicates are reported: the descendants of a duplicated subtree are not grouped again. An element whose other copies are all inside larger duplicates is not reported, and its descendants are searched instead."""
+        hash_counts = {}
+        stack = list(self.children)
+        while stack:
+            xmlelt = stack.pop()
+            content_hash = xmlelt.content_hash
+            hash_counts[content_hash] = hash_counts.get(content_hash, 0) + 1
+            stack.extend(xmlelt.children)
+        groups = {}
+        stack = list(reversed(self.children))
+        while stack:
+            while stack:
+                xmlelt = stack.pop()
+                if hash_counts[xmlelt.__content_hash] > 1:
+                    groups.setdefault(xmlelt.__content_hash, []).append(xmlelt)
+                else:
+                    stack.extend(reversed(xmlelt.children))
+            for content_hash, group in list(groups.items()):
+                if len(group) == 1:
+                    del groups[content_hash]
+                    hash_counts[content_hash] = 1
+                    stack.extend(reversed(group[0].children))
+        return list(groups.values())
 
     @property
     def is_root(self):
@@ -106,6 +298,7 @@ class XMLElement:
             raise ValueError("Cannot add value to an element with children")
         else:
             self.__value = new_val
+            self.__touch()
 
     @property
     def path(self) -> list[int]:
@@ -124,6 +317,8 @@ class XMLElement:
         Arguments:
         ``new_child`` -- XMLElement to add as child of the current XMLElement.
         """
+        if isinstance(new_child, FrozenXMLElement):
+            raise TypeError("Cannot modify a frozen XMLElement")
         if new_child in self.descendants:
             raise ValueError("cannot add descendant as child")
         if self.value:
@@ -132,11 +327,110 @@ class XMLElement:
             )
         self.children.append(new_child)
         new_child.parent = self
+        new_child.__indexes = {}
+        new_child.__fragment_cache = None
         for xmlelt in new_child.descendants:
             xmlelt.root = self.root
             if xmlelt.entities:
                 self.add_entity(xmlelt.entities)
             xmlelt.metadata = None
+            self.root.__index_element(xmlelt)
+        new_child.__touch()
+
+    def insert_child(self, index: int, new_child: "XMLElement"):
+        """Insert a child into the current element's children at position ``index``.
+
+        Arguments:
+        ``index`` -- the position of the new child, as for ``list.insert``.
+        ``new_child`` -- XMLElement without a parent to add as child of the current XMLElement.
+        """
+        self.__insert_children(index, [new_child])
+
+    def extend_children(self, new_children: list["XMLElement"]):
+        """Add each of the ``new_children`` to the end of the current element's children.
+
+        The new children are checked once as a batch, and attached in time proportional to the size of their subtrees.
+
+        Arguments:
+        ``new_children`` -- iterable of XMLElements without parents to add as children of the current XMLElement.
+        """
+        self.__insert_children(len(self.children), list(new_children))
+
+    def move(self, new_parent: "XMLElement", index: int = None):
+        """Move the XMLElement, with its descendants, to become a child of ``new_parent``.
+
+        ``new_parent`` may be in the same tree or another tree. If the element was not the root of its tree, it is removed from its old parent first.
+
+        Arguments:
+        ``new_parent`` -- the XMLElement which will become the element's parent.
+        ``index`` -- the element's position among ``new_parent``'s children, after it has been removed from its old parent. Negative indices count from the end, as for ``list.insert``, but an IndexError is raised if ``index`` is out of range. Defaults to the end.
+
+        Every check is made before the element is removed from its old parent, so a move which raises leaves both trees unchanged.
+        """
+        if isinstance(self, FrozenXMLElement) or isinstance(
+            new_parent, FrozenXMLElement
+        ):
+            raise TypeError("Cannot modify a frozen XMLElement")
+        ancestor = new_parent
+        while ancestor is not None:
+            if ancestor is self:
+                raise ValueError("cannot add ancestor as child")
+            ancestor = ancestor.parent
+        if new_parent.value:
+            raise ValueError(
+                "Cannot add children to an element with a value. Please set value to None."
+            )
+        no_children = len(new_parent.children) - (self.parent is new_parent)
+        if index is None:
+            index = no_children
+        elif not -no_children <= index <= no_children:
+            raise IndexError("child index out of range")
+        old_parent = self.parent
+        if old_parent is not None:
+            for position, child in enumerate(old_parent.children):
+                if child is self:
+                    del old_parent.children[position]
+                    break
+            old_parent.__detach([self], [old_parent])
+        new_parent.__insert_children(index, [self])
+
+    def __insert_children(self, index: int, new_children: list["XMLElement"]):
+        """Check the ``new_children`` once as a batch, then insert them into the element's children at ``index``."""
+        if self.value:
+            raise ValueError(
+                "Cannot add children to an element with a value. Please set value to None."
+            )
+        ancestors = set()
+        ancestor = self
+        while ancestor is not None:
+            ancestors.add(id(ancestor))
+            ancestor = ancestor.parent
+        new_ids = set()
+        for new_child in new_children:
+            if isinstance(new_child, FrozenXMLElement):
+                raise TypeError("Cannot modify a frozen XMLElement")
+            if id(new_child) in ancestors:
+                raise ValueError("cannot add ancestor as child")
+            if new_child.parent is not None:
+                raise ValueError("element already has a parent")
+            if id(new_child) in new_ids:
+                raise ValueError("cannot add the same element twice")
+            new_ids.add(id(new_child))
+        root = self.root
+        self.children[index:index] = new_children
+        for new_child in new_children:
+            new_child.parent = self
+            if new_child.__entities:
+                root.add_entity(new_child.__entities)
+            new_child.__indexes = {}
+            new_child.__fragment_cache = None
+            stack = [new_child]
+            while stack:
+                xmlelt = stack.pop()
+                xmlelt.root = root
+                root.__index_element(xmlelt)
+                stack.extend(xmlelt.children)
+        XMLElement.__touch_all(new_children)
 
     def make_child(self, tag: str, attributes: dict = None, value: str = None):
         """Create a child and add it to the current XMLElement's children.
@@ -145,7 +439,7 @@ class XMLElement:
         ``tag`` -- the name to be written inside the new child's tags.
         ``attributes`` -- the attributes beloinging to the new child.
         ``value`` -- the text which will appear between the child's start and stop tags."""
-        new_child = XMLElement(tag, attributes, value)
+        new_child = XMLElement(tag, attributes, value, validation=self.validation)
         self.add_child(new_child)
 
     def add_sibling(self, new_sibling):
@@ -168,9 +462,320 @@ class XMLElement:
         ``value`` -- the text which will appear between the element's start and stop tags."""
         if not tag:
             tag = self.tag
-        new_sibling = XMLElement(tag, attributes, value)
+        new_sibling = XMLElement(tag, attributes, value, validation=self.validation)
         self.add_sibling(new_sibling)
 
+    def clone(self, deep: bool = True) -> "XMLElement":
+        """Return a copy of the XMLElement which is the root of a new tree.
+
+        The copy has the same tag, attributes and value as the original, which are shared rather than copied since they are not changed in place, and the user-defined entities and validation policy of the original's tree. Names are not validated again. If the original is a root element, the copy has the same attribute indexes.
+
+        Arguments:
+        ``deep`` -- ``True``: copy all of the element's descendants, in a single pass without recursion. ``False``: copy only the element itself (defaults to ``True``)."""
+        copy = self.__copy_element(None, None)
+        copy.encoding = self.encoding
+        copy.xml_version = self.xml_version
+        copy.__entities = self.root.__entities.copy()
+        copy.__entities_stamp = self.root.__entities_stamp
+        copy.__validation = self.validation
+        if deep:
+            stack = [(self, copy)]
+            while stack:
+                original, duplicate = stack.pop()
+                for child in original.children:
+                    child_copy = child.__copy_element(duplicate, copy)
+                    duplicate.children.append(child_copy)
+                    if child.children:
+                        stack.append((child, child_copy))
+        if self.is_root:
+            for key in self.__indexes:
+                copy.add_index(key)
+        return copy
+
+    def __deepcopy__(self, memo: dict):
+        copy = self.clone()
+        stack = [(self, copy)]
+        while stack:
+            original, duplicate = stack.pop()
+            memo[id(original)] = duplicate
+            stack.extend(zip(original.children, duplicate.children))
+        return copy
+
+    def freeze(self) -> "FrozenXMLElement":
+        """Return an immutable copy of the tree including and descending from the XMLElement. See ``FrozenXMLElement``."""
+        return FrozenXMLElement.from_element(self)
+
+    def thaw(self) -> "XMLElement":
+        """Return a mutable copy of the tree including and descending from the XMLElement."""
+        return self.clone()
+
+    def dispose(self):
+        """Break the links between the elements of the tree so that it is freed as soon as it is no longer referenced, without waiting for the garbage collector.
+
+        Each element's ``parent`` and ``root`` links and the root's indexes make every tree a reference cycle, which only Python's cyclic garbage collector can free. Dropping a large tree can then cause a long collector pause. ``dispose`` removes the links in a single pass without recursion. The tree must not be used afterwards.
+        The XMLElement can also be used as a context manager, which disposes of the tree on exit.
+        """
+        if not self.is_root:
+            raise TypeError("Cannot dispose of non-root element")
+        self.__indexes = {}
+        self.__fragment_cache = None
+        stack = [self]
+        while stack:
+            xmlelt = stack.pop()
+            stack.extend(xmlelt.children)
+            xmlelt.children = []
+            xmlelt.parent = None
+            xmlelt.root = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.dispose()
+
+    def __copy_element(self, parent: "XMLElement", root: "XMLElement"):
+        """Return a childless copy of the element, attached to ``parent`` and ``root`` without validation or checks."""
+        return XMLElement.__make_element(
+            self.__tag, self.__attributes.copy(), self.__value, parent, root
+        )
+
+    @staticmethod
+    def __make_element(
+        tag: str, attributes: dict, value: Any, parent: "XMLElement", root: "XMLElement"
+    ) -> "XMLElement":
+        """Return a new childless XMLElement attached to ``parent`` and ``root`` without validation or checks.
+
+        If ``root`` is ``None``, the new element is the root of its own tree. The caller must add the element to ``parent.children``."""
+        xmlelt = XMLElement.__new__(XMLElement)
+        xmlelt.parent = parent
+        xmlelt.root = root or xmlelt
+        xmlelt.__version = next(mutation_counter)
+        xmlelt.__indexes = {}
+        xmlelt.__tag = tag
+        xmlelt.__attributes = attributes
+        xmlelt.__value = value
+        xmlelt.children = []
+        xmlelt.__entities = {}
+        xmlelt.encoding = None
+        xmlelt.xml_version = None
+        return xmlelt
+
+    @classmethod
+    def from_dict(
+        cls, tree_dict: dict, encoding: str = None, xml_version: str = None
+    ) -> "XMLElement":
+        """Return a new XMLElement tree built from a dictionary in the format returned by ``dict``.
+
+        The tree is built in a single pass without recursion. Each distinct tag name and attribute key is validated once.
+
+        Arguments:
+        ``tree_dict`` -- a dictionary like {"bookstore": {"attributes": {}, "value": None, "children": [...]}}.
+        ``encoding`` -- the encoding of the new tree's root element.
+        ``xml_version`` -- the XML version of the new tree's root element."""
+        validated = set()
+        root = None
+        stack = [(tree_dict, None)]
+        while stack:
+            element_dict, parent = stack.pop()
+            if not isinstance(element_dict, dict) or len(element_dict) != 1:
+                raise ValueError("Element dict must have exactly one key, the tag name")
+            [(tag, content)] = element_dict.items()
+            xmlelt = XMLElement.__build_element(
+                tag,
+                content.get("attributes"),
+                content.get("value"),
+                parent,
+                root,
+                validated,
+            )
+            children = content.get("children") or []
+            if root is None:
+                root = xmlelt
+            if children and xmlelt.value:
+                raise ValueError(
+                    "Cannot add children to an element with a value. Please set value to None."
+                )
+            stack.extend((child, xmlelt) for child in reversed(children))
+        root.encoding = encoding
+        root.xml_version = xml_version
+        return root
+
+    @classmethod
+    def from_json(
+        cls,
+        source: str,
+        stream: bool = False,
+        encoding: str = None,
+        xml_version: str = None,
+    ) -> "XMLElement":
+        """Return a new XMLElement tree built from JSON in the format returned by ``json``.
+
+        The keys of each element may be in any order, eg. as written with ``sort_keys``. By default the JSON is decoded into dictionaries which are passed to ``from_dict``. With ``stream``, a file is read in blocks and the elements are built as they are read. Only the attributes and value of one element are decoded at a time, so neither the text nor a dictionary of the whole document is held in memory alongside the tree. Streaming also reads trees deeper than the recursion limit.
+
+        Arguments:
+        ``source`` -- a JSON string, or the location of a JSON file. Text starting with "{" is treated as JSON.
+        ``stream`` -- ``True``: build the elements while reading the JSON. ``False``: decode the whole document first.
+        ``encoding`` -- the encoding of the new tree's root element.
+        ``xml_version`` -- the XML version of the new tree's root element."""
+        if source.lstrip().startswith("{"):
+            if stream:
+                root = XMLElement.__parse_json_elements(JSONTokenReader(source))
+            else:
+                root = cls.from_dict(loads(source))
+        else:
+            with open(source, encoding="utf-8") as f:
+                if stream:
+                    root = XMLElement.__parse_json_elements(JSONTokenReader("", f))
+                else:
+                    root = cls.from_dict(load_json(f))
+        root.encoding = encoding
+        root.xml_version = xml_version
+        return root
+
+    @classmethod
+    def from_binary(cls, filepath: str) -> "XMLElement":
+        """Return a new XMLElement tree read from the binary snapshot file located at ``filepath``, as written by ``to_binary`` or ``XMLStore.to_binary``.
+
+        Arguments:
+        ``filepath`` -- location of the snapshot file."""
+        from src.xml_store import XMLStore
+
+        return XMLStore.from_binary(filepath).to_element()
+
+    @staticmethod
+    def __parse_json_elements(reader: "JSONTokenReader") -> "XMLElement":
+        """Return the XMLElement tree read from ``reader``, building each element as its start is read. Only attribute dictionaries and values are decoded whole."""
+        validated = set()
+        read_token = reader.read_token
+        next_token = reader.next_token
+        read_value = reader.read_value
+
+        def read_element(parent: "XMLElement") -> "XMLElement":
+            read_token("{")
+            tag = read_value()
+            read_token(":")
+            read_token("{")
+            return XMLElement.__build_element(
+                tag, None, None, parent, parent.root if parent else None, validated
+            )
+
+        root = read_element(None)
+        stack = [[root, 0]]
+        while stack:
+            frame = stack[-1]
+            xmlelt, fields = frame
+            if next_token() == "}":
+                read_token("}")
+                read_token("}")
+                if xmlelt.children and xmlelt.value:
+                    raise ValueError(
+                        "Cannot add children to an element with a value. Please set value to None."
+                    )
+                stack.pop()
+                if not stack:
+                    break
+                if next_token() == ",":
+                    read_token(",")
+                    stack.append([read_element(stack[-1][0]), 0])
+                else:
+                    read_token("]")
+                continue
+            if fields:
+                read_token(",")
+            frame[1] += 1
+            key = read_value()
+            read_token(":")
+            if key == "attributes":
+                attributes = read_value() or {}
+                for attribute_key in attributes:
+                    if ("attribute key", attribute_key) not in validated:
+                        is_valid_name(attribute_key, "attribute key")
+                        validated.add(("attribute key", attribute_key))
+                xmlelt.__attributes = attributes
+            elif key == "value":
+                xmlelt.__value = read_value()
+            elif key == "children":
+                read_token("[")
+                if next_token() == "]":
+                    read_token("]")
+                else:
+                    stack.append([read_element(xmlelt), 0])
+            else:
+                raise ValueError(f"Unknown key {key} in element {xmlelt.tag}")
+        if next_token():
+            raise ValueError(f"Extra data at position {reader.position}")
+        return root
+
+    @classmethod
+    def build(
+        cls, specs, encoding: str = None, xml_version: str = None
+    ) -> "XMLElement":
+        """Return a new XMLElement tree built from an iterable of element specifications in document order.
+
+        Each specification is a tuple (depth, tag, attributes, value), where depth is 0 for the root element, 1 for its children, and so on. Each element is added as the last child of the most recent element one level above it.
+        The tree is built in a single pass. Each distinct tag name and attribute key is validated once.
+
+        Arguments:
+        ``specs`` -- an iterable of (depth, tag, attributes, value) tuples, eg. [(0, "bookstore", None, None), (1, "book", {"category": "web"}, None)].
+        ``encoding`` -- the encoding of the new tree's root element.
+        ``xml_version`` -- the XML version of the new tree's root element."""
+        validated = set()
+        root = None
+        open_elements = []
+        for depth, tag, attributes, value in specs:
+            if depth == 0 and root:
+                raise ValueError("Cannot build a tree with more than one root element")
+            if depth > len(open_elements) or (depth and root is None):
+                raise ValueError(f"Element {tag} at depth {depth} has no parent")
+            del open_elements[depth:]
+            parent = open_elements[-1] if open_elements else None
+            if parent and parent.value:
+                raise ValueError(
+                    "Cannot add children to an element with a value. Please set value to None."
+                )
+            xmlelt = XMLElement.__build_element(
+                tag, attributes, value, parent, root, validated
+            )
+            if root is None:
+                root = xmlelt
+            open_elements.append(xmlelt)
+        if root is None:
+            raise ValueError("Cannot build a tree without a root element")
+        root.encoding = encoding
+        root.xml_version = xml_version
+        return root
+
+    def element_specs(self):
+        """Yield a (depth, tag, attributes, value) tuple for the XMLElement and each of its descendants, in the format read by ``build``. The XMLElement has depth 0."""
+        stack = [(self, 0)]
+        while stack:
+            xmlelt, depth = stack.pop()
+            yield depth, xmlelt.tag, xmlelt.copy_attributes(), xmlelt.value
+            stack.extend((child, depth + 1) for child in reversed(xmlelt.children))
+
+    @staticmethod
+    def __build_element(
+        tag: str,
+        attributes: dict | None,
+        value: Any,
+        parent: "XMLElement",
+        root: "XMLElement",
+        validated: set,
+    ) -> "XMLElement":
+        """Validate any names not in ``validated``, then return a new element added to ``parent``'s children."""
+        if ("tag name", tag) not in validated:
+            is_valid_name(tag, "tag name")
+            validated.add(("tag name", tag))
+        attributes = dict(attributes) if attributes else {}
+        for key in attributes:
+            if ("attribute key", key) not in validated:
+                is_valid_name(key, "attribute key")
+                validated.add(("attribute key", key))
+        xmlelt = XMLElement.__make_element(tag, attributes, value, parent, root)
+        if parent:
+            parent.children.append(xmlelt)
+        return xmlelt
+
     @property
     def last_child(self):
         """Return the most recently-added child of the XMLElement object."""
@@ -182,10 +787,12 @@ class XMLElement:
         """Return the number of generations of parents which a node has.
 
         Root node has depth 0, its children have depth 1, etc."""
-        if self.parent:
-            return 1 + self.parent.depth
-        else:
-            return 0
+        depth = 0
+        ancestor = self.parent
+        while ancestor:
+            depth += 1
+            ancestor = ancestor.parent
+        return depth
 
     @property
     def is_leaf(self):
@@ -202,6 +809,84 @@ class XMLElement:
         """Return the number of elements in the element's XML tree which descend from it, including itself."""
         return len(self.descendants)
 
+    def memory_report(self) -> dict:
+        """Return an estimate, in bytes, of the memory used by the tree including and descending from the XMLElement.
+
+        The tree is walked once without recursion. Sizes are those reported by ``sys.getsizeof``, and each tag, value, attribute key and attribute value is counted once however many elements share it. The report contains
+            - "elements": the number of elements
+            - "total": the sum of the breakdowns below
+            - "nodes": the element objects and their instance dictionaries
+            - "attributes": the attribute dictionaries
+            - "children": the lists of children
+            - "strings": the tags, values, attribute keys and attribute values
+            - "entities": the root's table of user-defined entity references, if the XMLElement is the root
+            - "indexes": the root's attribute indexes, if the XMLElement is the root
+            - "tags": for each tag, the number of elements with that tag and the bytes used by them, {tag: {"count": ..., "bytes": ...}}
+        """
+        seen = set()
+
+        def new_size(obj) -> int:
+            if id(obj) in seen:
+                return 0
+            seen.add(id(obj))
+            return getsizeof(obj)
+
+        report = dict.fromkeys(
+            ["elements", "total", "nodes", "attributes", "children", "strings"], 0
+        )
+        tags = {}
+        stack = [self]
+        while stack:
+            xmlelt = stack.pop()
+            stack.extend(xmlelt.children)
+            attributes = xmlelt.__attributes
+            sizes = (
+                getsizeof(xmlelt) + getsizeof(vars(xmlelt)),
+                getsizeof(attributes),
+                getsizeof(xmlelt.children),
+                sum(
+                    new_size(string)
+                    for string in chain(
+                        (xmlelt.__tag, xmlelt.__value),
+                        attributes.keys(),
+                        attributes.values(),
+                    )
+                    if string is not None
+                ),
+            )
+            report["elements"] += 1
+            for category, size in zip(
+                ["nodes", "attributes", "children", "strings"], sizes
+            ):
+                report[category] += size
+            tag_report = tags.setdefault(xmlelt.__tag, {"count": 0, "bytes": 0})
+            tag_report["count"] += 1
+            tag_report["bytes"] += sum(sizes)
+        report["entities"] = report["indexes"] = 0
+        if self.is_root:
+            report["entities"] = getsizeof(self.__entities) + sum(
+                new_size(string) for string in chain(*self.__entities.items())
+            )
+            report["indexes"] = getsizeof(self.__indexes)
+            for buckets in self.__indexes.values():
+                report["indexes"] += getsizeof(buckets)
+                report["indexes"] += sum(
+                    getsizeof(bucket) for bucket in buckets.values()
+                )
+        report["total"] = sum(
+            report[category]
+            for category in [
+                "nodes",
+                "attributes",
+                "children",
+                "strings",
+                "entities",
+                "indexes",
+            ]
+        )
+        report["tags"] = tags
+        return report
+
     def make_xml_tags(self, tab_size, self_closing=True) -> list[str]:
         """Return the conponents needed to create the XML tags for an XMLElement.
 
@@ -230,73 +915,318 @@ class XMLElement:
             val_to_write = self.insert_entity_refs(str(self.__value))
         return [offset, open_tag, val_to_write, close_tag]
 
-    def to_xml(self, filepath: str, tab_size: int = 2, self_closing: bool = True):
+    def to_xml(
+        self,
+        filepath: str,
+        tab_size: int = 2,
+        self_closing: bool = True,
+        minify: bool = False,
+        workers: int = None,
+    ):
         """Write the XMLElement tree structure to a well-formed XML file located at ``filepath``.
 
         Arguments:
         ``filepath`` -- location of the resulting XML file.
         ``tab_size`` -- number of spaces used for each level of indentation.
-        ``self_closing`` -- ``True``: use self-closing tags where possible, eg. <matthew/>. ``False``: use start and stop tags for all elements, eg. <matthew></matthew>."""
-        if self.xml_version:
-            xml_version = self.xml_version
-        else:
-            xml_version = "1.0"
+        ``self_closing`` -- ``True``: use self-closing tags where possible, eg. <matthew/>. ``False``: use start and stop tags for all elements, eg. <matthew></matthew>.
+        ``minify`` -- ``True``: write the elements without indentation or line breaks between them, for smaller files which are faster to write. ``False``: write each element on its own line (defaults to ``False``).
+        ``workers`` -- the number of processes used to render the XML of the element's children. See ``write``."""
         if self.encoding:
             encoding = self.encoding
         else:
             encoding = "UTF-8"
         with open(filepath, "w", encoding=encoding) as f:
-            f.write(f'<?xml version="{xml_version}" encoding="{encoding}"?>\n')
-            if self.root.entities:
-                f.write(f"<!DOCTYPE {self.root.tag} [\n")
-                for entity in self.root.entities:
-                    f.write(f'<!ENTITY {self.root.entities[entity]} "{entity}">\n')
-                f.write("]>\n")
-            self.write_xml_body(f, tab_size, self_closing)
-
-    def write_xml_body(self, f: TextIO, tab_size: int, self_closing: bool):
+            self.write(f, tab_size, self_closing, minify=minify, workers=workers)
+
+    def to_binary(self, filepath: str):
+        """Write the XMLElement tree structure to a binary snapshot file located at ``filepath``, which can be read back with ``from_binary``.
+
+        The tree is copied into an ``XMLStore`` which writes the snapshot. See ``XMLStore.to_binary`` for the format.
+
+        Arguments:
+        ``filepath`` -- location of the resulting snapshot file."""
+        from src.xml_store import XMLStore
+
+        XMLStore.from_element(self).to_binary(filepath)
+
+    def to_string(
+        self, tab_size: int = 2, self_closing: bool = True, minify: bool = False
+    ) -> str:
+        """Return the XML document which ``to_xml`` writes, as a string.
+
+        Arguments:
+        ``tab_size`` -- number of spaces used for each level of indentation.
+        ``self_closing`` -- controls the appearance of leaf tags without values. See ``to_xml`` for example.
+        ``minify`` -- ``True``: write the elements without indentation or line breaks between them (defaults to ``False``)."""
+        stream = StringIO()
+        self.write(stream, tab_size, self_closing, minify=minify)
+        return stream.getvalue()
+
+    def to_bytes(
+        self,
+        encoding: str = None,
+        tab_size: int = 2,
+        self_closing: bool = True,
+        minify: bool = False,
+    ) -> bytes:
+        """Return the XML document which ``to_xml`` writes, encoded as bytes.
+
+        Arguments:
+        ``encoding`` -- the encoding used, which is declared in the document (defaults to the element's ``encoding``, or "UTF-8" if it is not set).
+        ``tab_size`` -- number of spaces used for each level of indentation.
+        ``self_closing`` -- controls the appearance of leaf tags without values. See ``to_xml`` for example.
+        ``minify`` -- ``True``: write the elements without indentation or line breaks between them (defaults to ``False``)."""
+        stream = BytesIO()
+        self.write(stream, tab_size, self_closing, encoding, minify)
+        return stream.getvalue()
+
+    def write(
+        self,
+        stream: TextIO | BinaryIO,
+        tab_size: int = 2,
+        self_closing: bool = True,
+        encoding: str = None,
+        minify: bool = False,
+        workers: int = None,
+    ):
+        """Write the XML document which ``to_xml`` writes to the writable object ``stream``, which may be a text or binary stream, eg. a socket file or an HTTP response.
+
+        Binary streams are sent the document encoded with ``encoding``. The document is written and encoded in large blocks.
+        If ``workers`` is more than 1, the children of the XMLElement are sent to a pool of that many processes, which render the XML of groups of neighbouring children at the same time. The parts are written in order, so the document is the same as one written by a single process. This is faster for large trees on machines with several cores.
+
+        Arguments:
+        ``stream`` -- a writable text or binary file object.
+        ``tab_size`` -- number of spaces used for each level of indentation.
+        ``self_closing`` -- controls the appearance of leaf tags without values. See ``to_xml`` for example.
+        ``encoding`` -- the encoding declared in the document, and used to encode it for binary streams (defaults to the element's ``encoding``, or "UTF-8" if it is not set).
+        ``minify`` -- ``True``: write the elements without indentation or line breaks between them (defaults to ``False``).
+        ``workers`` -- the number of processes used to render the XML of the element's children (defaults to ``None``, rendering in this process)."""
+        xml_version = self.xml_version or "1.0"
+        encoding = encoding or self.encoding or "UTF-8"
+        if isinstance(stream, (RawIOBase, BufferedIOBase)) or "b" in getattr(
+            stream, "mode", ""
+        ):
+            stream = EncodedStream(stream, encoding)
+        stream.write(
+            xml_prolog(xml_version, encoding, self.root.tag, self.root.entities)
+        )
+        if workers and workers > 1 and self.children:
+            self.__write_body_in_parallel(
+                stream, tab_size, self_closing, minify, workers
+            )
+        else:
+            self.write_xml_body(stream, tab_size, self_closing, minify)
+
+    def __write_body_in_parallel(
+        self,
+        f: TextIO,
+        tab_size: int,
+        self_closing: bool,
+        minify: bool,
+        workers: int,
+    ):
+        """Write the XMLElement object and its descendants as ``write_xml_body`` does, rendering the XML of its children in a pool of ``workers`` processes.
+
+        Each process renders groups of neighbouring children. The pool uses the default start method of ``multiprocessing``. Where that is "fork", each process inherits the tree through the pool's initializer and is sent only the positions of the children. Elsewhere the processes are sent the children as ``build`` specifications, which pickle more compactly than XMLElement objects. Forking a process which runs several threads is unsafe, so such programs should choose the "forkserver" or "spawn" start method."""
+        depth = self.depth
+        offset = "" if minify else " " * depth * tab_size
+        line_end = "" if minify else "\n"
+        f.write(f"{offset}<{self.tag}{self.attribute_string}>{line_end}")
+        group_size = -(-len(self.children) // (workers * 4))
+        starts = range(0, len(self.children), group_size)
+        options = [repeat(tab_size), repeat(self_closing), repeat(minify)]
+        options.append(repeat(depth + 1))
+        context = get_context()
+        if context.get_start_method() == "fork":
+            executor = ProcessPoolExecutor(
+                workers, context, initializer=set_worker_tree, initargs=(self,)
+            )
+            stops = (start + group_size for start in starts)
+            tasks = (render_children, starts, stops, *options)
+        else:
+            executor = ProcessPoolExecutor(workers, context)
+            groups = (
+                [
+                    list(xmlelt.element_specs())
+                    for xmlelt in self.children[i : i + group_size]
+                ]
+                for i in starts
+            )
+            entities = self.root.copy_entities()
+            tasks = (render_subtrees, groups, repeat(entities), *options)
+        with executor:
+            for fragment in executor.map(*tasks):
+                f.write(fragment)
+        f.write(f"{offset}</{self.tag}>")
+        if not self.is_root:
+            f.write(line_end)
+
+    def write_xml_body(
+        self, f: TextIO, tab_size: int, self_closing: bool, minify: bool = False
+    ):
         """Write the descendants of the XMLElement object to the writable object ``f``.
 
+        The XML is collected from ``xml_chunks``, or ``minified_chunks`` if ``minify`` is set, and written in large blocks.
+
         Arguments:
         ``f`` -- a writable file object.
         ``tab_size`` -- the number of spaces used for each level of indentation (defaults to 2).
-        ``self_closing`` -- controls the appearance of leaf tags without values. See ``to_xml`` for example."""
-        if self.is_leaf:
-            f.write("".join(self.make_xml_tags(tab_size, self_closing)) + "\n")
+        ``self_closing`` -- controls the appearance of leaf tags without values. See ``to_xml`` for example.
+        ``minify`` -- ``True``: write the elements without indentation or line breaks between them (defaults to ``False``)."""
+        if minify:
+            chunks = self.minified_chunks(self_closing)
         else:
-            f.write(
-                self.make_xml_tags(tab_size, self_closing)[0]
-                + self.make_xml_tags(tab_size, self_closing)[1]
-                + "\n"
-            )
-            for child in self.children:
-                child.write_xml_body(f, tab_size, self_closing)
-            f.write(
-                self.make_xml_tags(tab_size, self_closing)[0]
-                + self.make_xml_tags(tab_size, self_closing)[3]
-            )
-            if not self.is_root:
-                f.write("\n")
+            chunks = self.xml_chunks(tab_size, self_closing)
+        write_buffered(f, chunks)
+
+    def xml_chunks(self, tab_size: int, self_closing: bool, depth: int = None):
+        """Return a generator of the pieces of XML which make up the XMLElement object and its descendants, as written by ``write_xml_body``.
+
+        The tree is walked once without recursion and each element's tags are rendered once. Each generated piece is the XML of a single tag and the value which it contains, with the line's indentation and line break.
+
+        Arguments:
+        ``tab_size`` -- the number of spaces used for each level of indentation.
+        ``self_closing`` -- controls the appearance of leaf tags without values. See ``to_xml`` for example.
+        ``depth`` -- the level of indentation of the XMLElement (defaults to its ``depth``).
+
+        If the tree's fragment cache is enabled, the XML of each element with children is cached as it is generated, and a subtree whose XML is cached is generated from the cache without rendering its elements again. See ``enable_fragment_cache``."""
+        refs = XMLElement.predef_entities | self.root.entities
+        cache = self.root.__fragment_cache
+        if cache is not None:
+            settings = (tab_size, self_closing, self.root.__entities_stamp)
+        open_parts = []
+        indents = []
+        stack = [(self, self.depth if depth is None else depth, "open", True)]
+        while stack:
+            xmlelt, level, action, record = stack.pop()
+            if action == "text":
+                yield xmlelt
+                continue
+            while len(indents) <= level:
+                indents.append(" " * len(indents) * tab_size)
+            offset = indents[level]
+            if action == "close":
+                if xmlelt.is_root:
+                    chunk = f"{offset}</{xmlelt.tag}>"
+                else:
+                    chunk = f"{offset}</{xmlelt.tag}>\n"
+                if cache is not None:
+                    parts = open_parts.pop()
+                    parts.append(chunk)
+                    cache.add(xmlelt, (level, *settings), parts)
+                    if record and open_parts:
+                        open_parts[-1].append(xmlelt)
+            elif xmlelt.children:
+                if cache is not None:
+                    parts = cache.get(xmlelt, (level, *settings))
+                    if parts is not None:
+                        if record and open_parts:
+                            open_parts[-1].append(xmlelt)
+                        stack.extend(
+                            (part, level, "text", False)
+                            if isinstance(part, str)
+                            else (part, level + 1, "open", False)
+                            for part in reversed(parts)
+                        )
+                        continue
+                    open_parts.append([])
+                chunk = f"{offset}<{xmlelt.tag}{xmlelt.attribute_string}>\n"
+                if cache is not None:
+                    open_parts[-1].append(chunk)
+                stack.append((xmlelt, level, "close", record))
+                stack.extend(
+                    (child, level + 1, "open", True)
+                    for child in reversed(xmlelt.children)
+                )
+            else:
+                if self_closing and not xmlelt.value:
+                    chunk = f"{offset}<{xmlelt.tag}{xmlelt.attribute_string}/>\n"
+                else:
+                    value = "" if xmlelt.value is None else str(xmlelt.value)
+                    chunk = f"{offset}<{xmlelt.tag}{xmlelt.attribute_string}>{insert_refs(value, refs)}</{xmlelt.tag}>\n"
+                if open_parts:
+                    open_parts[-1].append(chunk)
+            yield chunk
+
+    def minified_chunks(self, self_closing: bool):
+        """Return a generator of the pieces of XML which make up the XMLElement object and its descendants, without indentation or line breaks.
+
+        Each generated piece is the XML of a single tag and the value which it contains.
+
+        Arguments:
+        ``self_closing`` -- controls the appearance of leaf tags without values. See ``to_xml`` for example."""
+        refs = XMLElement.predef_entities | self.root.entities
+        stack = [(self, False)]
+        while stack:
+            xmlelt, closing = stack.pop()
+            if closing:
+                yield f"</{xmlelt.tag}>"
+            elif xmlelt.children:
+                yield f"<{xmlelt.tag}{xmlelt.attribute_string}>"
+                stack.append((xmlelt, True))
+                stack.extend((child, False) for child in reversed(xmlelt.children))
+            elif self_closing and not xmlelt.value:
+                yield f"<{xmlelt.tag}{xmlelt.attribute_string}/>"
+            else:
+                value = "" if xmlelt.value is None else str(xmlelt.value)
+                yield f"<{xmlelt.tag}{xmlelt.attribute_string}>{insert_refs(value, refs)}</{xmlelt.tag}>"
 
     def __str__(self):
-        output = ""
-        for xmlelt in list(self):
-            output += xmlelt.print_line()
-        return output
+        stream = StringIO()
+        self.pretty_print(stream)
+        return stream.getvalue()
 
     def print_line(self) -> str:
         """Return a string containing the element's information in an easy-to-read format."""
+        return self.__pretty_line(self.depth, self.path)
+
+    def pretty_print(
+        self, f: TextIO = None, max_nodes: int = None, max_depth: int = None
+    ):
+        """Write the tree including and descending from the XMLElement to ``f`` in an easy-to-read format, one element per line as returned by ``print_line``.
+
+        The tree is walked once without recursion, and each element's depth and path are worked out from its parent's. Set ``max_nodes`` or ``max_depth`` to bound the output for large trees.
+
+        Arguments:
+        ``f`` -- a writable file object (defaults to standard output).
+        ``max_nodes`` -- the number of elements after which the output stops with a line "...".
+        ``max_depth`` -- the number of levels below the XMLElement which are written. The children of elements on the last level are summarised in a single line."""
+        if f is None:
+            f = sys.stdout
+        depth = self.depth
+        stack = [(self, depth, self.path)]
+        written = 0
+        while stack:
+            if max_nodes is not None and written >= max_nodes:
+                f.write("...\n")
+                return
+            xmlelt, level, path = stack.pop()
+            f.write(xmlelt.__pretty_line(level, path))
+            written += 1
+            if max_depth is not None and level - depth >= max_depth:
+                if xmlelt.children:
+                    f.write(
+                        f"{'   ' * level}∟... ({len(xmlelt.children)} children not shown)\n"
+                    )
+                continue
+            stack.extend(
+                (xmlelt.children[i], level + 1, path + [i])
+                for i in reversed(range(len(xmlelt.children)))
+            )
+
+    def __pretty_line(self, depth: int, path: list[int]) -> str:
+        """Return the line ``print_line`` writes for the element, which is at ``depth`` and ``path`` in its tree."""
         end = "\033[0m"
         underline = "\033[4m"
         output = ""
-        if not self.is_root:
-            output += "   " * self.parent.depth + "∟"
+        if depth:
+            output += "   " * (depth - 1) + "∟"
         output += underline + self.tag + end
         if self.attributes:
             output += f" ({self.attribute_string})"
         if self.__value:
             output += ": " + str(self.__value)
-        output += max((60 - len(output)), 5) * " " + str(self.path)
+        output += max((60 - len(output)), 5) * " " + str(path)
         output += "\n"
         return output
 
@@ -326,11 +1256,218 @@ class XMLElement:
 
     def remove_from_path(self, path: str):
         """Remove the XMLElement at the given ``path`` from the tree."""
-        to_remove = self.get_from_path(path)
-        if to_remove.is_root:
-            raise IndexError("cannot remove root element")
-        parent = self.get_from_path(path[:-1])
-        parent.children.remove(to_remove)
+        self.remove_paths([path])
+
+    def remove_paths(self, paths: list[list[int]]) -> list["XMLElement"]:
+        """Remove the XMLElements at each of the given ``paths`` from the tree and return them.
+
+        All paths are resolved before anything is removed, so they refer to the tree as it was when the method was called. Each affected ``children`` list is rebuilt once. Removed elements become the roots of their own trees. The empty path, which refers to the XMLElement itself, is rejected as the root is.
+
+        Arguments:
+        ``paths`` -- list containing the ``path`` of each element to remove."""
+        targets = [self.get_from_path(path) for path in paths]
+        for to_remove in targets:
+            if to_remove.is_root or to_remove is self:
+                raise IndexError("cannot remove root element")
+        target_ids = {id(to_remove) for to_remove in targets}
+        by_parent = {}
+        for to_remove in targets:
+            ancestor = to_remove.parent
+            while ancestor is not None and id(ancestor) not in target_ids:
+                ancestor = ancestor.parent
+            if ancestor is None:
+                by_parent.setdefault(id(to_remove.parent), to_remove.parent)
+        removed = []
+        for parent in by_parent.values():
+            kept = []
+            for child in parent.children:
+                (removed if id(child) in target_ids else kept).append(child)
+            parent.children[:] = kept
+        self.__detach(removed, list(by_parent.values()))
+        return removed
+
+    def remove_where(self, predicate) -> list["XMLElement"]:
+        """Remove every element below the XMLElement for which ``predicate`` returns ``True`` and return them.
+
+        The tree is traversed once, without recursion, and each affected ``children`` list is rebuilt once. The descendants of a removed element are removed with it without being tested. Removed elements become the roots of their own trees.
+
+        Arguments:
+        ``predicate`` -- a function which takes an XMLElement and returns ``True`` if it should be removed."""
+        removed = []
+        changed_parents = []
+        stack = [self]
+        while stack:
+            parent = stack.pop()
+            kept = []
+            for child in parent.children:
+                if predicate(child):
+                    removed.append(child)
+                else:
+                    kept.append(child)
+                    if child.children:
+                        stack.append(child)
+            if len(kept) != len(parent.children):
+                parent.children[:] = kept
+                changed_parents.append(parent)
+        self.__detach(removed, changed_parents)
+        return removed
+
+    def __detach(
+        self, removed: list["XMLElement"], changed_parents: list["XMLElement"]
+    ):
+        """Make each of the ``removed`` elements the root of its own tree, updating indexes and versions in bulk and dropping the XML cached for them."""
+        root = self.root
+        removed_elements = []
+        for to_remove in removed:
+            to_remove.parent = None
+            to_remove.__indexes = {}
+            stack = [to_remove]
+            while stack:
+                xmlelt = stack.pop()
+                xmlelt.root = to_remove
+                removed_elements.append(xmlelt)
+                stack.extend(xmlelt.children)
+        root.__unindex_elements(removed_elements)
+        if root.__fragment_cache:
+            for xmlelt in removed_elements:
+                root.__fragment_cache.discard(xmlelt)
+        XMLElement.__touch_all(changed_parents)
+
+    def add_index(self, key: str):
+        """Index the elements of the tree by the value of their attribute with the given ``key``.
+
+        The index is kept up to date as attributes are added and removed and as elements join and leave the tree, and is used by ``get_by_attribute``. Indexes belong to the root element.
+
+        Arguments:
+        ``key`` -- the attribute key to index."""
+        if not self.is_root:
+            raise TypeError("Cannot add index to non-root element")
+        self.__indexes[key] = AttributeIndex()
+        stack = [self]
+        while stack:
+            xmlelt = stack.pop()
+            self.__index_element(xmlelt, key)
+            stack.extend(reversed(xmlelt.children))
+
+    def remove_index(self, key: str):
+        """Stop indexing the tree by the attribute with the given ``key``.
+
+        Arguments:
+        ``key`` -- the attribute key whose index will be removed."""
+        del self.__indexes[key]
+
+    def enable_fragment_cache(self, max_size: int = fragment_cache_size):
+        """Cache the XML written for the subtrees of the tree, so that writing the tree again after a few changes only renders the changed elements and their ancestors. See ``FragmentCache``.
+
+        The cache belongs to the root element. Each element with children is cached separately for each indentation level, ``tab_size`` and ``self_closing`` setting. Its entry holds the XML of its own tags and of its children without children, and refers to the entries of its other children, so each part of the document is cached once and the cache grows with the size of the document. An element's entry is dropped when it or any of its descendants changes. Minified XML is not cached.
+
+        Arguments:
+        ``max_size`` -- the number of characters of XML which may be cached. The least recently used XML is dropped to stay within it (defaults to 64 million)."""
+        if not self.is_root:
+            raise TypeError("Cannot enable fragment cache of non-root element")
+        self.__fragment_cache = FragmentCache(max_size)
+
+    def disable_fragment_cache(self):
+        """Stop caching the XML written for the subtrees of the tree, and drop the XML already cached."""
+        self.root.__fragment_cache = None
+
+    @property
+    def fragment_cache(self) -> "FragmentCache | None":
+        """Return the tree's ``FragmentCache``, or ``None`` if fragment caching is not enabled."""
+        return self.root.__fragment_cache
+
+    @property
+    def indexes(self):
+        """Return a list of the attribute keys which the element's tree is indexed by."""
+        return list(self.root.__indexes)
+
+    def indexed_values(self, key: str) -> list:
+        """Return a list of the distinct values of the attribute ``key`` in the tree's index for ``key``.
+
+        Arguments:
+        ``key`` -- an attribute key which the tree is indexed by."""
+        return list(self.root.__indexes[key])
+
+    def indexed_nonstring_values(self, key: str) -> list:
+        """Return a list of the distinct values of the attribute ``key`` in the tree's index for ``key`` which are not strings.
+
+        Arguments:
+        ``key`` -- an attribute key which the tree is indexed by."""
+        return list(self.root.__indexes[key].nonstring_values)
+
+    def get_by_attribute(self, key: str, value: Any) -> list["XMLElement"]:
+        """Return a list of the elements at or below the XMLElement whose attribute ``key`` has the given ``value``.
+
+        Uses the tree's index for ``key`` when called on an indexed root element, and otherwise searches the tree.
+
+        Arguments:
+        ``key`` -- the attribute key to look up.
+        ``value`` -- the attribute value to look up."""
+        if self.is_root and key in self.__indexes:
+            return list(self.__indexes[key].get(value, []))
+        found = []
+        stack = [self]
+        while stack:
+            xmlelt = stack.pop()
+            if key in xmlelt.__attributes and xmlelt.__attributes[key] == value:
+                found.append(xmlelt)
+            stack.extend(reversed(xmlelt.children))
+        return found
+
+    def select(self, expr: str) -> list["XMLElement"]:
+        """Return a list of the elements selected by the XPath-style query ``expr``.
+
+        Relative queries, eg. ``book/title``, start from the XMLElement. Queries beginning with ``/`` or ``//`` start from the document. See ``compile_query`` for the supported syntax.
+
+        Arguments:
+        ``expr`` -- the query, eg. ``//book[price<30]/title``."""
+        return list(compile_query(expr).evaluate(self))
+
+    def select_one(self, expr: str) -> "XMLElement | None":
+        """Return the first element selected by the XPath-style query ``expr``, or ``None`` if no element matches.
+
+        Stops searching the tree as soon as a match is found.
+
+        Arguments:
+        ``expr`` -- the query, eg. ``//book[@id="bk101"]``."""
+        return next(compile_query(expr).evaluate(self), None)
+
+    def __index_element(self, xmlelt: "XMLElement", key: str = None):
+        """Add ``xmlelt`` to the root element's attribute indexes, or only to the index for ``key`` if given."""
+        keys = [key] if key else self.__indexes
+        for index_key in keys:
+            if index_key in xmlelt.__attributes:
+                value = xmlelt.__attributes[index_key]
+                self.__indexes[index_key].setdefault(value, []).append(xmlelt)
+
+    def __unindex_element(self, xmlelt: "XMLElement", key: str = None):
+        """Remove ``xmlelt`` from the root element's attribute indexes, or only from the index for ``key`` if given."""
+        keys = [key] if key else self.__indexes
+        for index_key in keys:
+            if index_key in xmlelt.__attributes:
+                value = xmlelt.__attributes[index_key]
+                bucket = self.__indexes[index_key][value]
+                bucket.remove(xmlelt)
+                if not bucket:
+                    del self.__indexes[index_key][value]
+
+    def __unindex_elements(self, elements: list["XMLElement"]):
+        """Remove all of the ``elements`` from the root element's attribute indexes, rebuilding each affected entry once."""
+        element_ids = {id(xmlelt) for xmlelt in elements}
+        for key, index in self.__indexes.items():
+            values = {
+                xmlelt.__attributes[key]
+                for xmlelt in elements
+                if key in xmlelt.__attributes
+            }
+            for value in values:
+                bucket = [
+                    xmlelt for xmlelt in index[value] if id(xmlelt) not in element_ids
+                ]
+                if bucket:
+                    index[value] = bucket
+                else:
+                    del index[value]
 
     def insert_entity_refs(self, string: str):
         """Return the given ``string`` with pre-defined and user-defined entities replaced with their entity references.
@@ -338,38 +1475,30 @@ class XMLElement:
         Arguments:
         ``string`` -- an arbitrary string which will have its entities replaced."""
         refs = XMLElement.predef_entities | self.root.entities
-        for ref in refs:
-            no_to_replace = string.count(ref)
-            last_index = 0
-            for _ in range(no_to_replace):
-                location = string.index(ref, last_index)
-                string = (
-                    string[:location]
-                    + "&"
-                    + refs[ref]
-                    + ";"
-                    + string[location + len(ref) :]
-                )
-                last_index = location
-        return string
+        return insert_refs(string, refs)
 
     @property
     def attribute_string(self):
-        """Return a string containing the ``attribute`` portion of the XMLElement's start tag."""
-        if not self.attributes:
+        """Return a string containing the ``attribute`` portion of the XMLElement's start tag.
+
+        The string is cached until the element's attributes or its tree's entities change."""
+        if not self.__attributes:
             return ""
-        attribute_string = " "
-        for key in self.attributes:
-            val = self.insert_entity_refs(str(self.attributes[key]))
-            attribute_string += f'{key}="{val}" '
-        attribute_string = attribute_string[:-1]
+        root = self.root
+        cache = self.__attribute_string_cache
+        if cache and cache[0] == root.__entities_stamp:
+            return cache[1]
+        attribute_string = render_attributes(
+            self.__attributes, XMLElement.predef_entities | root.__entities
+        )
+        self.__attribute_string_cache = (root.__entities_stamp, attribute_string)
         return attribute_string
 
     @property
     def dict(self):
         """Return a dictionary version of the element tree including and descending from the XMLElement."""
         self_dict = {
-            "attributes": self.attributes,
+            "attributes": self.copy_attributes(),
             "value": self.value,
             "children": [child.dict for child in self.children],
         }
@@ -381,7 +1510,502 @@ class XMLElement:
         Arguments:
         ``indent`` -- number of spaces used for each level of indentation (defaults to 2).
         ``sort_keys`` -- ``True``: json objects have their keys in alphabetical order. ``False``: json objects have keys in order attributes, value, children (defaults to ``False``)."""
-        return dumps(self.dict, indent=indent, sort_keys=sort_keys)
+        stream = StringIO()
+        self.write_json(stream, indent, sort_keys)
+        return stream.getvalue()
+
+    def write_json(
+        self,
+        f: TextIO,
+        indent: int | str = 2,
+        sort_keys: bool = False,
+        ndjson: bool = False,
+    ):
+        """Write the json string returned by ``json`` to the writable object ``f``, without building the ``dict`` of the tree.
+
+        The tree is walked once without recursion and the json is written in large blocks.
+        With ``ndjson`` set, each child of the XMLElement is written instead as a json record on its own line, in the format returned by ``json`` with ``indent=None``, for tools which process one record at a time.
+
+        Arguments:
+        ``f`` -- a writable file object.
+        ``indent`` -- number of spaces used for each level of indentation (defaults to 2). ``None`` writes the json on one line.
+        ``sort_keys`` -- ``True``: json objects have their keys in alphabetical order. ``False``: json objects have keys in order attributes, value, children (defaults to ``False``).
+        ``ndjson`` -- ``True``: write one line for each child of the XMLElement, ignoring ``indent`` (defaults to ``False``)."""
+        if ndjson:
+            records = (
+                chunk
+                for child in self.children
+                for chunk in chain(child.json_chunks(None, sort_keys), ["\n"])
+            )
+            write_buffered(f, records)
+        else:
+            write_buffered(f, self.json_chunks(indent, sort_keys))
+
+    def json_chunks(self, indent: int | str = 2, sort_keys: bool = False):
+        """Return a generator of the pieces of the json string returned by ``json``.
+
+        Arguments:
+        ``indent`` -- number of spaces used for each level of indentation, or ``None`` for no line breaks (defaults to 2).
+        ``sort_keys`` -- ``True``: json objects have their keys in alphabetical order (defaults to ``False``)."""
+        if isinstance(indent, int):
+            indent = " " * indent
+        newlines = []
+
+        def newline(level: int) -> str:
+            if indent is None:
+                return ""
+            while len(newlines) <= level:
+                newlines.append("\n" + indent * len(newlines))
+            return newlines[level]
+
+        def separator(level: int) -> str:
+            return ", " if indent is None else "," + newline(level)
+
+        def encode(value: Any, level: int) -> str:
+            encoded = dumps(value, indent=indent, sort_keys=sort_keys)
+            if indent and isinstance(value, (dict, list, tuple)):
+                encoded = encoded.replace("\n", newline(level))
+            return encoded
+
+        stack = [(self, 0)]
+        while stack:
+            xmlelt = stack.pop()
+            if isinstance(xmlelt, str):
+                yield xmlelt
+                continue
+            xmlelt, level = xmlelt
+            inner = level + 2
+            attributes = encode(dict(xmlelt.__attributes), inner)
+            fields = {
+                "attributes": f'"attributes": {attributes}',
+                "value": f'"value": {encode(xmlelt.__value, inner)}',
+            }
+            if sort_keys:
+                keys = ["attributes", "children", "value"]
+            else:
+                keys = ["attributes", "value", "children"]
+            head = f"{{{newline(level + 1)}{dumps(xmlelt.__tag)}: {{{newline(inner)}"
+            tail = f"{newline(level + 1)}}}{newline(level)}}}"
+            if not xmlelt.children:
+                fields["children"] = '"children": []'
+                yield head + separator(inner).join(fields[key] for key in keys) + tail
+                continue
+            position = keys.index("children")
+            before = [fields[key] for key in keys[:position]]
+            after = [fields[key] for key in keys[position + 1 :]]
+            yield head + "".join(field + separator(inner) for field in before)
+            yield f'"children": [{newline(inner + 1)}'
+            stack.append(
+                f"{newline(inner)}]"
+                + "".join(separator(inner) + field for field in after)
+                + tail
+            )
+            children = reversed(xmlelt.children)
+            stack.append((next(children), inner + 1))
+            for child in children:
+                stack.append(separator(inner + 1))
+                stack.append((child, inner + 1))
+
+
+def set_worker_tree(tree: XMLElement):
+    """Set the tree whose children are rendered by ``render_children`` in this worker process.
+
+    Used as the initializer of the worker processes of ``XMLElement.write``. Forked processes inherit ``tree`` without pickling it."""
+    global worker_tree
+    worker_tree = tree
+
+
+def render_children(
+    start: int,
+    stop: int,
+    tab_size: int,
+    self_closing: bool,
+    minify: bool,
+    depth: int,
+) -> str:
+    """Return the XML of the children ``start`` to ``stop`` of ``worker_tree``, as written by ``write_xml_body``.
+
+    Used by the worker processes of ``XMLElement.write``, which are given the tree by ``set_worker_tree``."""
+    fragments = []
+    for child in worker_tree.children[start:stop]:
+        if minify:
+            fragments += child.minified_chunks(self_closing)
+        else:
+            fragments += child.xml_chunks(tab_size, self_closing, depth)
+    return "".join(fragments)
+
+
+def render_subtrees(
+    subtrees: list[list[tuple]],
+    entities: dict,
+    tab_size: int,
+    self_closing: bool,
+    minify: bool,
+    depth: int,
+) -> str:
+    """Return the XML of each of the ``subtrees``, given as ``build`` specifications, as written by ``write_xml_body`` for non-root elements at ``depth``.
+
+    The XML is rendered straight from the specifications, without building XMLElement objects. Used by the worker processes of ``XMLElement.write``."""
+    refs = XMLElement.predef_entities | entities
+    line_end = "" if minify else "\n"
+    indents = []
+    fragments = []
+    for specs in subtrees:
+        open_tags = []
+        for position, (level, tag, attributes, value) in enumerate(specs):
+            while open_tags and open_tags[-1][0] >= level:
+                open_level, open_tag = open_tags.pop()
+                fragments.append(f"{indents[open_level]}</{open_tag}>{line_end}")
+            while len(indents) <= level:
+                indents.append(
+                    "" if minify else " " * (len(indents) + depth) * tab_size
+                )
+            offset = indents[level]
+            attribute_string = render_attributes(attributes or {}, refs)
+            if position + 1 < len(specs) and specs[position + 1][0] > level:
+                fragments.append(f"{offset}<{tag}{attribute_string}>{line_end}")
+                open_tags.append((level, tag))
+            elif self_closing and not value:
+                fragments.append(f"{offset}<{tag}{attribute_string}/>{line_end}")
+            else:
+                value = insert_refs("" if value is None else str(value), refs)
+                fragments.append(
+                    f"{offset}<{tag}{attribute_string}>{value}</{tag}>{line_end}"
+                )
+        for open_level, open_tag in reversed(open_tags):
+            fragments.append(f"{indents[open_level]}</{open_tag}>{line_end}")
+    return "".join(fragments)
+
+
+def write_buffered(f: TextIO, chunks):
+    """Write the strings generated by ``chunks`` to the writable object ``f``, joined into large blocks."""
+    buffer = []
+    buffered = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= write_buffer_size:
+            f.write("".join(buffer))
+            buffer = []
+            buffered = 0
+    f.write("".join(buffer))
+
+
+class AttributeIndex(dict):
+    """An index of the elements of a tree by the value of one attribute, created by ``XMLElement.add_index``.
+
+    Maps each value to the list of elements with it. The values which are not strings are also kept in ``nonstring_values``, so that lookups which compare values as text find them without scanning the index."""
+
+    def __init__(self):
+        super().__init__()
+        self.nonstring_values = {}
+
+    def setdefault(self, value: Any, default: list) -> list:
+        if not isinstance(value, str) and value not in self:
+            self.nonstring_values[value] = None
+        return super().setdefault(value, default)
+
+    def __delitem__(self, value: Any):
+        super().__delitem__(value)
+        self.nonstring_values.pop(value, None)
+
+
+class FragmentCache:
+    """A least-recently-used cache of the XML written for the elements of a tree, created by ``XMLElement.enable_fragment_cache``.
+
+    Each entry holds the pieces of XML of an element's own tags and of its children without children, and the element's other children in their place. Entries are kept with the ``version`` of their element, and an entry whose element has changed since is not used.
+    ``size`` is the number of characters cached, which is kept within ``max_size``. ``hits`` and ``misses`` count the elements found and not found in the cache."""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.fragments = OrderedDict()
+        self.keys = {}
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def get(self, xmlelt: XMLElement, key: tuple) -> list | None:
+        """Return the pieces of XML and children cached for ``xmlelt`` with the settings ``key``, or ``None``."""
+        entry = self.fragments.get((xmlelt, key))
+        if entry is None or entry[0] != xmlelt.version:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.fragments.move_to_end((xmlelt, key))
+        return entry[1]
+
+    def add(self, xmlelt: XMLElement, key: tuple, parts: list):
+        """Cache the pieces of XML and children ``parts`` for ``xmlelt`` with the settings ``key``, dropping the least recently used entries if the cache is full."""
+        parts = join_parts(parts)
+        size = sum(len(part) for part in parts if isinstance(part, str))
+        if size > self.max_size:
+            return
+        if (xmlelt, key) in self.fragments:
+            self.size -= self.fragments.pop((xmlelt, key))[2]
+        else:
+            self.keys.setdefault(xmlelt, []).append(key)
+        self.fragments[(xmlelt, key)] = (xmlelt.version, parts, size)
+        self.size += size
+        while self.size > self.max_size:
+            (oldest, oldest_key), entry = self.fragments.popitem(last=False)
+            self.size -= entry[2]
+            self.keys[oldest].remove(oldest_key)
+            if not self.keys[oldest]:
+                del self.keys[oldest]
+
+    def discard(self, xmlelt: XMLElement):
+        """Drop all of the XML cached for ``xmlelt``."""
+        for key in self.keys.pop(xmlelt, []):
+            self.size -= self.fragments.pop((xmlelt, key))[2]
+
+
+def join_parts(parts: list) -> list:
+    """Return ``parts`` with each run of neighbouring strings joined into one string."""
+    joined = []
+    for is_string, run in groupby(parts, key=lambda part: isinstance(part, str)):
+        if is_string:
+            joined.append("".join(run))
+        else:
+            joined += run
+    return joined
+
+
+class JSONTokenReader:
+    """Read the tokens and values of a JSON document from a string, or from a text file in blocks of ``read_buffer_size`` characters, as used by ``XMLElement.from_json``.
+
+    Only the part of the file which has not been read yet is kept, so a document of any size is read in memory proportional to its largest value."""
+
+    def __init__(self, text: str, f: TextIO = None):
+        self.text = text
+        self.f = f
+        self.index = 0
+        self.offset = 0
+        self.decoder = JSONDecoder()
+
+    @property
+    def position(self) -> int:
+        """Return the position in the document of the next character to be read."""
+        return self.offset + self.index
+
+    def read_more(self) -> bool:
+        """Add the next block of the file to the unread text, and return ``False`` if the file has been read to the end."""
+        if self.f is None:
+            return False
+        unread = self.text[self.index :]
+        block = self.f.read(max(read_buffer_size, len(unread)))
+        if not block:
+            self.f = None
+            return False
+        self.offset += self.index
+        self.text = unread + block
+        self.index = 0
+        return True
+
+    def next_token(self) -> str:
+        """Skip whitespace and return the next character, or "" at the end of the document."""
+        while True:
+            self.index = json_whitespace.match(self.text, self.index).end()
+            if self.index < len(self.text) or not self.read_more():
+                return self.text[self.index : self.index + 1]
+
+    def read_token(self, token: str):
+        """Skip whitespace and read the single character ``token``, raising a ValueError if the next character is not ``token``."""
+        if self.next_token() != token:
+            raise ValueError(f"Expected '{token}' at position {self.position}")
+        self.index += 1
+
+    def read_value(self) -> Any:
+        """Skip whitespace and decode the next whole JSON value, reading more of the file until the value is complete.
+
+        A value is complete when it is followed by whitespace or punctuation, so that a number split between blocks is not read in part."""
+        self.next_token()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.text, self.index)
+            except JSONDecodeError:
+                if self.read_more():
+                    continue
+                raise
+            if (end < len(self.text) and self.text[end] in json_value_ends) or (
+                not self.read_more()
+            ):
+                self.index = end
+                return value
+
+
+class EncodedStream:
+    """A text stream which encodes everything written to it and writes it to the binary stream ``stream``."""
+
+    def __init__(self, stream: BinaryIO, encoding: str):
+        self.stream = stream
+        self.encoder = getincrementalencoder(encoding)()
+
+    def write(self, string: str):
+        self.stream.write(self.encoder.encode(string))
+
+
+def reject_mutation(self, *args, **kwargs):
+    raise TypeError("Cannot modify a frozen XMLElement")
+
+
+class FrozenXMLElement(XMLElement):
+    """An immutable copy of an XMLElement tree, created by ``XMLElement.freeze``.
+
+    Every method which would change the tree raises a TypeError. ``children`` is a tuple and ``attributes`` and ``entities`` are read-only.
+    ``path``, ``depth``, ``size``, ``attribute_string`` and the root element's default XML serialization are worked out once when the tree is frozen, and nothing is computed lazily afterwards, so a frozen tree can be read from many threads without locks.
+    Frozen elements are hashable and compare equal when their tags, attributes, values and descendants are equal. Use ``thaw`` to get a mutable copy."""
+
+    tag = property(XMLElement.tag.fget, reject_mutation)
+    value = property(XMLElement.value.fget, reject_mutation)
+    validation = property(XMLElement.validation.fget, reject_mutation)
+    add_attribute = remove_attribute = add_entity = remove_entity = reject_mutation
+    add_child = make_child = add_sibling = make_sibling = reject_mutation
+    insert_child = extend_children = move = reject_mutation
+    remove_from_path = remove_paths = remove_where = reject_mutation
+    add_index = remove_index = reject_mutation
+    enable_fragment_cache = disable_fragment_cache = reject_mutation
+    __setattr__ = __delattr__ = reject_mutation
+
+    @classmethod
+    def from_element(cls, xmlelt: XMLElement) -> "FrozenXMLElement":
+        """Return a frozen copy of the tree including and descending from ``xmlelt``, built without recursion."""
+        if isinstance(xmlelt, FrozenXMLElement):
+            return xmlelt
+        root = cls.__new__(cls)
+        refs = XMLElement.predef_entities | xmlelt.root.entities
+        no_entities = MappingProxyType({})
+        stamp = next(mutation_counter)
+        order = []
+        stack = [(xmlelt, root, None, ())]
+        while stack:
+            original, frozen, parent, path = stack.pop()
+            vars(frozen).update(
+                {
+                    "_XMLElement__tag": original.tag,
+                    "_XMLElement__attributes": MappingProxyType(
+                        original.copy_attributes()
+                    ),
+                    "_XMLElement__value": original.value,
+                    "_XMLElement__entities": (
+                        no_entities
+                        if parent
+                        else MappingProxyType(original.root.copy_entities())
+                    ),
+                    "_XMLElement__indexes": no_entities,
+                    "_XMLElement__version": stamp,
+                    "children": [],
+                    "parent": parent,
+                    "root": root,
+                    "encoding": original.encoding,
+                    "xml_version": original.xml_version,
+                    "_FrozenXMLElement__path": path,
+                }
+            )
+            vars(frozen)["_FrozenXMLElement__attribute_string"] = render_attributes(
+                frozen.attributes, refs
+            )
+            if parent:
+                parent.children.append(frozen)
+            order.append(frozen)
+            for position in range(len(original.children) - 1, -1, -1):
+                child = cls.__new__(cls)
+                stack.append(
+                    (original.children[position], child, frozen, path + (position,))
+                )
+        for frozen in reversed(order):
+            children = tuple(frozen.children)
+            vars(frozen).update(
+                {
+                    "children": children,
+                    "_FrozenXMLElement__size": 1
+                    + sum(child.__size for child in children),
+                    "_XMLElement__content_hash": hash_content(
+                        frozen.tag,
+                        frozen.attributes,
+                        frozen.value,
+                        [child.content_hash for child in children],
+                    ),
+                    "_FrozenXMLElement__hash": hash(
+                        (
+                            frozen.tag,
+                            tuple(frozen.attributes.items()),
+                            frozen.value,
+                            tuple(child.__hash for child in children),
+                        )
+                    ),
+                }
+            )
+        body = StringIO()
+        XMLElement.write_xml_body(root, body, 2, True)
+        vars(root)["_FrozenXMLElement__default_body"] = body.getvalue()
+        return root
+
+    @property
+    def path(self) -> list[int]:
+        return list(self.__path)
+
+    @property
+    def depth(self) -> int:
+        return len(self.__path)
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    @property
+    def attribute_string(self) -> str:
+        return self.__attribute_string
+
+    def write_xml_body(
+        self, f: TextIO, tab_size: int, self_closing: bool, minify: bool = False
+    ):
+        if self.is_root and tab_size == 2 and self_closing and not minify:
+            f.write(self.__default_body)
+        else:
+            super().write_xml_body(f, tab_size, self_closing, minify)
+
+    def __hash__(self):
+        return self.__hash
+
+    def __eq__(self, other):
+        if not isinstance(other, FrozenXMLElement):
+            return NotImplemented
+        pairs = [(self, other)]
+        while pairs:
+            first, second = pairs.pop()
+            if first is second:
+                continue
+            if (
+                first.__hash != second.__hash
+                or first.tag != second.tag
+                or first.attributes != second.attributes
+                or first.value != second.value
+                or len(first.children) != len(second.children)
+            ):
+                return False
+            pairs.extend(zip(first.children, second.children))
+        return True
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo: dict):
+        return self
+
+    def freeze(self) -> "FrozenXMLElement":
+        return self
+
+    def dispose(self):
+        if not self.is_root:
+            raise TypeError("Cannot dispose of non-root element")
+        stack = [self]
+        while stack:
+            frozen = stack.pop()
+            stack.extend(frozen.children)
+            vars(frozen).update(children=(), parent=None, root=None)
 
 
 def is_valid_name(
@@ -397,7 +2021,7 @@ def is_valid_name(
     Arguments:
     ``new_name_candidate`` -- the name candidate which will be checked for validity.
     ``name_type`` -- tag name or attribute key. Used for formatting error messages."""
-    for ref in list(XMLElement.predef_entities) + [" "]:
+    for ref in banned_name_chars:
         try:
             assert ref not in new_name_candidate
         except:
@@ -414,3 +2038,109 @@ def is_valid_name(
         assert new_name_candidate[0:3].lower() != "xml"
     except:
         raise ValueError(f'{name_type.capitalize()} may not begin with "xml"')
+
+
+banned_name_chars = list(XMLElement.predef_entities) + [" "]
+
+
+def check_name(
+    new_name_candidate: str,
+    name_type: Literal["tag name", "attribute key"],
+    policy: Literal["strict", "cached", "trusted"] = "strict",
+):
+    """Raise a ValueError if the candidate name is not a valid attribute key or tag name, following the validation ``policy``.
+
+    See ``XMLElement.validation`` for the policies. The error messages are those of ``is_valid_name`` for every policy.
+
+    Arguments:
+    ``new_name_candidate`` -- the name candidate which will be checked for validity.
+    ``name_type`` -- tag name or attribute key. Used for formatting error messages.
+    ``policy`` -- strict, cached or trusted (defaults to strict)."""
+    if policy == "trusted":
+        return
+    if policy != "cached":
+        is_valid_name(new_name_candidate, name_type)
+        return
+    if new_name_candidate in valid_name_cache:
+        return
+    if not (
+        isinstance(new_name_candidate, str)
+        and valid_name_pattern.match(new_name_candidate)
+    ):
+        is_valid_name(new_name_candidate, name_type)
+    if len(valid_name_cache) >= valid_name_cache_size:
+        valid_name_cache.clear()
+    valid_name_cache.add(new_name_candidate)
+
+
+def text_form(value: Any) -> str:
+    """Return ``value`` as it appears in an XML document, where ``None`` appears as an empty string."""
+    return "" if value is None else str(value)
+
+
+def attribute_text_form(attributes: dict) -> dict:
+    """Return a copy of ``attributes`` with each value as it appears in an XML document."""
+    return {key: str(attributes[key]) for key in attributes}
+
+
+def hash_content(
+    tag: str, attributes: dict, value: Any, child_hashes: list[str]
+) -> str:
+    """Return the content hash of an element from its own content and its children's content hashes. See ``XMLElement.content_hash``."""
+    content = (
+        tag,
+        sorted(attribute_text_form(attributes).items()),
+        text_form(value),
+        child_hashes,
+    )
+    return blake2b(repr(content).encode(), digest_size=16).hexdigest()
+
+
+def xml_prolog(xml_version: str, encoding: str, root_tag: str, entities: dict) -> str:
+    """Return the XML declaration of a document and, if there are user-defined ``entities``, its DOCTYPE declaring them.
+
+    Arguments:
+    ``xml_version`` -- the XML version of the document.
+    ``encoding`` -- the encoding of the document.
+    ``root_tag`` -- the tag of the document's root element.
+    ``entities`` -- a dictionary containing human-readable values as keys and entity names as values."""
+    prolog = f'<?xml version="{xml_version}" encoding="{encoding}"?>\n'
+    if entities:
+        prolog += f"<!DOCTYPE {root_tag} [\n"
+        for entity in entities:
+            prolog += f'<!ENTITY {entities[entity]} "{entity}">\n'
+        prolog += "]>\n"
+    return prolog
+
+
+def render_attributes(attributes: dict, refs: dict) -> str:
+    """Return the ``attribute`` portion of a start tag for the given ``attributes``, with entity references from ``refs`` inserted into the values.
+
+    Arguments:
+    ``attributes`` -- the attributes of an element.
+    ``refs`` -- a dictionary containing human-readable values as keys and entity names as values, eg. {"&": "amp"}."""
+    return "".join(
+        f' {key}="{insert_refs(str(attributes[key]), refs)}"' for key in attributes
+    )
+
+
+def insert_refs(string: str, refs: dict) -> str:
+    """Return the given ``string`` with each of the keys of ``refs`` replaced by an entity reference to its value.
+
+    Arguments:
+    ``string`` -- an arbitrary string which will have its entities replaced.
+    ``refs`` -- a dictionary containing human-readable values as keys and entity names as values, eg. {"&": "amp"}."""
+    for ref in refs:
+        no_to_replace = string.count(ref)
+        last_index = 0
+        for _ in range(no_to_replace):
+            location = string.index(ref, last_index)
+            string = (
+                string[:location]
+                + "&"
+                + refs[ref]
+                + ";"
+                + string[location + len(ref) :]
+            )
+            last_index = location
+    return string
@@ -1,8 +1,14 @@
-from src.xml_element import XMLElement
+from src.xml_element import XMLElement, check_name, validation_policies
+from src.xml_store import XMLStore
+from itertools import chain
 from re import compile
 
+tag_token_pattern = compile(r"<[^<>]*>|[^<>]+")
 
-def get_element_from_line(line: str, entities: dict = {}) -> XMLElement | None:
+
+def get_element_from_line(
+    line: str, entities: dict = {}, validation: str = None
+) -> XMLElement | None:
     """Create an XMLElement object from a line of an XML file.
 
     Extract the ``tag_name``, ``attributes`` and ``value`` of the XML element contained in line, if line contains a start tag. If line contains only a stop tag, return ``None``.
@@ -10,6 +16,26 @@ def get_element_from_line(line: str, entities: dict = {}) -> XMLElement | None:
     Arguments:
     ``line`` -- an arbitrary string containing XML syntax.
     ``entities`` -- a dictionary containing user-defined entity references which will be replaced when building the XMLElement.
+    ``validation`` -- the policy used to validate the names read from ``line``. See ``XMLElement.validation``. The new XMLElement has the default "strict" policy.
+    """
+    parsed = parse_line(line, entities)
+    if parsed:
+        xmlelt = XMLElement(*parsed, validation=validation)
+        if validation not in (None, "strict"):
+            xmlelt.validation = "strict"
+        return xmlelt
+
+
+def parse_line(
+    line: str, entities: dict = {}
+) -> tuple[str, dict | None, str | None] | None:
+    """Return the ``tag_name``, ``attributes`` and ``value`` of the XML element contained in a line of an XML file.
+
+    The value is ``None`` if the line contains only a start tag and ``""`` if it contains a self-closing tag. If line contains only a stop tag, return ``None``.
+
+    Arguments:
+    ``line`` -- an arbitrary string containing XML syntax.
+    ``entities`` -- a dictionary containing user-defined entity references which will be replaced in attribute values.
     """
     non_marker_chars = '[^</>=" ]*'
     value_chars = '[^</>="]*'
@@ -37,14 +63,14 @@ def get_element_from_line(line: str, entities: dict = {}) -> XMLElement | None:
         attributes = None
 
     if compile(start_pattern).match(line):
-        return XMLElement(tag_name, attributes)
+        return tag_name, attributes, None
 
     if compile(self_closing_pattern).match(line):
-        return XMLElement(tag_name, attributes, value="")
+        return tag_name, attributes, ""
 
     value = compile(generic_pattern).match(line).group("value")
     value = remove_refs(value)
-    return XMLElement(tag_name, attributes, value=value)
+    return tag_name, attributes, value
 
 
 def remove_refs(line: str, def_refs: dict = {}) -> str:
@@ -166,28 +192,113 @@ def generate_noncomment_lines(filepath: str):
             line = f.readline()
 
 
-def load_xml_from_file(filepath: str):
+def generate_element_lines(lines):
+    """Return a generator which supplies the tags in ``lines`` one per line, as written by ``XMLElement.to_xml``.
+
+    Each start tag, stop tag and self-closing tag is supplied separately, except that a start tag followed directly by a value and its stop tag is supplied as one line. This allows files with several elements on a line, such as minified files, to be read. A start tag and stop tag on different lines with only whitespace between them are supplied separately, as that whitespace is indentation rather than a value. A value written over several lines keeps a line break between the text of each line.
+
+    Arguments:
+    ``lines`` -- an iterable of lines of an XML file, after its prolog"""
+    held = []
+    held_over_lines = False
+    held_text = False
+    line_break = False
+    for line in lines:
+        for token in tag_token_pattern.findall(line):
+            if token[0] != "<":
+                if held:
+                    if line_break:
+                        held.append("\n")
+                        line_break = False
+                    held.append(token)
+                    held_text = held_text or not token.isspace()
+                elif not token.isspace():
+                    yield token
+            elif token[1] == "/":
+                if held:
+                    if held_over_lines and not held_text:
+                        yield held[0]
+                        yield token
+                    else:
+                        held.append(token)
+                        yield "".join(held)
+                    held = []
+                else:
+                    yield token
+            else:
+                if held:
+                    yield held[0] if "".join(held[1:]).isspace() else "".join(held)
+                    held = []
+                if token[-2] == "/":
+                    yield token
+                else:
+                    held = [token]
+                    held_over_lines = False
+                    held_text = False
+                line_break = False
+        held_over_lines = bool(held)
+        line_break = bool(held) and held_text
+    if held:
+        yield "".join(held)
+
+
+def load_xml_from_file(filepath: str, validation: str = None):
     """Return an XMLElement object containing information described in the XML file at the filepath given.
 
     Handle exceptions raised by badly formed XML files or files not containing XML content.
     Arguments:
     ``filepath`` -- location of the XML file being read
+    ``validation`` -- the policy used to validate names read from the file, eg. "trusted" to skip validating them. See ``XMLElement.validation``. The loaded tree has the default "strict" policy, so names added to it later are checked in full.
     """
+    check_validation(validation)
     try:
-        return load_from(filepath)
+        return load_from(filepath, validation)
     except ValueError:
         raise TypeError(f"No parsable XML tree found at {filepath}.")
     except AttributeError:
         raise TypeError(f"No parsable XML tree found at {filepath}.")
 
 
-def load_from(filepath: str):
+def check_validation(validation: str | None):
+    """Raise a ValueError if ``validation`` is not ``None`` or one of the policies described in ``XMLElement.validation``."""
+    if validation is not None and validation not in validation_policies:
+        raise ValueError(f"Validation must be one of {', '.join(validation_policies)}")
+
+
+def load_from(filepath: str, validation: str = None):
     """Return an XMLElement object containing information described in the XML file at the filepath given.
 
     Arguments:
-    ``filepath`` -- location of the XML file being read"""
+    ``filepath`` -- location of the XML file being read
+    ``validation`` -- the policy used to validate names read from the file. See ``XMLElement.validation``. The loaded tree has the default "strict" policy."""
 
     f = generate_noncomment_lines(filepath)
+    metadata, entities, line = read_prolog(f)
+    lines = generate_element_lines(chain([line], f))
+
+    root_element = get_element_from_line(next(lines), entities, validation)
+    root_element.xml_version = metadata["xml version"]
+    root_element.encoding = metadata["encoding"]
+    current_parent = root_element
+    root_element.add_entity(entities)
+    for line in lines:
+        element = get_element_from_line(line, entities, validation)
+        if element:
+            current_parent.add_child(element)
+            if element.value is None:
+                current_parent = element
+        else:
+            current_parent = current_parent.parent
+    return root_element
+
+
+def read_prolog(f) -> tuple[dict, dict, str]:
+    """Read the XML declaration and any DOCTYPE from the generator ``f``.
+
+    Return the metadata, the user-defined entity references and the line containing the root element's start tag.
+
+    Arguments:
+    ``f`` -- a generator of non-comment lines, as returned by ``generate_noncomment_lines``"""
     metadata = extract_metadata(next(f))
 
     line = next(f)
@@ -199,18 +310,49 @@ def load_from(filepath: str):
             doc_info += next(f)
         entities = extract_entities(doc_info)
         line = next(f)
+    return metadata, entities, line
 
-    root_element = get_element_from_line(line.strip(), entities)
-    root_element.xml_version = metadata["xml version"]
-    root_element.encoding = metadata["encoding"]
-    current_parent = root_element
-    root_element.add_entity(entities)
-    for line in f:
-        element = get_element_from_line(line.strip(), entities)
-        if element:
-            current_parent.add_child(element)
-            if element.value is None:
+
+def load_store_from_file(filepath: str, validation: str = None):
+    """Return an XMLStore containing information described in the XML file at the filepath given.
+
+    The store is filled directly from the file, without creating XMLElement objects.
+    Handle exceptions raised by badly formed XML files or files not containing XML content.
+    Arguments:
+    ``filepath`` -- location of the XML file being read
+    ``validation`` -- the policy used to validate names read from the file. See ``XMLElement.validation``.
+    """
+    check_validation(validation)
+    try:
+        return load_store_from(filepath, validation)
+    except ValueError:
+        raise TypeError(f"No parsable XML tree found at {filepath}.")
+    except AttributeError:
+        raise TypeError(f"No parsable XML tree found at {filepath}.")
+
+
+def load_store_from(filepath: str, validation: str = None):
+    """Return an XMLStore containing information described in the XML file at the filepath given.
+
+    Arguments:
+    ``filepath`` -- location of the XML file being read
+    ``validation`` -- the policy used to validate names read from the file. See ``XMLElement.validation``."""
+    f = generate_noncomment_lines(filepath)
+    metadata, entities, first_line = read_prolog(f)
+
+    store = XMLStore(metadata["encoding"], metadata["xml version"])
+    store.entities = entities
+    current_parent = -1
+    for line in generate_element_lines(chain([first_line], f)):
+        parsed = parse_line(line, entities)
+        if parsed:
+            tag_name, attributes, value = parsed
+            check_name(tag_name, "tag name", validation)
+            for key in attributes or {}:
+                check_name(key, "attribute key", validation)
+            element = store.add_element(current_parent, tag_name, attributes, value)
+            if value is None:
                 current_parent = element
         else:
-            current_parent = current_parent.parent
-    return root_element
+            current_parent = store.parent[current_parent]
+    return store
@@ -0,0 +1,296 @@
+from functools import lru_cache
+from itertools import islice
+from re import compile
+
+name_pattern = compile(r"\*|[^\s\[\]/=!<>@'\"]+")
+comparison_pattern = compile(
+    r"^(?P<operand>@?[^\s\[\]/=!<>@'\"]+|\.)\s*(?P<op>!=|<=|>=|=|<|>)\s*(?P<literal>.+)$"
+)
+existence_pattern = compile(r"^(?P<operand>@?[^\s\[\]/=!<>@'\"]+)$")
+comparisons = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+class Predicate:
+    """A condition inside the square brackets of a query step.
+
+    ``kind`` is one of
+        - "position": ``[2]``, the candidate's 1-based position among the step's matches for one parent
+        - "exists": ``[@id]`` or ``[price]``, the attribute or child element exists
+        - "compare": ``[@id="bk101"]``, ``[price<30]`` or ``[.="Fantasy"]``, the attribute, child or own value compares true against a literal
+    """
+
+    def __init__(self, kind: str, operand: str = None, op: str = None, literal=None):
+        self.kind = kind
+        self.operand = operand
+        self.op = op
+        self.literal = literal
+
+    @property
+    def index_key(self):
+        """Return the attribute key if the predicate is an attribute equality test, else ``None``."""
+        if self.kind == "compare" and self.op == "=" and self.operand[0] == "@":
+            return self.operand[1:]
+
+    def test(self, xmlelt) -> bool:
+        """Return ``True`` if the XMLElement ``xmlelt`` satisfies the predicate."""
+        if self.kind == "exists":
+            if self.operand[0] == "@":
+                return self.operand[1:] in xmlelt.attributes
+            return any(child.tag == self.operand for child in xmlelt.children)
+        return any(self.compare(value) for value in self.operand_values(xmlelt))
+
+    def operand_values(self, xmlelt):
+        """Yield the values in ``xmlelt`` which the predicate's operand refers to."""
+        if self.operand == ".":
+            yield xmlelt.value
+        elif self.operand[0] == "@":
+            attributes = xmlelt.attributes
+            if self.operand[1:] in attributes:
+                yield attributes[self.operand[1:]]
+        else:
+            for child in xmlelt.children:
+                if child.tag == self.operand:
+                    yield child.value
+
+    def compare(self, value) -> bool:
+        """Return ``True`` if ``value`` compares true against the predicate's literal."""
+        if value is None:
+            return False
+        if isinstance(self.literal, str):
+            if self.op in ("=", "!="):
+                return comparisons[self.op](str(value), self.literal)
+            return False
+        try:
+            return comparisons[self.op](float(value), self.literal)
+        except ValueError:
+            return False
+
+
+class QueryStep:
+    """One location step of a query, eg. ``//book[@id="bk101"]``.
+
+    ``axis`` is "child" for steps following ``/`` and "descendant" for steps following ``//``."""
+
+    def __init__(self, axis: str, tag: str, predicates: list[Predicate]):
+        self.axis = axis
+        self.tag = tag
+        self.predicates = predicates
+        self.positional = any(pred.kind == "position" for pred in predicates)
+
+    def matches_tag(self, xmlelt) -> bool:
+        return self.tag == "*" or xmlelt.tag == self.tag
+
+    def filter(self, candidates):
+        """Apply the step's tag test and predicates, in order, to the iterable ``candidates``."""
+        candidates = (xmlelt for xmlelt in candidates if self.matches_tag(xmlelt))
+        for pred in self.predicates:
+            if pred.kind == "position":
+                candidates = islice(candidates, pred.literal - 1, pred.literal)
+            else:
+                candidates = filter(pred.test, candidates)
+        return candidates
+
+
+class Query:
+    """A compiled query plan. Use ``compile_query`` to create one."""
+
+    def __init__(self, expr: str, absolute: bool, steps: list[QueryStep]):
+        self.expr = expr
+        self.absolute = absolute
+        self.steps = steps
+
+    def evaluate(self, context):
+        """Return a generator of the elements selected by the query, evaluated from the XMLElement ``context``.
+
+        Elements are generated lazily so that callers needing only the first match stop early."""
+        root = context.root
+        nodes = iter([None] if self.absolute else [context])
+        for step in self.steps:
+            nodes = self.apply_step(step, nodes, root)
+        return nodes
+
+    def apply_step(self, step: QueryStep, nodes, root):
+        """Yield each element matched by ``step`` from any of ``nodes``, once each.
+
+        ``None`` in ``nodes`` stands for the document containing ``root``."""
+        seen = set()
+        for node in nodes:
+            for xmlelt in self.step_matches(step, node, root):
+                if id(xmlelt) not in seen:
+                    seen.add(id(xmlelt))
+                    yield xmlelt
+
+    def step_matches(self, step: QueryStep, node, root):
+        if step.axis == "child":
+            return step.filter(children_of(node, root))
+        if node is None or node is root:
+            indexed = self.indexed_candidates(step, root)
+            if indexed is not None:
+                if node is root:
+                    indexed = [xmlelt for xmlelt in indexed if xmlelt is not root]
+                return step.filter(indexed)
+        if not step.positional:
+            return step.filter(islice(descendants_or_self(node, root), 1, None))
+        return (
+            xmlelt
+            for parent in descendants_or_self(node, root)
+            for xmlelt in step.filter(children_of(parent, root))
+        )
+
+    def indexed_candidates(self, step: QueryStep, root) -> list | None:
+        """Return the candidates for a descendant ``step`` from the root element's attribute indexes, in document order.
+
+        A string literal is looked up directly, along with each value in the index which is not a string, since those may have the same text. A number is compared against each distinct value in the index, as the same number may be written in many ways. Values which are not strings share an index entry with the values equal to them, eg. 30 and 30.0, so their elements are all kept and left to the step's filter. The step therefore selects the same elements as it would without an index. Return ``None`` if the step cannot be answered from an index."""
+        if step.positional:
+            return None
+        indexes = root.indexes
+        for pred in step.predicates:
+            key = pred.index_key
+            if key in indexes:
+                if isinstance(pred.literal, str):
+                    values = [pred.literal] + root.indexed_nonstring_values(key)
+                else:
+                    values = [
+                        value
+                        for value in root.indexed_values(key)
+                        if not isinstance(value, str) or pred.compare(value)
+                    ]
+                candidates = []
+                for value in values:
+                    candidates += root.get_by_attribute(key, value)
+                if len(candidates) > 1:
+                    candidates = document_order(candidates, root)
+                return candidates
+
+
+def children_of(node, root) -> list:
+    """Return the children of ``node``, where ``None`` stands for the document containing ``root``."""
+    if node is None:
+        return [root]
+    return node.children
+
+
+def descendants_or_self(node, root):
+    """Yield ``node`` and the elements below it in document order, without recursion.
+
+    ``None`` stands for the document containing ``root``."""
+    yield node
+    stack = list(reversed(children_of(node, root)))
+    while stack:
+        xmlelt = stack.pop()
+        yield xmlelt
+        stack.extend(reversed(xmlelt.children))
+
+
+def document_order(elements: list, root) -> list:
+    """Return ``elements``, which are in the tree of ``root``, in document order.
+
+    Only the elements and their ancestors are visited, so the time taken follows the number of elements and their depth rather than the size of the tree, apart from scanning the children of each ancestor."""
+    wanted = {id(xmlelt) for xmlelt in elements}
+    on_path = set()
+    for xmlelt in elements:
+        while xmlelt is not None and id(xmlelt) not in on_path:
+            on_path.add(id(xmlelt))
+            xmlelt = xmlelt.parent
+    ordered = []
+    stack = [root]
+    while stack:
+        xmlelt = stack.pop()
+        if id(xmlelt) in wanted:
+            ordered.append(xmlelt)
+        stack.extend(
+            child for child in reversed(xmlelt.children) if id(child) in on_path
+        )
+    return ordered
+
+
+def parse_literal(literal: str, expr: str):
+    """Return the string or number which the query ``literal`` describes."""
+    literal = literal.strip()
+    if len(literal) > 1 and literal[0] == literal[-1] and literal[0] in "'\"":
+        return literal[1:-1]
+    try:
+        return float(literal)
+    except ValueError:
+        raise ValueError(f"Invalid literal {literal} in query {expr}")
+
+
+def parse_predicate(text: str, expr: str) -> Predicate:
+    """Return the Predicate described by the contents of a pair of square brackets."""
+    text = text.strip()
+    if text.isdigit():
+        if int(text) < 1:
+            raise ValueError(f"Positions start at 1 in query {expr}")
+        return Predicate("position", literal=int(text))
+    comparison = comparison_pattern.match(text)
+    if comparison:
+        literal = parse_literal(comparison.group("literal"), expr)
+        return Predicate(
+            "compare", comparison.group("operand"), comparison.group("op"), literal
+        )
+    existence = existence_pattern.match(text)
+    if existence:
+        return Predicate("exists", existence.group("operand"))
+    raise ValueError(f"Invalid predicate [{text}] in query {expr}")
+
+
+def find_predicate_end(expr: str, start: int) -> int:
+    """Return the index of the "]" closing the predicate which opens at ``start``, skipping quoted strings."""
+    quote = None
+    for i in range(start + 1, len(expr)):
+        char = expr[i]
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in "'\"":
+            quote = char
+        elif char == "]":
+            return i
+    raise ValueError(f"Unclosed predicate in query {expr}")
+
+
+@lru_cache(maxsize=256)
+def compile_query(expr: str) -> Query:
+    """Return the Query plan for ``expr``. Plans are cached, so each distinct expression is parsed once.
+
+    Supported syntax
+        - ``/`` child steps and ``//`` descendant steps. A leading ``/`` or ``//`` starts from the document, otherwise from the element queried.
+        - element names and ``*``
+        - predicates: positions ``[1]``, existence ``[@id]`` ``[price]``, comparisons ``[@id="bk101"]`` ``[price<30]`` ``[.!="web"]``
+
+    Arguments:
+    ``expr`` -- the query expression, eg. ``//book[price<30]/title``."""
+    if not expr or not expr.strip():
+        raise ValueError("Query must not be empty")
+    pos = 0
+    absolute = expr.startswith("/")
+    axis = "child"
+    steps = []
+    while True:
+        if expr.startswith("//", pos):
+            axis = "descendant"
+            pos += 2
+        elif expr.startswith("/", pos):
+            pos += 1
+        name = name_pattern.match(expr, pos)
+        if not name:
+            raise ValueError(f"Invalid query {expr}")
+        pos = name.end()
+        predicates = []
+        while expr.startswith("[", pos):
+            end = find_predicate_end(expr, pos)
+            predicates.append(parse_predicate(expr[pos + 1 : end], expr))
+            pos = end + 1
+        steps.append(QueryStep(axis, name.group(), predicates))
+        if pos == len(expr):
+            return Query(expr, absolute, steps)
+        if not expr.startswith("/", pos):
+            raise ValueError(f"Invalid query {expr}")
+        axis = "child"
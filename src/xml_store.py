@@ -0,0 +1,546 @@
+from array import array
+from json import dumps, loads
+from mmap import ACCESS_READ, mmap
+from struct import Struct
+from sys import byteorder
+from types import MappingProxyType
+from typing import Any, TextIO
+from src.xml_element import XMLElement, insert_refs, render_attributes, xml_prolog
+
+binary_magic = b"XMLH"
+binary_version = 1
+binary_header = Struct("<4sHHqqqq")
+element_fields = (
+    "parent",
+    "first_child",
+    "next_sibling",
+    "last_child",
+    "tag",
+    "value",
+    "attr_start",
+    "attr_count",
+)
+attribute_fields = ("attr_keys", "attr_values")
+
+
+class XMLStore:
+    """A compact, read-only element tree held in parallel arrays.
+
+    Element ``i`` of the tree is described by position ``i`` of each of the structure arrays
+        - ``parent``, ``first_child``, ``next_sibling``: indices of related elements, -1 if there is none
+        - ``tag``: index of the element's tag in ``strings``
+        - ``value``: index of the element's value in ``strings``, -1 if the value is ``None``
+        - ``attr_start``, ``attr_count``: the span of the element's attributes in ``attr_keys`` and ``attr_values``, which hold indices into ``strings``
+
+    Tags, attribute keys and values are stored once each in the ``strings`` table. Element 0 is the root.
+    Use ``view`` to get XMLElement-like objects for reading the tree, and ``to_binary`` and ``from_binary`` to save and load the store as a binary snapshot."""
+
+    def __init__(self, encoding: str = None, xml_version: str = None):
+        self.parent = array("q")
+        self.first_child = array("q")
+        self.next_sibling = array("q")
+        self.last_child = array("q")
+        self.tag = array("q")
+        self.value = array("q")
+        self.attr_start = array("q")
+        self.attr_count = array("q")
+        self.attr_keys = array("q")
+        self.attr_values = array("q")
+        self.strings = []
+        self.string_ids = {}
+        self.entities = {}
+        self.encoding = encoding
+        self.xml_version = xml_version
+
+    def __len__(self):
+        return len(self.tag)
+
+    def intern(self, string: Any) -> int:
+        """Return the index of ``string`` in the string table, adding it if it is not already there."""
+        key = (type(string), string)
+        string_id = self.string_ids.get(key)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.strings.append(string)
+            self.string_ids[key] = string_id
+        return string_id
+
+    def add_element(
+        self, parent: int, tag: str, attributes: dict = None, value: Any = None
+    ) -> int:
+        """Append an element as the last child of the element at index ``parent`` and return its index.
+
+        Arguments:
+        ``parent`` -- index of the new element's parent, or -1 to add the root element.
+        ``tag`` -- the name to be written inside the new element's tags.
+        ``attributes`` -- the attributes belonging to the new element.
+        ``value`` -- the text which will appear between the element's start and stop tags."""
+        index = len(self.tag)
+        if parent < 0 and index:
+            raise ValueError("XMLStore already has a root element")
+        self.parent.append(parent)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        self.last_child.append(-1)
+        self.tag.append(self.intern(tag))
+        self.value.append(-1 if value is None else self.intern(value))
+        self.attr_start.append(len(self.attr_keys))
+        self.attr_count.append(len(attributes) if attributes else 0)
+        if attributes:
+            for key in attributes:
+                self.attr_keys.append(self.intern(key))
+                self.attr_values.append(self.intern(attributes[key]))
+        if parent >= 0:
+            if self.last_child[parent] < 0:
+                self.first_child[parent] = index
+            else:
+                self.next_sibling[self.last_child[parent]] = index
+            self.last_child[parent] = index
+        return index
+
+    @classmethod
+    def from_element(cls, xmlelt: XMLElement) -> "XMLStore":
+        """Return an XMLStore containing a copy of the tree including and descending from ``xmlelt``.
+
+        Arguments:
+        ``xmlelt`` -- the XMLElement which will become the root of the store."""
+        store = cls(xmlelt.encoding, xmlelt.xml_version)
+        store.entities = xmlelt.root.copy_entities()
+        stack = [(xmlelt, -1)]
+        while stack:
+            current, parent = stack.pop()
+            index = store.add_element(
+                parent, current.tag, current.attributes, current.value
+            )
+            stack.extend((child, index) for child in reversed(current.children))
+        return store
+
+    def to_binary(self, filepath: str):
+        """Write the store to a binary snapshot file located at ``filepath``, which can be read back with ``from_binary``.
+
+        The snapshot holds a versioned header, the encoding, XML version and entities of the store, the structure arrays as little-endian 64-bit integers and the string table. Each string table entry records the type of the string so that values which are ints, floats, bools or ``None`` are read back unchanged. Other types of value raise a TypeError.
+
+        Arguments:
+        ``filepath`` -- location of the resulting snapshot file."""
+        types = bytearray()
+        offsets = array("q", [0])
+        data = bytearray()
+        for string in self.strings:
+            string_type, encoded = encode_string(string)
+            types += string_type
+            data += encoded
+            offsets.append(len(data))
+        metadata = dumps(
+            {
+                "encoding": self.encoding,
+                "xml_version": self.xml_version,
+                "entities": self.entities,
+            }
+        ).encode("utf-8")
+        with open(filepath, "wb") as f:
+            f.write(
+                binary_header.pack(
+                    binary_magic,
+                    binary_version,
+                    0,
+                    len(self),
+                    len(self.attr_keys),
+                    len(self.strings),
+                    len(metadata),
+                )
+            )
+            f.write(metadata)
+            for field in element_fields + attribute_fields + (offsets,):
+                values = getattr(self, field) if isinstance(field, str) else field
+                if byteorder == "big":
+                    values = array("q", values)
+                    values.byteswap()
+                f.write(values)
+            f.write(types)
+            f.write(data)
+
+    @classmethod
+    def from_binary(cls, filepath: str) -> "XMLStore":
+        """Return the XMLStore saved in the binary snapshot file located at ``filepath`` by ``to_binary``.
+
+        The file is memory-mapped and the structure arrays are copied from it whole, so the time taken follows the number of distinct strings rather than the number of elements.
+
+        Arguments:
+        ``filepath`` -- location of the snapshot file."""
+        with (
+            open(filepath, "rb") as f,
+            mmap(f.fileno(), 0, access=ACCESS_READ) as mapped,
+        ):
+            if mapped[:4] != binary_magic or len(mapped) < binary_header.size:
+                raise ValueError(f"No binary snapshot found at {filepath}")
+            (
+                _,
+                version,
+                _,
+                element_count,
+                attribute_count,
+                string_count,
+                metadata_length,
+            ) = binary_header.unpack_from(mapped)
+            if version != binary_version:
+                raise ValueError(f"Unsupported binary snapshot version {version}")
+            position = binary_header.size
+            metadata = loads(mapped[position : position + metadata_length])
+            position += metadata_length
+            store = cls(metadata["encoding"], metadata["xml_version"])
+            store.entities = metadata["entities"]
+            sizes = [(field, element_count) for field in element_fields]
+            sizes += [(field, attribute_count) for field in attribute_fields]
+            sizes.append(("offsets", string_count + 1))
+            arrays = {}
+            for field, size in sizes:
+                values = array("q")
+                if position + size * 8 > len(mapped):
+                    raise ValueError(f"Binary snapshot at {filepath} is truncated")
+                values.frombytes(mapped[position : position + size * 8])
+                if byteorder == "big":
+                    values.byteswap()
+                arrays[field] = values
+                position += size * 8
+            offsets = arrays.pop("offsets")
+            types = mapped[position : position + string_count].decode("ascii")
+            position += string_count
+            data = mapped[position : position + offsets[-1]]
+        if len(data) != offsets[-1]:
+            raise ValueError(f"Binary snapshot at {filepath} is truncated")
+        for field, values in arrays.items():
+            setattr(store, field, values)
+        for i, string_type in enumerate(types):
+            string = decode_string(string_type, data[offsets[i] : offsets[i + 1]])
+            store.strings.append(string)
+            store.string_ids[(type(string), string)] = i
+        return store
+
+    def to_element(self, index: int = 0) -> XMLElement:
+        """Return a new XMLElement tree built from the element at ``index`` and its descendants."""
+        root = XMLElement.build(
+            self.element_specs(index),
+            self.encoding if index == 0 else None,
+            self.xml_version if index == 0 else None,
+        )
+        root.add_entity(self.entities)
+        return root
+
+    def element_specs(self, index: int = 0):
+        """Yield a (depth, tag, attributes, value) tuple for the element at ``index`` and each of its descendants, in the format read by ``XMLElement.build``."""
+        stack = [(index, 0)]
+        while stack:
+            current, depth = stack.pop()
+            yield (
+                depth,
+                self.strings[self.tag[current]],
+                self.element_attributes(current),
+                self.element_value(current),
+            )
+            stack.extend(
+                (child, depth + 1) for child in reversed(self.child_indices(current))
+            )
+
+    def view(self, index: int = 0) -> "XMLStoreView":
+        """Return an XMLElement-like view of the element at ``index``, which defaults to the root."""
+        return XMLStoreView(self, index)
+
+    def element_value(self, index: int) -> Any:
+        value_id = self.value[index]
+        if value_id >= 0:
+            return self.strings[value_id]
+
+    def element_attributes(self, index: int) -> dict:
+        start = self.attr_start[index]
+        strings = self.strings
+        return {
+            strings[self.attr_keys[i]]: strings[self.attr_values[i]]
+            for i in range(start, start + self.attr_count[index])
+        }
+
+    def child_indices(self, index: int) -> list[int]:
+        """Return a list of the indices of the children of the element at ``index``."""
+        children = []
+        child = self.first_child[index]
+        while child >= 0:
+            children.append(child)
+            child = self.next_sibling[child]
+        return children
+
+    def iter_indices(self, index: int = 0):
+        """Yield the indices of the element at ``index`` and all of its descendants, in document order, without recursion."""
+        stack = [index]
+        while stack:
+            current = stack.pop()
+            yield current
+            stack.extend(reversed(self.child_indices(current)))
+
+    def attribute_string(self, index: int, refs: dict) -> str:
+        """Return the attribute portion of the start tag of the element at ``index``, with entity references from ``refs`` inserted."""
+        return render_attributes(self.element_attributes(index), refs)
+
+    def write_xml_body(self, f: TextIO, index: int, tab_size: int, self_closing: bool):
+        """Write the element at ``index`` and its descendants to the writable object ``f``, as ``XMLElement.write_xml_body`` does.
+
+        Arguments:
+        ``f`` -- a writable file object.
+        ``index`` -- index of the first element to write.
+        ``tab_size`` -- the number of spaces used for each level of indentation.
+        ``self_closing`` -- controls the appearance of leaf tags without values. See ``XMLElement.to_xml`` for example."""
+        refs = XMLElement.predef_entities | self.entities
+        strings = self.strings
+        depth = 0
+        parent = self.parent[index]
+        while parent >= 0:
+            depth += 1
+            parent = self.parent[parent]
+        stack = [(index, depth, False)]
+        while stack:
+            current, depth, closing = stack.pop()
+            offset = " " * depth * tab_size
+            tag = strings[self.tag[current]]
+            if closing:
+                f.write(f"{offset}</{tag}>" + ("\n" if current else ""))
+                continue
+            attribute_string = self.attribute_string(current, refs)
+            value = self.element_value(current)
+            if self.first_child[current] >= 0:
+                f.write(f"{offset}<{tag}{attribute_string}>\n")
+                stack.append((current, depth, True))
+                stack.extend(
+                    (child, depth + 1, False)
+                    for child in reversed(self.child_indices(current))
+                )
+            elif self_closing and not value:
+                f.write(f"{offset}<{tag}{attribute_string}/>\n")
+            else:
+                val_to_write = "" if value is None else insert_refs(str(value), refs)
+                f.write(f"{offset}<{tag}{attribute_string}>{val_to_write}</{tag}>\n")
+
+    def to_xml(
+        self, filepath: str, index: int = 0, tab_size: int = 2, self_closing=True
+    ):
+        """Write the element at ``index`` and its descendants to a well-formed XML file located at ``filepath``, as ``XMLElement.to_xml`` does.
+
+        Arguments:
+        ``filepath`` -- location of the resulting XML file.
+        ``index`` -- index of the element to write, which defaults to the root.
+        ``tab_size`` -- number of spaces used for each level of indentation.
+        ``self_closing`` -- ``True``: use self-closing tags where possible, eg. <matthew/>. ``False``: use start and stop tags for all elements, eg. <matthew></matthew>."""
+        xml_version = (self.xml_version if index == 0 else None) or "1.0"
+        encoding = (self.encoding if index == 0 else None) or "UTF-8"
+        with open(filepath, "w", encoding=encoding) as f:
+            root_tag = self.strings[self.tag[0]]
+            f.write(xml_prolog(xml_version, encoding, root_tag, self.entities))
+            self.write_xml_body(f, index, tab_size, self_closing)
+
+    def dict(self, index: int = 0) -> dict:
+        """Return a dictionary version of the element at ``index`` and its descendants, as ``XMLElement.dict`` does."""
+        strings = self.strings
+        result = []
+        stack = [(index, result)]
+        while stack:
+            current, siblings = stack.pop()
+            children = []
+            siblings.append(
+                {
+                    strings[self.tag[current]]: {
+                        "attributes": self.element_attributes(current),
+                        "value": self.element_value(current),
+                        "children": children,
+                    }
+                }
+            )
+            stack.extend(
+                (child, children) for child in reversed(self.child_indices(current))
+            )
+        return result[0]
+
+    def json(self, index: int = 0, indent: int = 2, sort_keys: bool = False) -> str:
+        """Return a json string of the element at ``index`` and its descendants, as ``XMLElement.json`` does."""
+        return dumps(self.dict(index), indent=indent, sort_keys=sort_keys)
+
+
+def encode_string(string: Any) -> tuple[bytes, bytes]:
+    """Return the type code and the encoded bytes of an entry of an XMLStore's string table, as written by ``XMLStore.to_binary``."""
+    if string is None:
+        return b"n", b""
+    if isinstance(string, bool):
+        return b"b", b"1" if string else b""
+    if isinstance(string, str):
+        return b"s", string.encode("utf-8")
+    if isinstance(string, int):
+        return b"i", str(string).encode("ascii")
+    if isinstance(string, float):
+        return b"f", repr(string).encode("ascii")
+    raise TypeError(
+        f"Cannot write value of type {type(string).__name__} to a binary snapshot"
+    )
+
+
+def decode_string(string_type: str, encoded: bytes) -> Any:
+    """Return the string table entry with the type code ``string_type`` and the encoded bytes ``encoded``."""
+    if string_type == "s":
+        return encoded.decode("utf-8")
+    if string_type == "i":
+        return int(encoded)
+    if string_type == "f":
+        return float(encoded)
+    if string_type == "b":
+        return encoded == b"1"
+    if string_type == "n":
+        return None
+    raise ValueError(f"Unknown string type {string_type} in binary snapshot")
+
+
+class XMLStoreView:
+    """A lightweight, read-only view of one element of an XMLStore, offering the reading interface of XMLElement.
+
+    Views are created on demand and hold only the store and the element's index. Two views of the same element are equal."""
+
+    __slots__ = ("index", "store")
+
+    def __init__(self, store: XMLStore, index: int):
+        self.store = store
+        self.index = index
+
+    def __eq__(self, other):
+        return (
+            isinstance(other, XMLStoreView)
+            and self.store is other.store
+            and self.index == other.index
+        )
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    def __repr__(self):
+        return f"XMLStoreView({self.tag!r}, index={self.index})"
+
+    @property
+    def tag(self) -> str:
+        return self.store.strings[self.store.tag[self.index]]
+
+    @property
+    def value(self) -> Any:
+        return self.store.element_value(self.index)
+
+    @property
+    def attributes(self) -> dict:
+        return self.store.element_attributes(self.index)
+
+    @property
+    def entities(self) -> MappingProxyType:
+        return MappingProxyType(self.store.entities)
+
+    def copy_entities(self) -> dict:
+        return self.store.entities.copy()
+
+    @property
+    def encoding(self) -> str | None:
+        if self.is_root:
+            return self.store.encoding
+
+    @property
+    def xml_version(self) -> str | None:
+        if self.is_root:
+            return self.store.xml_version
+
+    @property
+    def attribute_string(self) -> str:
+        return self.store.attribute_string(
+            self.index, XMLElement.predef_entities | self.store.entities
+        )
+
+    @property
+    def children(self) -> list["XMLStoreView"]:
+        return [
+            XMLStoreView(self.store, child)
+            for child in self.store.child_indices(self.index)
+        ]
+
+    @property
+    def parent(self) -> "XMLStoreView | None":
+        parent = self.store.parent[self.index]
+        if parent >= 0:
+            return XMLStoreView(self.store, parent)
+
+    @property
+    def root(self) -> "XMLStoreView":
+        return XMLStoreView(self.store, 0)
+
+    @property
+    def is_root(self) -> bool:
+        return self.index == 0
+
+    @property
+    def is_leaf(self) -> bool:
+        return self.store.first_child[self.index] < 0
+
+    @property
+    def last_child(self) -> "XMLStoreView | None":
+        child = self.store.last_child[self.index]
+        if child >= 0:
+            return XMLStoreView(self.store, child)
+
+    @property
+    def no_children(self) -> int:
+        return len(self.store.child_indices(self.index))
+
+    @property
+    def depth(self) -> int:
+        depth = 0
+        parent = self.store.parent[self.index]
+        while parent >= 0:
+            depth += 1
+            parent = self.store.parent[parent]
+        return depth
+
+    @property
+    def path(self) -> list[int]:
+        path = []
+        current = self.index
+        parent = self.store.parent[current]
+        while parent >= 0:
+            path.append(self.store.child_indices(parent).index(current))
+            current = parent
+            parent = self.store.parent[current]
+        return path[::-1]
+
+    @property
+    def size(self) -> int:
+        return sum(1 for _ in self.store.iter_indices(self.index))
+
+    @property
+    def descendants(self) -> list["XMLStoreView"]:
+        return list(self)
+
+    def __iter__(self):
+        for index in self.store.iter_indices(self.index):
+            yield XMLStoreView(self.store, index)
+
+    def get_from_path(self, path: list) -> "XMLStoreView":
+        """Return the view of the element located at the ``path`` given."""
+        index = self.index
+        try:
+            for position in path:
+                index = self.store.child_indices(index)[position]
+        except:
+            raise IndexError(f"no element found at path {path}")
+        return XMLStoreView(self.store, index)
+
+    def to_xml(self, filepath: str, tab_size: int = 2, self_closing: bool = True):
+        self.store.to_xml(filepath, self.index, tab_size, self_closing)
+
+    def write_xml_body(self, f: TextIO, tab_size: int, self_closing: bool):
+        self.store.write_xml_body(f, self.index, tab_size, self_closing)
+
+    @property
+    def dict(self) -> dict:
+        return self.store.dict(self.index)
+
+    def json(self, indent: int = 2, sort_keys: bool = False) -> str:
+        return self.store.json(self.index, indent, sort_keys)
+
+    def to_element(self) -> XMLElement:
+        return self.store.to_element(self.index)
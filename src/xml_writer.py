@@ -0,0 +1,184 @@
+from src.xml_element import (
+    XMLElement,
+    check_name,
+    insert_refs,
+    render_attributes,
+    xml_prolog,
+)
+from typing import Any
+
+
+class XMLWriter:
+    """Write an XML document element by element, without building an XMLElement tree.
+
+    The document has the same prolog, indentation and entity references as one written by ``XMLElement.to_xml``. Only the start tags of the elements which are still open are held in memory, so documents of any size are written in constant memory.
+    Use the writer as a context manager, which opens the file and, on leaving without an exception, ends any elements still open:
+
+        with XMLWriter("bookstore.xml") as writer:
+            writer.start("bookstore")
+            writer.element("book", {"category": "web"}, "Learning XML")
+            writer.end()
+    """
+
+    def __init__(
+        self,
+        filepath: str,
+        encoding: str = None,
+        xml_version: str = None,
+        entities: dict = None,
+        tab_size: int = 2,
+        self_closing: bool = True,
+    ):
+        """Arguments:
+        ``filepath`` -- location of the resulting XML file.
+        ``encoding`` -- the encoding of the document (defaults to "UTF-8").
+        ``xml_version`` -- the XML version of the document (defaults to "1.0").
+        ``entities`` -- a dictionary of user-defined entity references, as for ``XMLElement.add_entity``, which are declared in the DOCTYPE and inserted into values.
+        ``tab_size`` -- number of spaces used for each level of indentation.
+        ``self_closing`` -- ``True``: use self-closing tags where possible, eg. <matthew/>. ``False``: use start and stop tags for all elements, eg. <matthew></matthew>.
+        """
+        self.filepath = filepath
+        self.encoding = encoding or "UTF-8"
+        self.xml_version = xml_version or "1.0"
+        self.entities = dict(entities or {})
+        self.tab_size = tab_size
+        self.self_closing = self_closing
+        self.__refs = XMLElement.predef_entities | self.entities
+        self.__file = None
+        self.__indents = []
+        self.__open = []
+        self.__pending = None
+        self.__finished = False
+
+    def __enter__(self):
+        self.__file = open(self.filepath, "w", encoding=self.encoding)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                while self.__pending or self.__open:
+                    self.end()
+        finally:
+            self.__file.close()
+
+    def start(self, tag: str, attributes: dict = None):
+        """Begin a new element inside the element which is currently open, or the root element if there is none.
+
+        Arguments:
+        ``tag`` -- the tag name of the element.
+        ``attributes`` -- dict object containing the attributes of the element."""
+        attributes = attributes or {}
+        check_name(tag, "tag name")
+        for key in attributes:
+            check_name(key, "attribute key")
+        self.__begin(tag)
+        self.__pending = [tag, render_attributes(attributes, self.__refs), None]
+
+    def text(self, value: Any):
+        """Set the ``value`` of the element which was most recently started. The element must not have children.
+
+        Arguments:
+        ``value`` -- the value of the element, which is written between its start and stop tags."""
+        if self.__pending is None:
+            if self.__open:
+                raise ValueError("Cannot add value to an element with children")
+            raise ValueError("No element to add value to")
+        self.__pending[2] = value
+
+    def end(self):
+        """End the element which is currently open."""
+        level = len(self.__open)
+        if self.__pending:
+            tag, attribute_string, value = self.__pending
+            self.__pending = None
+            if self.self_closing and not value:
+                self.__file.write(f"{self.__indent(level)}<{tag}{attribute_string}/>\n")
+            else:
+                value = insert_refs("" if value is None else str(value), self.__refs)
+                self.__file.write(
+                    f"{self.__indent(level)}<{tag}{attribute_string}>{value}</{tag}>\n"
+                )
+        elif self.__open:
+            tag = self.__open.pop()
+            line_end = "\n" if self.__open else ""
+            self.__file.write(f"{self.__indent(level - 1)}</{tag}>{line_end}")
+        else:
+            raise ValueError("No element to end")
+        if not self.__open:
+            self.__finished = True
+
+    def element(self, tag: str, attributes: dict = None, value: Any = None):
+        """Write a whole element without children, as ``start``, ``text`` and ``end`` would.
+
+        Arguments:
+        ``tag`` -- the tag name of the element.
+        ``attributes`` -- dict object containing the attributes of the element.
+        ``value`` -- the value of the element."""
+        self.start(tag, attributes)
+        if value is not None:
+            self.text(value)
+        self.end()
+
+    def write_subtree(self, xmlelt: XMLElement):
+        """Write the XMLElement ``xmlelt`` and its descendants inside the element which is currently open, or as the root element if there is none.
+
+        Entity references are inserted into the subtree's values and attribute values using the writer's ``entities``, as for ``element``.
+
+        Arguments:
+        ``xmlelt`` -- the XMLElement to write."""
+        self.__begin(xmlelt.tag)
+        level = len(self.__open)
+        self.__file.writelines(self.__subtree_chunks(xmlelt, level))
+        if not level:
+            self.__finished = True
+
+    def __subtree_chunks(self, xmlelt: XMLElement, level: int):
+        """Yield the lines of XML of ``xmlelt`` and its descendants, with ``xmlelt`` at indentation ``level``, without recursion."""
+        stack = [(xmlelt, level, False)]
+        while stack:
+            current, level, closing = stack.pop()
+            offset = self.__indent(level)
+            tag = current.tag
+            if closing:
+                yield f"{offset}</{tag}>" + ("\n" if level else "")
+                continue
+            attribute_string = render_attributes(current.attributes, self.__refs)
+            value = current.value
+            if current.children:
+                yield f"{offset}<{tag}{attribute_string}>\n"
+                stack.append((current, level, True))
+                stack.extend(
+                    (child, level + 1, False) for child in reversed(current.children)
+                )
+            elif self.self_closing and not value:
+                yield f"{offset}<{tag}{attribute_string}/>\n"
+            else:
+                value = insert_refs("" if value is None else str(value), self.__refs)
+                yield f"{offset}<{tag}{attribute_string}>{value}</{tag}>\n"
+
+    def __begin(self, tag: str):
+        """Write the prolog before the root element, or the start tag of the element which the new element ``tag`` is a child of."""
+        if self.__pending is None and not self.__open:
+            if self.__finished:
+                raise ValueError("Cannot write more than one root element")
+            self.__file.write(
+                xml_prolog(self.xml_version, self.encoding, tag, self.entities)
+            )
+        elif self.__pending:
+            parent_tag, attribute_string, value = self.__pending
+            if value:
+                raise ValueError(
+                    "Cannot add children to an element with a value. Please set value to None."
+                )
+            level = len(self.__open)
+            self.__file.write(
+                f"{self.__indent(level)}<{parent_tag}{attribute_string}>\n"
+            )
+            self.__open.append(parent_tag)
+            self.__pending = None
+
+    def __indent(self, level: int) -> str:
+        while len(self.__indents) <= level:
+            self.__indents.append(" " * len(self.__indents) * self.tab_size)
+        return self.__indents[level]
@@ -0,0 +1,142 @@
+from pytest import mark, raises
+from src.xml_element import XMLElement
+from src.xml_diff import diff, apply_patch
+from test_data.book_store.book_store import build_bookstore_file
+
+
+def patched(old, new):
+    script = diff(old, new)
+    apply_patch(old, script)
+    return script
+
+
+class Testdiff:
+    @mark.it("Returns an empty script for trees with the same content")
+    def test_no_changes(self):
+        assert diff(build_bookstore_file(), build_bookstore_file()) == []
+
+    @mark.it("Returns value and attribute edits addressed by path")
+    def test_value_and_attributes(self):
+        old = build_bookstore_file()
+        new = build_bookstore_file()
+        new.children[1].children[3].value = 24.99
+        new.children[2].add_attribute({"cover": "paperback"})
+        new.children[0].children[0].remove_attribute("lang")
+        script = diff(old, new)
+        assert len(script) == 3
+        assert {"op": "set_value", "path": [1, 3], "value": 24.99} in script
+        assert {
+            "op": "set_attribute",
+            "path": [2],
+            "key": "cover",
+            "value": "paperback",
+        } in script
+        assert {"op": "remove_attribute", "path": [0, 0], "key": "lang"} in script
+
+    @mark.it("Returns a single move for a reordered child")
+    def test_move(self):
+        old = build_bookstore_file()
+        new = build_bookstore_file()
+        new.children[0].move(new)
+        assert diff(old, new) == [{"op": "move", "path": [], "from": 0, "to": 2}]
+
+    @mark.it("Returns deletes and inserts for removed and added children")
+    def test_delete_insert(self):
+        old = build_bookstore_file()
+        new = build_bookstore_file()
+        new.remove_from_path([1])
+        new.make_child("magazine", {"category": "news"}, "Weekly")
+        script = diff(old, new)
+        assert script == [
+            {"op": "delete", "path": [1]},
+            {"op": "insert", "path": [], "index": 2, "element": new.children[2].dict},
+        ]
+
+    @mark.it("Does not walk subtrees whose content is unchanged")
+    def test_skips_unchanged(self):
+        old = XMLElement("catalog")
+        for i in range(200):
+            old.make_child("book", {"id": str(i)})
+            old.last_child.make_child("title", value=f"Book {i}")
+        new = old.clone()
+        new.children[150].children[0].value = "Changed"
+        script = diff(old, new)
+        assert script == [{"op": "set_value", "path": [150, 0], "value": "Changed"}]
+
+    @mark.it("Moves only the children which are out of order")
+    def test_edited_in_place(self):
+        old = XMLElement.build(
+            [(0, "catalog", None, None)]
+            + [(1, "book", {"id": str(i)}, None) for i in range(1000)]
+        )
+        new = old.clone()
+        for i in range(0, 1000, 10):
+            new.children[i].add_attribute({"id": "changed"})
+        new.children[505].move(new, 0)
+        script = diff(old, new)
+        assert [edit for edit in script if edit["op"] == "move"] == [
+            {"op": "move", "path": [], "from": 505, "to": 0}
+        ]
+        assert len(script) == 101
+        apply_patch(old, script)
+        assert old.equals(new)
+
+
+class Testapply_patch:
+    @mark.it("Patching the old tree gives a tree equal to the new tree")
+    @mark.parametrize("edit", range(5))
+    def test_round_trip(self, edit):
+        old = build_bookstore_file()
+        new = build_bookstore_file()
+        if edit == 0:
+            new.children[2].children[1].value = None
+            new.children[2].children[1].make_child("name", value="Erik T. Ray")
+        elif edit == 1:
+            new.children[1].remove_paths([[0], [2]])
+            new.children[0].move(new.children[1], 1)
+        elif edit == 2:
+            new.tag = "shop"
+            new.add_entity({"Waterstones": "company"})
+        elif edit == 3:
+            new.children[0].remove_paths([[0], [1], [2], [3]])
+            new.children[0].value = "Sold out"
+        else:
+            new.children.reverse()
+            new.children[0].children.reverse()
+            new.make_child("book", {"category": "cooking"})
+        patched(old, new)
+        assert old.equals(new)
+        assert old.entities == new.entities
+
+    @mark.it("Changes an element between having children and a value")
+    @mark.parametrize("value", [0, "", "Sold out"])
+    def test_children_to_value(self, value):
+        old = XMLElement("a")
+        old.make_child("b")
+        new = XMLElement("a", value=value)
+        patched(old, new)
+        assert old.equals(new)
+        patched(old, XMLElement("a"))
+        old.make_child("b")
+        patched(new, old)
+        assert new.equals(old)
+
+    @mark.it("Changes the value of an element which keeps some of its children")
+    def test_value_with_kept_children(self):
+        old = XMLElement.build(
+            [(0, "r", None, None), (1, "x", None, None), (1, "c", None, None)]
+            + [(2, "a", None, None), (2, "b", None, None)]
+        )
+        new = XMLElement.build(
+            [(0, "r", None, None), (1, "x", None, None), (1, "c", None, 0)]
+            + [(2, "b", None, None)]
+        )
+        patched(old, new)
+        assert old.equals(new)
+        assert old.children[1].value == 0
+
+    @mark.it("Raises ValueError for an unknown edit")
+    def test_unknown_edit(self):
+        with raises(ValueError) as err:
+            apply_patch(build_bookstore_file(), [{"op": "replace", "path": []}])
+        assert str(err.value) == "Unknown edit replace"
@@ -1,10 +1,17 @@
 from pytest import mark, fixture, raises
-from src.xml_element import XMLElement
+from src.xml_element import XMLElement, FrozenXMLElement
+from src import xml_element
 from src.xml_load import load_xml_from_file
 from test_data.book_store.book_store import build_bookstore_file
 import os
 from json import load as load_json
 from json import dumps
+from copy import deepcopy
+import gc
+import weakref
+from io import BytesIO, StringIO
+from multiprocessing import get_context
+from threading import Thread
 
 
 @fixture(scope="function")
@@ -105,6 +112,13 @@ class Testadd_child:
         root_element.add_child(test_child)
         assert not root_element.last_child.is_root
 
+    @mark.it("Raises TypeError without changing the element when adding a frozen child")
+    def test_frozen_child(self, root_element):
+        with raises(TypeError) as err:
+            root_element.add_child(XMLElement("book").freeze())
+        assert str(err.value) == "Cannot modify a frozen XMLElement"
+        assert root_element.children == []
+
     @mark.it("Raises ValueError if calling add_child on self")
     def test_index_error_self_add(self, root_element):
         with raises(ValueError) as err:
@@ -798,6 +812,16 @@ class Testremove_from_path:
             root_element.remove_from_path([])
         assert str(err.value) == "cannot remove root element"
 
+    @mark.it("Does not allow removal of a non-root element by the empty path")
+    def test_remove_self(self, root_element):
+        root_element.make_child("book")
+        book = root_element.last_child
+        with raises(IndexError) as err:
+            book.remove_from_path([])
+        assert str(err.value) == "cannot remove root element"
+        assert book.parent is root_element
+        assert root_element.children == [book]
+
     @mark.it(
         "Raises IndexError when attempting to remove element from path not in tree"
     )
@@ -1088,3 +1112,1455 @@ class Testdict:
         }
         result = test_tree.dict
         assert result == expected
+
+
+@fixture(scope="function")
+def catalog():
+    test_tree = XMLElement("catalog")
+    for i in range(1, 6):
+        test_tree.make_child("book", {"id": f"bk10{i}"})
+        test_tree.last_child.make_child("title", value=f"Book {i}")
+    test_tree.add_index("id")
+    return test_tree
+
+
+class Testget_by_attribute:
+    @mark.it("Returns the elements with the given attribute value using the index")
+    def test_indexed_lookup(self, catalog):
+        result = catalog.get_by_attribute("id", "bk103")
+        assert result == [catalog.children[2]]
+
+    @mark.it("Returns an empty list when no element has the attribute value")
+    def test_missing_value(self, catalog):
+        assert catalog.get_by_attribute("id", "bk999") == []
+        assert catalog.get_by_attribute("lang", "en") == []
+
+    @mark.it("Searches the tree when the attribute key is not indexed")
+    def test_unindexed_lookup(self, catalog):
+        catalog.children[1].last_child.add_attribute({"lang": "en"})
+        result = catalog.get_by_attribute("lang", "en")
+        assert result == [catalog.children[1].last_child]
+
+    @mark.it("Searches only the subtree when called on a non-root element")
+    def test_subtree_lookup(self, catalog):
+        assert catalog.children[0].get_by_attribute("id", "bk101") == [
+            catalog.children[0]
+        ]
+        assert catalog.children[0].get_by_attribute("id", "bk102") == []
+
+
+class Testadd_index:
+    @mark.it("Raises TypeError when adding an index to a non-root element")
+    def test_non_root(self, catalog):
+        with raises(TypeError) as err:
+            catalog.last_child.add_index("id")
+        assert str(err.value) == "Cannot add index to non-root element"
+
+    @mark.it("Index is updated by add_attribute and remove_attribute")
+    def test_attribute_changes(self, catalog):
+        book = catalog.children[0]
+        book.add_attribute({"id": "bk200"})
+        assert catalog.get_by_attribute("id", "bk101") == []
+        assert catalog.get_by_attribute("id", "bk200") == [book]
+        book.remove_attribute("id")
+        assert catalog.get_by_attribute("id", "bk200") == []
+
+    @mark.it("Index is updated when a subtree is added to the tree")
+    def test_add_child(self, catalog):
+        new_shelf = XMLElement("shelf")
+        new_shelf.make_child("book", {"id": "bk300"})
+        catalog.add_child(new_shelf)
+        assert catalog.get_by_attribute("id", "bk300") == [new_shelf.last_child]
+
+    @mark.it("Index is updated when a subtree is removed from the tree")
+    def test_remove_from_path(self, catalog):
+        removed = catalog.children[3]
+        catalog.remove_from_path([3])
+        assert catalog.get_by_attribute("id", "bk104") == []
+        assert removed.is_root
+        assert removed.last_child.root is removed
+
+    @mark.it("Lists the indexed attribute keys and removes indexes")
+    def test_remove_index(self, catalog):
+        assert catalog.indexes == ["id"]
+        assert catalog.last_child.indexes == ["id"]
+        catalog.remove_index("id")
+        assert catalog.indexes == []
+        assert catalog.get_by_attribute("id", "bk105") == [catalog.children[4]]
+
+    @mark.it("Indexes, looks up and clones trees deeper than the recursion limit")
+    def test_deep_tree(self):
+        test_tree = XMLElement.build(
+            (depth, "level", {"depth": depth % 2}, None) for depth in range(5000)
+        )
+        assert len(test_tree.get_by_attribute("depth", 1)) == 2500
+        test_tree.add_index("depth")
+        result = test_tree.get_by_attribute("depth", 1)
+        assert len(result) == 2500
+        assert result[0] is test_tree.children[0]
+        assert len(test_tree.clone().get_by_attribute("depth", 0)) == 2500
+
+    @mark.it("Index keeps track of the values which are not strings")
+    def test_nonstring_values(self, catalog):
+        catalog.children[0].add_attribute({"id": 30})
+        catalog.children[1].add_attribute({"id": 30.0})
+        assert catalog.indexed_nonstring_values("id") == [30]
+        assert [
+            xmlelt.attributes["id"] for xmlelt in catalog.select('//book[@id="30.0"]')
+        ] == [30.0]
+        catalog.children[0].remove_attribute("id")
+        catalog.children[1].remove_attribute("id")
+        assert catalog.indexed_nonstring_values("id") == []
+        assert catalog.select('//book[@id="30"]') == []
+
+
+class Testselect:
+    @mark.it("Selects children and grandchildren with a relative query")
+    def test_relative(self):
+        test_tree = build_bookstore_file()
+        result = test_tree.select("book/title")
+        assert [xmlelt.value for xmlelt in result] == [
+            "Everyday Italian",
+            "Harry Potter",
+            "Learning XML",
+        ]
+
+    @mark.it("Selects from the document with absolute and descendant queries")
+    def test_absolute(self):
+        test_tree = build_bookstore_file()
+        assert test_tree.last_child.select("/bookstore") == [test_tree]
+        assert len(test_tree.last_child.select("//price")) == 3
+        assert test_tree.select("/book") == []
+
+    @mark.it("Selects any tag with *")
+    def test_wildcard(self):
+        test_tree = build_bookstore_file()
+        assert test_tree.select("book[1]/*") == test_tree.children[0].children
+
+    @mark.it("Applies positional predicates per parent")
+    def test_position(self):
+        test_tree = build_bookstore_file()
+        assert test_tree.select("book[2]") == [test_tree.children[1]]
+        assert test_tree.select("//book/*[4]") == [
+            book.children[3] for book in test_tree.children
+        ]
+
+    @mark.it("Filters by attribute equality and value comparison")
+    def test_predicates(self):
+        test_tree = build_bookstore_file()
+        assert test_tree.select('book[@category="web"]') == [test_tree.children[2]]
+        assert test_tree.select("//book[price<30]/title")[0].value == "Harry Potter"
+        assert test_tree.select("//book[year>=2005][price>29.99]") == [
+            test_tree.children[0]
+        ]
+        assert test_tree.select('//title[.="Learning XML"]') == [
+            test_tree.children[2].children[0]
+        ]
+
+    @mark.it("Uses attribute indexes and returns results in document order")
+    def test_indexed(self, catalog):
+        catalog.children[0].add_attribute({"id": "bk105"})
+        result = catalog.select('//book[@id="bk105"]')
+        assert result == [catalog.children[0], catalog.children[4]]
+
+    @mark.it("Selects the same elements with and without an index")
+    @mark.parametrize(
+        "expr",
+        ['//b[@n="30"]', "//b[@n=30]", '//b[@n="30.0"]', "//b[@n=31]", "//*[@n=30]"],
+    )
+    def test_indexed_same_as_unindexed(self, expr):
+        test_tree = XMLElement("r")
+        for n in [30, "30.0", "30", 30.0, True, "x", 31.5]:
+            test_tree.make_child("b", {"n": n})
+        test_tree.children[1].make_child("b", {"n": 30})
+        expected = test_tree.select(expr)
+        test_tree.add_index("n")
+        assert test_tree.select(expr) == expected
+
+    @mark.it("Raises ValueError for unsupported queries")
+    def test_invalid(self, root_element):
+        with raises(ValueError):
+            root_element.select("book[")
+        with raises(ValueError):
+            root_element.select("book[price<]")
+
+
+class Testselect_one:
+    @mark.it("Returns the first selected element")
+    def test_first(self):
+        test_tree = build_bookstore_file()
+        assert test_tree.select_one("//title") is test_tree.children[0].children[0]
+
+    @mark.it("Returns None when nothing matches")
+    def test_none(self, catalog):
+        assert catalog.select_one('//book[@id="bk999"]') is None
+
+
+class Testversion:
+    @mark.it("Changing a value bumps the versions of the element and its ancestors")
+    def test_value_bumps_ancestors(self):
+        test_tree = build_bookstore_file()
+        before = test_tree.version
+        book_version = test_tree.children[1].version
+        test_tree.get_from_path([0, 3]).value = 35
+        assert test_tree.version > before
+        assert test_tree.children[0].version > before
+        assert test_tree.get_from_path([0, 3]).version > before
+        assert test_tree.children[1].version == book_version
+
+    @mark.it("Every mutating operation bumps the root's version")
+    def test_mutators(self, root_element):
+        mutations = [
+            lambda: root_element.make_child("book"),
+            lambda: root_element.last_child.add_attribute({"lang": "en"}),
+            lambda: root_element.last_child.remove_attribute("lang"),
+            lambda: setattr(root_element.last_child, "tag", "novel"),
+            lambda: root_element.add_entity({"Waterstones": "shop"}),
+            lambda: root_element.remove_entity("Waterstones"),
+            lambda: root_element.remove_from_path([0]),
+        ]
+        for mutation in mutations:
+            before = root_element.version
+            mutation()
+            assert root_element.version > before
+
+
+class Testchanged_since:
+    @mark.it("Returns only the children changed since the given version")
+    def test_changed_children(self):
+        test_tree = build_bookstore_file()
+        version = test_tree.version
+        assert test_tree.changed_since(version) == []
+        test_tree.get_from_path([2, 0]).add_attribute({"lang": "fr"})
+        test_tree.make_child("book")
+        assert test_tree.changed_since(version) == [
+            test_tree.children[2],
+            test_tree.children[3],
+        ]
+
+
+class Testclone:
+    @mark.it("Deep clone has the same structure, tags, attributes and values")
+    def test_deep_clone(self):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Waterstones": "company"})
+        result = test_tree.clone()
+        assert result.dict == test_tree.dict
+        assert result.entities == test_tree.entities
+        assert result is not test_tree
+        for original, copy in zip(test_tree, result):
+            assert copy is not original
+
+    @mark.it("Clone's parent and root links point into the new tree")
+    def test_clone_links(self):
+        test_tree = build_bookstore_file()
+        result = test_tree.children[1].clone()
+        assert result.is_root
+        assert result.parent is None
+        for xmlelt in result.descendants[1:]:
+            assert xmlelt.root is result
+            assert xmlelt in xmlelt.parent.children
+        assert result.dict == test_tree.children[1].dict
+
+    @mark.it("Changing the clone does not change the original")
+    def test_clone_independent(self):
+        test_tree = build_bookstore_file()
+        result = test_tree.clone()
+        result.get_from_path([0, 0]).add_attribute({"lang": "it"})
+        result.get_from_path([0, 1]).value = "Giada"
+        result.make_child("book")
+        assert test_tree.get_from_path([0, 0]).attributes == {"lang": "en"}
+        assert test_tree.get_from_path([0, 1]).value == "Giada De Laurentiis"
+        assert test_tree.no_children == 3
+
+    @mark.it("Shallow clone copies only the element itself")
+    def test_shallow_clone(self):
+        test_tree = build_bookstore_file()
+        result = test_tree.children[0].clone(deep=False)
+        assert result.is_leaf
+        assert result.attributes == {"category": "cooking"}
+
+    @mark.it("Clone of an indexed root element has the same indexes")
+    def test_clone_indexes(self, catalog):
+        result = catalog.clone()
+        assert result.indexes == ["id"]
+        assert result.get_by_attribute("id", "bk102") == [result.children[1]]
+
+    @mark.it("copy.deepcopy returns a clone")
+    def test_deepcopy(self):
+        test_tree = build_bookstore_file()
+        result = deepcopy(test_tree.children[0])
+        assert result.is_root
+        assert result.dict == test_tree.children[0].dict
+
+    @mark.it("copy.deepcopy copies each element once when it is reached twice")
+    def test_deepcopy_memo(self):
+        test_tree = build_bookstore_file()
+        book = test_tree.children[1]
+        result = deepcopy({"tree": test_tree, "book": book, "books": [book, book]})
+        assert result["book"] is result["tree"].children[1]
+        assert all(copy is result["book"] for copy in result["books"])
+
+    @mark.it("Clone has the validation policy of the original's tree")
+    @mark.parametrize("policy", ["strict", "cached", "trusted"])
+    def test_validation(self, policy):
+        test_tree = XMLElement("bookstore", validation=policy)
+        test_tree.make_child("book")
+        assert test_tree.clone().validation == policy
+        assert test_tree.children[0].clone().validation == policy
+        assert deepcopy(test_tree).validation == policy
+
+
+class Testfreeze:
+    @mark.it("Frozen tree has the same structure and data as the original")
+    def test_same_data(self):
+        test_tree = build_bookstore_file()
+        result = test_tree.freeze()
+        assert isinstance(result, FrozenXMLElement)
+        assert result.dict == test_tree.dict
+        assert result.size == 16
+        assert result.get_from_path([1, 2]).path == [1, 2]
+        assert result.get_from_path([1, 2]).depth == 2
+        assert result.get_from_path([0, 0]).attribute_string == ' lang="en"'
+        assert result.get_from_path([0, 0]).root is result
+
+    @mark.it("Frozen tree rejects every mutating operation")
+    def test_rejects_mutation(self):
+        result = build_bookstore_file().freeze()
+        book = result.children[0]
+        mutations = [
+            lambda: setattr(book, "tag", "novel"),
+            lambda: setattr(book.last_child, "value", 5),
+            lambda: setattr(book, "parent", None),
+            lambda: book.add_attribute({"lang": "en"}),
+            lambda: book.remove_attribute("category"),
+            lambda: result.add_entity({"Waterstones": "company"}),
+            lambda: book.make_child("isbn"),
+            lambda: book.add_child(XMLElement("isbn")),
+            lambda: book.make_sibling(),
+            lambda: result.remove_from_path([0]),
+            lambda: result.add_index("category"),
+        ]
+        for mutation in mutations:
+            with raises(TypeError) as err:
+                mutation()
+            assert str(err.value) == "Cannot modify a frozen XMLElement"
+        with raises(AttributeError):
+            result.children.append(book)
+        with raises(TypeError):
+            book.attributes["category"] = "baking"
+
+    @mark.it("Frozen trees are hashable and equal when their content is equal")
+    def test_hash_eq(self):
+        first = build_bookstore_file().freeze()
+        second = build_bookstore_file().freeze()
+        assert first == second
+        assert hash(first) == hash(second)
+        assert len({first, second}) == 1
+        third = build_bookstore_file()
+        third.get_from_path([2, 3]).value = 40
+        assert third.freeze() != first
+        assert first.children[0] != first.children[1]
+
+    @mark.it("Writes the same XML file as the original")
+    def test_to_xml(self):
+        test_tree = load_xml_from_file("test_data/book_store/bookstore.xml")
+        result_path = "test_data/book_store/test_xml.xml"
+        for tab_size in [2, 5]:
+            test_tree.freeze().to_xml(result_path, tab_size=tab_size)
+            with open(result_path) as f:
+                result = f.read()
+            test_tree.to_xml(result_path, tab_size=tab_size)
+            with open(result_path) as f:
+                expected = f.read()
+            os.remove(result_path)
+            assert result == expected
+
+
+class Testthaw:
+    @mark.it("Returns a mutable copy of a frozen tree")
+    def test_thaw(self):
+        frozen = build_bookstore_file().freeze()
+        result = frozen.thaw()
+        assert not isinstance(result, FrozenXMLElement)
+        assert result.dict == frozen.dict
+        result.children[0].add_attribute({"lang": "it"})
+        result.make_child("book")
+        assert frozen.no_children == 3
+
+
+class Testfrom_dict:
+    @mark.it("Builds a tree equal to the one the dict was made from")
+    def test_round_trip(self):
+        test_tree = build_bookstore_file()
+        result = XMLElement.from_dict(test_tree.dict, encoding="UTF-8")
+        assert result.dict == test_tree.dict
+        assert result.encoding == "UTF-8"
+        for xmlelt in result.descendants[1:]:
+            assert xmlelt.root is result
+            assert xmlelt in xmlelt.parent.children
+
+    @mark.it("Validates tag names and attribute keys with the usual messages")
+    def test_validation(self):
+        with raises(ValueError) as err:
+            XMLElement.from_dict(
+                {"a": {"children": [{"xmlb": {"attributes": {}, "value": None}}]}}
+            )
+        assert str(err.value) == 'Tag name may not begin with "xml"'
+        with raises(ValueError) as err:
+            XMLElement.from_dict({"a": {"attributes": {"b c": 1}}})
+        assert str(err.value) == 'Attribute key may not contain " "'
+
+    @mark.it("Raises ValueError for children of an element with a value")
+    def test_value_and_children(self):
+        with raises(ValueError) as err:
+            XMLElement.from_dict({"a": {"value": "x", "children": [{"b": {}}]}})
+        assert (
+            str(err.value)
+            == "Cannot add children to an element with a value. Please set value to None."
+        )
+
+
+class Testbuild:
+    @mark.it("Builds a tree from (depth, tag, attributes, value) tuples")
+    def test_build(self):
+        result = XMLElement.build(
+            [
+                (0, "bookstore", None, None),
+                (1, "book", {"category": "cooking"}, None),
+                (2, "title", {"lang": "en"}, "Everyday Italian"),
+                (2, "price", None, 30),
+                (1, "book", {"category": "web"}, None),
+                (2, "title", {"lang": "en"}, "Learning XML"),
+            ]
+        )
+        assert result.size == 6
+        assert result.get_from_path([0, 1]).value == 30
+        assert result.get_from_path([1, 0]).path == [1, 0]
+        assert result.get_from_path([1, 0]).parent is result.children[1]
+        assert result.get_from_path([1, 0]).root is result
+
+    @mark.it("Builds the same tree as repeated make_child calls")
+    def test_same_as_make_child(self):
+        test_tree = build_bookstore_file()
+        specs = [
+            (xmlelt.depth, xmlelt.tag, xmlelt.attributes, xmlelt.value)
+            for xmlelt in test_tree
+        ]
+        assert XMLElement.build(specs).dict == test_tree.dict
+
+    @mark.it("Raises ValueError for elements without a parent")
+    def test_missing_parent(self):
+        with raises(ValueError) as err:
+            XMLElement.build([(0, "a", None, None), (2, "b", None, None)])
+        assert str(err.value) == "Element b at depth 2 has no parent"
+        with raises(ValueError) as err:
+            XMLElement.build([(0, "a", None, None), (0, "b", None, None)])
+        assert str(err.value) == "Cannot build a tree with more than one root element"
+        with raises(ValueError) as err:
+            XMLElement.build([])
+        assert str(err.value) == "Cannot build a tree without a root element"
+
+
+class Testvalidation:
+    @mark.it("Trees use strict validation by default")
+    def test_default(self, root_element):
+        root_element.make_child("book")
+        assert root_element.validation == "strict"
+        assert root_element.last_child.validation == "strict"
+
+    @mark.it("Validation policy is set on the root and applies to the whole tree")
+    def test_policy_from_root(self, root_element):
+        root_element.make_child("book")
+        root_element.validation = "trusted"
+        assert root_element.last_child.validation == "trusted"
+        root_element.last_child.make_child("Matt Kim")
+        root_element.last_child.add_attribute({"xml_lang": "en"})
+        with raises(TypeError) as err:
+            root_element.last_child.validation = "strict"
+        assert str(err.value) == "Cannot set validation of non-root element"
+
+    @mark.it("Raises ValueError for unknown policies")
+    def test_unknown_policy(self):
+        with raises(ValueError) as err:
+            XMLElement("bookstore", validation="lenient")
+        assert str(err.value) == "Validation must be one of strict, cached, trusted"
+
+    @mark.it("Cached validation raises the same errors as strict validation")
+    def test_cached_errors(self):
+        test_tree = XMLElement("bookstore", validation="cached")
+        for name, message in [
+            ("Matt&Kim", 'Tag name may not contain "&"'),
+            ("Matt Kim", 'Tag name may not contain " "'),
+            (".MattKim", "Tag name must begin with letter or underscore"),
+            ("XMLatthew", 'Tag name may not begin with "xml"'),
+        ]:
+            for _ in range(2):
+                with raises(ValueError) as err:
+                    test_tree.make_child(name)
+                assert str(err.value) == message
+        with raises(ValueError) as err:
+            test_tree.add_attribute({"xmlns": "x"})
+        assert str(err.value) == 'Attribute key may not begin with "xml"'
+
+    @mark.it("Cached validation accepts valid names, including non-ASCII names")
+    def test_cached_valid(self):
+        test_tree = XMLElement("bookstore", validation="cached")
+        for name in ["book", "_book", "Mätthëw", "éclair", "book"]:
+            test_tree.make_child(name)
+        assert [child.tag for child in test_tree.children] == [
+            "book",
+            "_book",
+            "Mätthëw",
+            "éclair",
+            "book",
+        ]
+
+
+class Testattributes:
+    @mark.it("Returns a read-only view which reflects later changes")
+    def test_read_only_view(self, root_element):
+        root_element.add_attribute({"name": "Waterstones"})
+        view = root_element.attributes
+        with raises(TypeError):
+            view["name"] = "Foyles"
+        root_element.add_attribute({"location": "Peckham"})
+        assert view == {"name": "Waterstones", "location": "Peckham"}
+
+    @mark.it("copy_attributes returns an independent dict")
+    def test_copy_attributes(self, root_element):
+        root_element.add_attribute({"name": "Waterstones"})
+        result = root_element.copy_attributes()
+        result["name"] = "Foyles"
+        assert root_element.attributes == {"name": "Waterstones"}
+
+
+class Testentities:
+    @mark.it("Returns a read-only view, and copy_entities returns a dict")
+    def test_entities_view(self, root_element):
+        root_element.add_entity({"Waterstones": "company"})
+        with raises(TypeError):
+            root_element.entities["Foyles"] = "shop"
+        result = root_element.copy_entities()
+        result["Foyles"] = "shop"
+        assert root_element.entities == {"Waterstones": "company"}
+
+
+class Testattribute_string:
+    @mark.it("Returns the attributes with entity references inserted")
+    def test_attribute_string(self, root_element):
+        root_element.make_child("book", {"category": "web & mobile", "rating": 5})
+        result = root_element.last_child.attribute_string
+        assert result == ' category="web &amp; mobile" rating="5"'
+
+    @mark.it("Reflects attribute changes after being cached")
+    def test_attribute_changes(self, root_element):
+        root_element.make_child("book", {"category": "web"})
+        book = root_element.last_child
+        assert book.attribute_string == ' category="web"'
+        book.add_attribute({"category": "cooking", "rating": "good"})
+        assert book.attribute_string == ' category="cooking" rating="good"'
+        book.remove_attribute("category")
+        assert book.attribute_string == ' rating="good"'
+        book.remove_attribute("rating")
+        assert book.attribute_string == ""
+
+    @mark.it("Reflects entity changes and moves to another tree after being cached")
+    def test_entity_changes(self, root_element):
+        root_element.make_child("book", {"shop": "Waterstones"})
+        book = root_element.last_child
+        assert book.attribute_string == ' shop="Waterstones"'
+        root_element.add_entity({"Waterstones": "company"})
+        assert book.attribute_string == ' shop="&company;"'
+        root_element.remove_entity("Waterstones")
+        assert book.attribute_string == ' shop="Waterstones"'
+        other_tree = XMLElement("library")
+        other_tree.add_entity({"Waterstones": "shop"})
+        root_element.remove_from_path([0])
+        other_tree.add_child(book)
+        assert book.attribute_string == ' shop="&shop;"'
+
+
+class Testremove_paths:
+    @mark.it("Removes every element at the given paths, resolved before removing")
+    def test_remove_paths(self):
+        test_tree = build_bookstore_file()
+        books = test_tree.children
+        first_book, third_book = books[0], books[2]
+        author, price = third_book.children[1], third_book.children[3]
+        removed = test_tree.remove_paths([[0], [2, 1], [2, 3]])
+        assert removed == [first_book, author, price]
+        assert test_tree.no_children == 2
+        assert [child.tag for child in test_tree.children[1].children] == [
+            "title",
+            "year",
+        ]
+        for xmlelt in removed:
+            assert xmlelt.is_root
+            assert xmlelt.parent is None
+
+    @mark.it("Ignores paths inside subtrees which are also being removed")
+    def test_nested_paths(self):
+        test_tree = build_bookstore_file()
+        book = test_tree.children[1]
+        removed = test_tree.remove_paths([[1, 2], [1]])
+        assert removed == [book]
+        assert book.no_children == 4
+        assert book.children[2].root is book
+
+    @mark.it("Raises IndexError for the root or paths not in the tree")
+    def test_errors(self, root_element):
+        root_element.make_child("book")
+        with raises(IndexError) as err:
+            root_element.remove_paths([[0], []])
+        assert str(err.value) == "cannot remove root element"
+        with raises(IndexError) as err:
+            root_element.remove_paths([[0], [1]])
+        assert str(err.value) == "no element found at path [1]"
+        assert root_element.no_children == 1
+
+
+class Testremove_where:
+    @mark.it("Removes every descendant matching the predicate in one pass")
+    def test_remove_where(self):
+        test_tree = build_bookstore_file()
+        version = test_tree.version
+        removed = test_tree.remove_where(lambda xmlelt: xmlelt.tag in ("year", "price"))
+        assert len(removed) == 6
+        assert test_tree.size == 10
+        for book in test_tree.children:
+            assert [child.tag for child in book.children] == ["title", "author"]
+        assert test_tree.changed_since(version) == test_tree.children
+
+    @mark.it("Does not test or remove the element itself")
+    def test_not_self(self):
+        test_tree = build_bookstore_file()
+        assert test_tree.remove_where(lambda xmlelt: xmlelt.tag == "bookstore") == []
+        book = test_tree.children[0]
+        book.remove_where(lambda xmlelt: True)
+        assert book.is_leaf
+        assert test_tree.no_children == 3
+
+    @mark.it("Keeps attribute indexes consistent")
+    def test_indexes(self, catalog):
+        removed = catalog.remove_where(
+            lambda xmlelt: xmlelt.attributes.get("id", "bk103") != "bk103"
+        )
+        assert len(removed) == 4
+        assert catalog.get_by_attribute("id", "bk101") == []
+        assert catalog.get_by_attribute("id", "bk103") == catalog.children
+
+
+class Testinsert_child:
+    @mark.it("Inserts a child at the given position with correct parent and root")
+    def test_insert(self):
+        test_tree = build_bookstore_file()
+        new_book = XMLElement("book", {"category": "poetry"})
+        new_book.make_child("title", value="Leaves of Grass")
+        test_tree.insert_child(1, new_book)
+        assert test_tree.children[1] is new_book
+        assert new_book.parent is test_tree
+        assert new_book.last_child.root is test_tree
+        assert new_book.last_child.path == [1, 0]
+        assert test_tree.children[2].path == [2]
+
+    @mark.it("Raises ValueError when inserting an ancestor or an attached element")
+    def test_errors(self):
+        test_tree = build_bookstore_file()
+        book = test_tree.children[0]
+        with raises(ValueError) as err:
+            book.insert_child(0, test_tree)
+        assert str(err.value) == "cannot add ancestor as child"
+        with raises(ValueError) as err:
+            book.insert_child(0, book)
+        assert str(err.value) == "cannot add ancestor as child"
+        with raises(ValueError) as err:
+            book.insert_child(0, test_tree.children[1])
+        assert str(err.value) == "element already has a parent"
+        with raises(ValueError) as err:
+            book.last_child.insert_child(0, XMLElement("currency"))
+        assert (
+            str(err.value)
+            == "Cannot add children to an element with a value. Please set value to None."
+        )
+
+    @mark.it("Updates indexes and entities of the tree")
+    def test_indexes_entities(self, catalog):
+        new_book = XMLElement("book", {"id": "bk000"})
+        new_book.add_entity({"Waterstones": "company"})
+        catalog.insert_child(0, new_book)
+        assert catalog.get_by_attribute("id", "bk000") == [new_book]
+        assert catalog.entities == {"Waterstones": "company"}
+
+
+class Testextend_children:
+    @mark.it("Adds all of the new children to the end, in order")
+    def test_extend(self, root_element):
+        root_element.make_child("book")
+        new_books = [XMLElement("book", value=i) for i in range(3)]
+        root_element.extend_children(new_books)
+        assert root_element.children[1:] == new_books
+        for book in new_books:
+            assert book.root is root_element
+
+    @mark.it("Checks the whole batch before adding any of it")
+    def test_batch_checked(self, root_element):
+        book = XMLElement("book")
+        with raises(ValueError) as err:
+            root_element.extend_children([book, book])
+        assert str(err.value) == "cannot add the same element twice"
+        assert root_element.is_leaf
+        assert book.is_root
+
+
+class Testmove:
+    @mark.it("Moves an element to another parent in the same tree")
+    def test_move_same_tree(self):
+        test_tree = build_bookstore_file()
+        price = test_tree.get_from_path([0, 3])
+        price.move(test_tree.children[2], 0)
+        assert test_tree.children[0].no_children == 3
+        assert test_tree.get_from_path([2, 0]) is price
+        assert price.parent is test_tree.children[2]
+        assert price.root is test_tree
+
+    @mark.it("Moves an element within its parent's children")
+    def test_move_within_parent(self):
+        test_tree = build_bookstore_file()
+        first_book = test_tree.children[0]
+        first_book.move(test_tree)
+        assert test_tree.children[2] is first_book
+        assert first_book.path == [2]
+
+    @mark.it("Moves an element to another tree, updating roots and indexes")
+    def test_move_other_tree(self, catalog):
+        other_tree = XMLElement("library")
+        other_tree.add_index("id")
+        book = catalog.children[1]
+        book.move(other_tree)
+        assert catalog.get_by_attribute("id", "bk102") == []
+        assert other_tree.get_by_attribute("id", "bk102") == [book]
+        assert book.last_child.root is other_tree
+
+    @mark.it("Raises ValueError when moving an element below itself")
+    def test_move_cycle(self):
+        test_tree = build_bookstore_file()
+        book = test_tree.children[0]
+        with raises(ValueError) as err:
+            book.move(book)
+        assert str(err.value) == "cannot add ancestor as child"
+        with raises(ValueError):
+            test_tree.move(book)
+        assert book.parent is test_tree
+
+    @mark.it("Leaves the source tree unchanged when a move fails")
+    def test_move_fails(self):
+        test_tree = build_bookstore_file()
+        book = test_tree.children[1]
+        expected = test_tree.dict
+        target = XMLElement("shelf", value="Closed")
+        bad_moves = [
+            (TypeError, lambda: book.move(XMLElement("shelf").freeze())),
+            (ValueError, lambda: book.move(target)),
+            (IndexError, lambda: book.move(test_tree.children[0], 6)),
+            (IndexError, lambda: book.move(test_tree, -3)),
+            (ValueError, lambda: test_tree.move(book.last_child)),
+        ]
+        for error, bad_move in bad_moves:
+            with raises(error):
+                bad_move()
+            assert book.parent is test_tree
+            assert test_tree.children[1] is book
+            assert test_tree.dict == expected
+
+
+class Testcontent_hash:
+    @mark.it("Trees with the same content have the same content hash")
+    def test_same_content(self):
+        assert (
+            build_bookstore_file().content_hash == build_bookstore_file().content_hash
+        )
+
+    @mark.it("Attribute order and value types do not change the content hash")
+    def test_normalised(self):
+        first = XMLElement("book", {"id": "bk101", "lang": "en"})
+        first.make_child("price", value=30)
+        second = XMLElement("book", {"lang": "en", "id": "bk101"})
+        second.make_child("price", value="30")
+        assert first.content_hash == second.content_hash
+
+    @mark.it("Content hash changes when a descendant changes")
+    def test_invalidated(self):
+        test_tree = build_bookstore_file()
+        before = test_tree.content_hash
+        book_hash = test_tree.children[1].content_hash
+        test_tree.children[0].children[0].value = "Another title"
+        assert test_tree.content_hash != before
+        assert test_tree.children[1].content_hash == book_hash
+        test_tree.children[0].children[0].value = "Everyday Italian"
+        assert test_tree.content_hash == before
+
+    @mark.it("Content hash changes when children are reordered or removed")
+    def test_structure_changes(self):
+        test_tree = build_bookstore_file()
+        before = test_tree.content_hash
+        test_tree.children[0].move(test_tree)
+        reordered = test_tree.content_hash
+        assert reordered != before
+        test_tree.remove_from_path([0])
+        assert test_tree.content_hash not in (before, reordered)
+
+    @mark.it("Frozen trees have the same content hash as the original")
+    def test_frozen(self):
+        test_tree = build_bookstore_file()
+        frozen = test_tree.freeze()
+        assert frozen.content_hash == test_tree.content_hash
+        assert frozen.children[1].content_hash == test_tree.children[1].content_hash
+
+
+class Testequals:
+    @mark.it("Returns True for a tree loaded from a file written from an equal tree")
+    def test_round_trip(self):
+        test_tree = build_bookstore_file()
+        result_path = "test_data/book_store/test_equals.xml"
+        test_tree.to_xml(result_path, self_closing=False)
+        loaded = load_xml_from_file(result_path)
+        os.remove(result_path)
+        assert loaded.equals(test_tree)
+        assert test_tree.equals(loaded)
+
+    @mark.it("Returns False when any element differs")
+    def test_difference(self):
+        test_tree = build_bookstore_file()
+        other = build_bookstore_file()
+        other.children[2].children[0].add_attribute({"lang": "fr"})
+        assert not test_tree.equals(other)
+        other.children[2].children[0].add_attribute({"lang": "en"})
+        assert test_tree.equals(other)
+        other.children[1].last_child.value = 1
+        assert not test_tree.equals(other)
+
+    @mark.it("Uses cached content hashes when both trees have them")
+    def test_cached_hashes(self):
+        test_tree = build_bookstore_file()
+        other = test_tree.clone()
+        assert test_tree.content_hash == other.content_hash
+        assert test_tree.equals(other)
+        other.last_child.make_child("format", value="paperback")
+        assert not test_tree.equals(other)
+
+
+class Testduplicate_subtrees:
+    @mark.it(
+        "Groups elements with the same content, reporting only the largest duplicates"
+    )
+    def test_groups(self):
+        test_tree = XMLElement("catalog")
+        for _ in range(2):
+            test_tree.make_child("book", {"id": "bk101"})
+            test_tree.last_child.make_child("title", value="Book")
+        test_tree.make_child("title", value="Book")
+        test_tree.make_child("book", {"id": "bk102"})
+        test_tree.make_child("title", value="Book")
+        result = test_tree.duplicate_subtrees()
+        assert result == [
+            test_tree.children[:2],
+            [test_tree.children[2], test_tree.children[4]],
+        ]
+
+    @mark.it("Does not report elements whose copies are all inside larger duplicates")
+    def test_no_single_groups(self):
+        test_tree = XMLElement("catalog")
+        for _ in range(2):
+            test_tree.make_child("a")
+            test_tree.last_child.make_child("b", value="x")
+        test_tree.make_child("b", value="x")
+        test_tree.make_child("c")
+        for _ in range(2):
+            test_tree.last_child.make_child("d")
+        assert test_tree.duplicate_subtrees() == [
+            test_tree.children[:2],
+            test_tree.children[3].children,
+        ]
+
+    @mark.it("Returns an empty list when there are no duplicates")
+    def test_no_duplicates(self, catalog):
+        assert catalog.duplicate_subtrees() == []
+
+
+class Testdispose:
+    @mark.it("Disposed trees are freed without the cyclic garbage collector")
+    @mark.parametrize("freeze", [False, True])
+    def test_freed_by_refcount(self, freeze):
+        test_tree = build_bookstore_file()
+        test_tree.add_index("category")
+        if freeze:
+            test_tree = test_tree.freeze()
+        leaf = weakref.ref(test_tree.children[1].children[2])
+        gc.disable()
+        try:
+            test_tree.dispose()
+            del test_tree
+            assert leaf() is None
+        finally:
+            gc.enable()
+
+    @mark.it("Context manager disposes of the tree on exit")
+    def test_context_manager(self):
+        with build_bookstore_file() as test_tree:
+            book = test_tree.children[0]
+            assert book.root is test_tree
+        assert book.parent is None
+        assert test_tree.children == []
+
+    @mark.it("Raises TypeError when disposing of a non-root element")
+    def test_non_root(self):
+        test_tree = build_bookstore_file()
+        with raises(TypeError) as err:
+            test_tree.children[0].dispose()
+        assert str(err.value) == "Cannot dispose of non-root element"
+        assert test_tree.children[0].parent is test_tree
+
+
+class Testmemory_report:
+    @mark.it("Reports the number of elements and a total equal to the breakdowns")
+    def test_totals(self):
+        test_tree = build_bookstore_file()
+        test_tree.add_index("category")
+        result = test_tree.memory_report()
+        assert result["elements"] == 16
+        breakdowns = ["nodes", "attributes", "children", "strings"]
+        breakdowns += ["entities", "indexes"]
+        assert result["total"] == sum(result[key] for key in breakdowns)
+        assert all(result[key] > 0 for key in breakdowns)
+
+    @mark.it("Reports a histogram of element counts and bytes per tag")
+    def test_tags(self):
+        result = build_bookstore_file().memory_report()
+        assert result["tags"]["book"]["count"] == 3
+        assert result["tags"]["bookstore"]["count"] == 1
+        assert sum(tag["bytes"] for tag in result["tags"].values()) == (
+            result["total"] - result["entities"] - result["indexes"]
+        )
+
+    @mark.it("Counts strings shared by several elements once")
+    def test_shared_strings(self):
+        value = "a long value shared by every element" * 10
+        test_tree = XMLElement("catalog")
+        test_tree.make_child("book", value=value)
+        single = test_tree.memory_report()["strings"]
+        test_tree.make_child("book", value=value)
+        assert test_tree.memory_report()["strings"] == single
+
+    @mark.it("Reports only the subtree of a non-root element")
+    def test_subtree(self):
+        test_tree = build_bookstore_file()
+        result = test_tree.children[0].memory_report()
+        assert result["elements"] == 5
+        assert result["entities"] == result["indexes"] == 0
+
+
+class Testxml_chunks:
+    @mark.it("Joined chunks are the same as the body written by write_xml_body")
+    def test_same_as_body(self):
+        test_tree = build_bookstore_file()
+        body = StringIO()
+        test_tree.write_xml_body(body, 2, True)
+        assert "".join(test_tree.xml_chunks(2, True)) == body.getvalue()
+
+    @mark.it("Indents a subtree from its depth in the tree unless depth is given")
+    def test_depth(self):
+        book = build_bookstore_file().children[0]
+        chunks = list(book.xml_chunks(2, True))
+        assert chunks[0] == '  <book category="cooking">\n'
+        assert chunks[-1] == "  </book>\n"
+        chunks = list(book.xml_chunks(4, True, depth=0))
+        assert chunks[1] == '    <title lang="en">Everyday Italian</title>\n'
+        assert chunks[-1] == "</book>\n"
+
+    @mark.it("Writes trees deeper than the recursion limit")
+    def test_deep_tree(self):
+        test_tree = XMLElement("level")
+        xmlelt = test_tree
+        for _ in range(3000):
+            xmlelt.make_child("level")
+            xmlelt = xmlelt.last_child
+        body = StringIO()
+        test_tree.write_xml_body(body, 0, True)
+        assert (
+            body.getvalue()
+            == "<level>\n" * 3000 + "<level/>\n" + "</level>\n" * 2999 + "</level>"
+        )
+
+
+class Testto_string:
+    @mark.it("Returns the document which to_xml writes")
+    @mark.parametrize("self_closing", [True, False])
+    def test_same_as_to_xml(self, self_closing):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Giada De Laurentiis": "giada"})
+        result_path = "test_data/book_store/test_string.xml"
+        test_tree.to_xml(result_path, 4, self_closing)
+        with open(result_path) as f:
+            expected = f.read()
+        os.remove(result_path)
+        assert test_tree.to_string(4, self_closing) == expected
+
+
+class Testto_bytes:
+    @mark.it("Returns the bytes of the file which to_xml writes")
+    def test_same_as_to_xml(self):
+        test_tree = XMLElement("Mätthëw", {"name": "Zoë"}, encoding="ISO-8859-1")
+        result_path = "test_data/book_store/test_bytes.xml"
+        test_tree.to_xml(result_path)
+        with open(result_path, "rb") as f:
+            expected = f.read()
+        os.remove(result_path)
+        assert test_tree.to_bytes() == expected
+
+    @mark.it("Encodes with and declares the encoding given")
+    def test_encoding(self):
+        result = XMLElement("Mätthëw").to_bytes("UTF-16")
+        assert result.decode("UTF-16").startswith(
+            '<?xml version="1.0" encoding="UTF-16"?>\n<Mätthëw/>'
+        )
+
+
+class Testwrite:
+    @mark.it("Writes the document to text and binary streams")
+    def test_streams(self):
+        test_tree = build_bookstore_file()
+        text_stream = StringIO()
+        binary_stream = BytesIO()
+        test_tree.write(text_stream)
+        test_tree.write(binary_stream)
+        assert text_stream.getvalue() == test_tree.to_string()
+        assert binary_stream.getvalue() == test_tree.to_string().encode()
+
+    @mark.it("Writes to files opened in binary mode")
+    def test_binary_file(self):
+        test_tree = build_bookstore_file()
+        result_path = "test_data/book_store/test_write.xml"
+        with open(result_path, "wb") as f:
+            test_tree.write(f, self_closing=False)
+        with open(result_path) as f:
+            result = f.read()
+        os.remove(result_path)
+        assert result == test_tree.to_string(self_closing=False)
+
+
+class Testminified_chunks:
+    @mark.it("Writes elements without indentation or line breaks")
+    def test_minified(self):
+        test_tree = XMLElement("bookstore")
+        test_tree.add_entity({"Waterstones": "company"})
+        test_tree.make_child("book", {"shop": "Waterstones"})
+        test_tree.last_child.make_child("title", value="Fish & Chips")
+        test_tree.last_child.make_child("format")
+        test_tree.make_child("book")
+        assert "".join(test_tree.minified_chunks(True)) == (
+            '<bookstore><book shop="&company;"><title>Fish &amp; Chips</title>'
+            "<format/></book><book/></bookstore>"
+        )
+        assert "".join(test_tree.minified_chunks(False)) == (
+            '<bookstore><book shop="&company;"><title>Fish &amp; Chips</title>'
+            "<format></format></book><book></book></bookstore>"
+        )
+
+    @mark.it("to_xml writes the prolog followed by the minified elements")
+    def test_to_xml(self):
+        test_tree = build_bookstore_file()
+        result_path = "test_data/book_store/test_minified.xml"
+        test_tree.to_xml(result_path, minify=True)
+        with open(result_path) as f:
+            result = f.read()
+        os.remove(result_path)
+        assert result == test_tree.to_string(minify=True)
+        assert result == (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            + "".join(test_tree.minified_chunks(True))
+        )
+        assert len(result) < len(test_tree.to_string())
+
+    @mark.it("Frozen trees write minified elements")
+    def test_frozen(self):
+        test_tree = build_bookstore_file()
+        assert test_tree.freeze().to_string(minify=True) == test_tree.to_string(
+            minify=True
+        )
+
+
+class Testto_xml_workers:
+    @mark.it("Writes the same file with several worker processes as with one")
+    @mark.parametrize(
+        "tab_size, self_closing, minify",
+        [(2, True, False), (4, False, False), (2, True, True)],
+    )
+    def test_same_as_serial(self, tab_size, self_closing, minify):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Giada De Laurentiis": "giada"})
+        test_tree.children[2].make_child("format")
+        for i in range(20):
+            test_tree.make_child("magazine", {"issue": i}, f"Issue {i} & more")
+        result_path = "test_data/book_store/test_workers.xml"
+        test_tree.to_xml(result_path, tab_size, self_closing, minify, workers=3)
+        with open(result_path) as f:
+            result = f.read()
+        os.remove(result_path)
+        assert result == test_tree.to_string(tab_size, self_closing, minify)
+
+    @mark.it("Writes subtrees at their depth in the tree")
+    def test_subtree(self):
+        book = build_bookstore_file().children[1]
+        stream = StringIO()
+        book.write(stream, workers=2)
+        assert stream.getvalue() == book.to_string()
+
+    @mark.it("Writes each tree correctly when called from several threads")
+    def test_threads(self, monkeypatch):
+        # Forking a process which is running threads can deadlock, so threaded
+        # programs should use a start method which does not fork this process.
+        monkeypatch.setattr(
+            xml_element, "get_context", lambda: get_context("forkserver")
+        )
+        trees = []
+        for i in range(4):
+            test_tree = XMLElement("bookstore", {"shop": i})
+            for j in range(10):
+                test_tree.make_child("book", {"id": j}, f"Book {i}.{j}")
+            trees.append(test_tree)
+        streams = [StringIO() for _ in trees]
+        threads = [
+            Thread(target=test_tree.write, args=(stream,), kwargs={"workers": 2})
+            for test_tree, stream in zip(trees, streams)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for test_tree, stream in zip(trees, streams):
+            assert stream.getvalue() == test_tree.to_string()
+
+    @mark.it("Sends subtrees as build specifications where processes are not forked")
+    def test_without_fork(self, monkeypatch):
+        monkeypatch.setattr(xml_element, "get_context", lambda: get_context("spawn"))
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Giada De Laurentiis": "giada"})
+        test_tree.children[2].make_child("format")
+        stream = StringIO()
+        test_tree.write(stream, workers=2)
+        assert stream.getvalue() == test_tree.to_string()
+
+
+class Testto_binary:
+    @mark.it("Snapshots read back with from_binary give an equal tree")
+    def test_round_trip(self):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Giada De Laurentiis": "giada"})
+        test_tree.encoding = "UTF-8"
+        test_tree.xml_version = "1.0"
+        test_tree.to_binary("test_data/test_snapshot.xmlh")
+        result = XMLElement.from_binary("test_data/test_snapshot.xmlh")
+        os.remove("test_data/test_snapshot.xmlh")
+        assert result.equals(test_tree)
+        assert result.entities == test_tree.entities
+        assert (result.encoding, result.xml_version) == ("UTF-8", "1.0")
+        assert result.children[1].children[3].value == 29.99
+
+    @mark.it("Reads the snapshot written by XMLStore")
+    def test_from_store(self):
+        result = XMLElement.from_binary("test_data/book_store/bookstore.xmlh")
+        assert result.equals(build_bookstore_file())
+
+
+class Testenable_fragment_cache:
+    @mark.it("Cached writes are the same as uncached writes after changes")
+    def test_same_output(self):
+        test_tree = build_bookstore_file()
+        expected = test_tree.to_string()
+        test_tree.enable_fragment_cache()
+        assert test_tree.to_string() == expected
+        assert test_tree.to_string() == expected
+        test_tree.children[1].children[3].value = 24.99
+        test_tree.children[2].make_child("format", value="paperback")
+        test_tree.add_entity({"Erik T. Ray": "erik"})
+        result = test_tree.to_string(4, False)
+        test_tree.disable_fragment_cache()
+        assert result == test_tree.to_string(4, False)
+
+    @mark.it(
+        "Rewriting after a change renders only the changed elements and their ancestors"
+    )
+    def test_reuse(self):
+        test_tree = build_bookstore_file()
+        test_tree.enable_fragment_cache()
+        test_tree.to_string()
+        cache = test_tree.fragment_cache
+        assert (cache.hits, cache.misses, len(cache)) == (0, 4, 4)
+        test_tree.children[1].children[3].value = 24.99
+        assert len(cache) == 2
+        test_tree.to_string()
+        assert (cache.hits, cache.misses) == (2, 6)
+
+    @mark.it("Caches each indentation setting separately")
+    def test_settings(self):
+        test_tree = build_bookstore_file()
+        test_tree.enable_fragment_cache()
+        test_tree.to_string(2)
+        test_tree.to_string(4)
+        assert len(test_tree.fragment_cache) == 8
+        book = test_tree.children[0]
+        assert "".join(book.xml_chunks(2, True, depth=0)) == "".join(
+            book.xml_chunks(2, True, depth=0)
+        )
+        assert test_tree.fragment_cache.hits == 1
+
+    @mark.it("Drops the least recently used XML to stay within max_size")
+    def test_max_size(self):
+        test_tree = build_bookstore_file()
+        expected = test_tree.to_string()
+        test_tree.enable_fragment_cache(max_size=400)
+        assert test_tree.to_string() == expected
+        cache = test_tree.fragment_cache
+        assert cache.size <= 400
+        assert cache.size == sum(size for _, _, size in cache.fragments.values())
+        assert test_tree.to_string() == expected
+
+    @mark.it("Does not reuse XML of a subtree changed while detached from the tree")
+    def test_reinserted_subtree(self):
+        test_tree = XMLElement.build(
+            [
+                (0, "r", None, None),
+                (1, "a", None, None),
+                (2, "b", None, None),
+                (3, "c", None, "old"),
+            ]
+        )
+        test_tree.enable_fragment_cache()
+        test_tree.to_string()
+        removed = test_tree.children[0]
+        test_tree.remove_paths([[0]])
+        removed.children[0].children[0].value = "new"
+        test_tree.insert_child(0, removed)
+        result = test_tree.to_string()
+        test_tree.disable_fragment_cache()
+        assert result == test_tree.to_string()
+        assert "<c>new</c>" in result
+
+    @mark.it("Drops the XML cached for removed subtrees")
+    @mark.parametrize("remove", ["remove_paths", "remove_where"])
+    def test_removed_subtrees(self, remove):
+        test_tree = XMLElement.build(
+            [(0, "r", None, None)]
+            + [(depth, "a", None, None) for depth in range(1, 5)]
+            + [(1, "b", None, None), (2, "c", None, None)]
+        )
+        test_tree.enable_fragment_cache()
+        test_tree.to_string()
+        cache = test_tree.fragment_cache
+        removed = weakref.ref(test_tree.children[0].children[0])
+        if remove == "remove_paths":
+            test_tree.remove_paths([[0]])
+        else:
+            test_tree.remove_where(lambda xmlelt: xmlelt.tag == "a")
+        gc.collect()
+        assert removed() is None
+        assert list(cache.keys) == [test_tree.children[0]]
+        assert cache.size == sum(entry[2] for entry in cache.fragments.values())
+
+    @mark.it("Caches each part of a deep document once")
+    def test_deep_size(self):
+        test_tree = XMLElement.build(
+            (depth, "level", {"depth": depth}, None) for depth in range(200)
+        )
+        test_tree.enable_fragment_cache()
+        expected = test_tree.to_string()
+        assert len(test_tree.fragment_cache) == 199
+        assert test_tree.fragment_cache.size < len(expected)
+        assert test_tree.to_string() == expected
+
+    @mark.it("Raises TypeError when enabling the cache of a non-root element")
+    def test_non_root(self):
+        test_tree = build_bookstore_file()
+        with raises(TypeError) as err:
+            test_tree.children[0].enable_fragment_cache()
+        assert str(err.value) == "Cannot enable fragment cache of non-root element"
+        assert test_tree.fragment_cache is None
+
+
+class Testpretty_print:
+    @mark.it("Writes the print_line of each element in document order")
+    def test_lines(self):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Giada De Laurentiis": "giada"})
+        stream = StringIO()
+        test_tree.pretty_print(stream)
+        expected = "".join(xmlelt.print_line() for xmlelt in test_tree)
+        assert stream.getvalue() == expected
+        assert str(test_tree) == expected
+        book = test_tree.children[1]
+        assert str(book) == "".join(xmlelt.print_line() for xmlelt in book)
+
+    @mark.it("Writes to standard output by default")
+    def test_stdout(self, capsys):
+        test_tree = build_bookstore_file()
+        test_tree.pretty_print()
+        assert capsys.readouterr().out == str(test_tree)
+
+    @mark.it("Stops after max_nodes elements")
+    def test_max_nodes(self):
+        test_tree = build_bookstore_file()
+        stream = StringIO()
+        test_tree.pretty_print(stream, max_nodes=4)
+        lines = stream.getvalue().splitlines(keepends=True)
+        assert lines[:4] == [xmlelt.print_line() for xmlelt in test_tree][:4]
+        assert lines[4:] == ["...\n"]
+
+    @mark.it("Summarises the children of elements at max_depth")
+    def test_max_depth(self):
+        test_tree = build_bookstore_file()
+        stream = StringIO()
+        test_tree.pretty_print(stream, max_depth=1)
+        lines = stream.getvalue().splitlines(keepends=True)
+        assert len(lines) == 7
+        assert lines[1] == test_tree.children[0].print_line()
+        assert lines[2] == "   ∟... (4 children not shown)\n"
+
+    @mark.it("Writes trees deeper than the recursion limit")
+    def test_deep_tree(self):
+        test_tree = XMLElement.build(
+            (depth, "level", None, None) for depth in range(3000)
+        )
+        stream = StringIO()
+        test_tree.pretty_print(stream, max_nodes=2000)
+        assert stream.getvalue().count("\n") == 2001
+
+
+class Testwrite_json:
+    @mark.it("Writes the same json as dumping the tree's dict")
+    @mark.parametrize("indent", [None, 0, 2, "\t"])
+    @mark.parametrize("sort_keys", [False, True])
+    def test_same_as_dict(self, indent, sort_keys):
+        test_tree = build_bookstore_file()
+        test_tree.children[0].add_attribute({"tags": ["italian", "pasta"], "stock": 3})
+        test_tree.children[2].make_child("format")
+        stream = StringIO()
+        test_tree.write_json(stream, indent, sort_keys)
+        expected = dumps(test_tree.dict, indent=indent, sort_keys=sort_keys)
+        assert stream.getvalue() == expected
+        assert test_tree.json(indent, sort_keys) == expected
+
+    @mark.it("Writes trees deeper than the recursion limit")
+    def test_deep_tree(self):
+        test_tree = XMLElement.build(
+            (depth, "level", None, None) for depth in range(3000)
+        )
+        stream = StringIO()
+        test_tree.write_json(stream, indent=None)
+        result = stream.getvalue()
+        assert result.startswith(
+            '{"level": {"attributes": {}, "value": null, "children": [{'
+        )
+        assert result.count("level") == 3000
+
+    @mark.it("Writes one json record for each child with ndjson")
+    def test_ndjson(self):
+        test_tree = build_bookstore_file()
+        stream = StringIO()
+        test_tree.write_json(stream, ndjson=True)
+        lines = stream.getvalue().splitlines()
+        assert len(lines) == 3
+        for line, child in zip(lines, test_tree.children):
+            assert load_json(StringIO(line)) == child.dict
+            assert line == child.json(indent=None)
+
+
+class Testfrom_json:
+    @mark.it("Loads the tree from a json file")
+    @mark.parametrize("stream", [False, True])
+    def test_load_file(self, stream):
+        test_tree = XMLElement.from_json(
+            os.path.join("test_data", "book_store", "bookstore.json"), stream
+        )
+        assert test_tree.equals(build_bookstore_file())
+
+    @mark.it("Round trips the output of json")
+    @mark.parametrize("stream", [False, True])
+    @mark.parametrize("indent", [None, 2])
+    @mark.parametrize("sort_keys", [False, True])
+    def test_round_trip(self, stream, indent, sort_keys):
+        test_tree = build_bookstore_file()
+        test_tree.children[0].add_attribute({"tags": ["italian", "pasta"], "stock": 3})
+        test_tree.children[2].make_child("format")
+        test_tree.children[1].children[0].value = '{"quoted": [1, 2]}'
+        result = XMLElement.from_json(
+            test_tree.json(indent, sort_keys), stream, "UTF-16", "1.1"
+        )
+        assert result.equals(test_tree)
+        assert result.dict == test_tree.dict
+        assert result.encoding == "UTF-16"
+        assert result.xml_version == "1.1"
+
+    @mark.it("Reads a file in blocks when streaming")
+    @mark.parametrize("block_size", [1, 2, 7])
+    @mark.parametrize("sort_keys", [False, True])
+    def test_read_blocks(self, monkeypatch, block_size, sort_keys):
+        monkeypatch.setattr(xml_element, "read_buffer_size", block_size)
+        test_tree = build_bookstore_file()
+        test_tree.children[0].add_attribute({"stock": 3, "rating": 4.25})
+        result_path = "test_data/book_store/test_stream.json"
+        with open(result_path, "w") as f:
+            f.write(test_tree.json(sort_keys=sort_keys))
+        result = XMLElement.from_json(result_path, stream=True)
+        os.remove(result_path)
+        assert result.dict == test_tree.dict
+
+    @mark.it("Builds a tree that can be edited and indexed")
+    @mark.parametrize("stream", [False, True])
+    def test_edit_result(self, stream):
+        test_tree = XMLElement.from_json(build_bookstore_file().json(), stream)
+        test_tree.add_index("category")
+        test_tree.children[1].make_child("format", value="paperback")
+        assert test_tree.get_by_attribute("category", "children") == [
+            test_tree.children[1]
+        ]
+        assert test_tree.children[1].last_child.root is test_tree
+
+    @mark.it("Loads trees deeper than the recursion limit when streaming")
+    def test_deep_tree(self):
+        test_tree = XMLElement.build(
+            (depth, "level", None, None) for depth in range(3000)
+        )
+        result = XMLElement.from_json(test_tree.json(indent=None), stream=True)
+        assert result.equals(test_tree)
+
+    @mark.it("Raises ValueError for invalid tag names")
+    @mark.parametrize("stream", [False, True])
+    def test_invalid_tag(self, stream):
+        with raises(ValueError):
+            XMLElement.from_json('{"x<y": {"attributes": {}, "value": null}}', stream)
+
+    @mark.it("Raises ValueError for an element with both a value and children")
+    @mark.parametrize("stream", [False, True])
+    def test_value_and_children(self, stream):
+        source = '{"a": {"children": [{"b": {}}], "value": "text"}}'
+        with raises(ValueError) as err:
+            XMLElement.from_json(source, stream)
+        assert (
+            str(err.value)
+            == "Cannot add children to an element with a value. Please set value to None."
+        )
+
+    @mark.it("Raises ValueError for malformed json when streaming")
+    @mark.parametrize(
+        "source",
+        [
+            '{"a": {"value": 1}',
+            '{"a": {"value": 1}} extra',
+            '{"a": {"colour": 1}}',
+            '{"a": {"children": [{"b": {}} {"c": {}}]}}',
+        ],
+    )
+    def test_malformed(self, source):
+        with raises(ValueError):
+            XMLElement.from_json(source, stream=True)
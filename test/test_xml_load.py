@@ -391,3 +391,108 @@ class Testends_a_comment:
         expected = (True, '<book category="children">')
         result = ends_a_comment(test_line)
         assert result == expected
+
+
+@mark.it("Uses the given validation policy only while loading the file")
+def test_load_validation():
+    test_tree = load_xml_from_file(
+        "test_data/book_store/bookstore.xml", validation="trusted"
+    )
+    assert test_tree.validation == "strict"
+    assert test_tree.size == 16
+    with raises(ValueError):
+        test_tree.make_child("bad name<")
+    with raises(ValueError):
+        test_tree.children[0].add_attribute({"xml&": 1})
+    book = test_tree.children[0]
+    test_tree.remove_paths([[0]])
+    assert book.validation == "strict"
+    assert load_xml_from_file("test_data/book_store/bookstore.xml").validation == (
+        "strict"
+    )
+
+
+@mark.it("Raises ValueError for an unknown validation policy")
+@mark.parametrize("load", [load_xml_from_file, load_store_from_file])
+def test_load_unknown_validation(load):
+    with raises(ValueError) as err:
+        load("test_data/book_store/bookstore.xml", validation="bogus")
+    assert str(err.value) == "Validation must be one of strict, cached, trusted"
+
+
+@mark.it(
+    "Loading a minified file gives the same tree as loading the file it was written from"
+)
+@mark.parametrize(
+    "expected_path",
+    [
+        "test_data/book_store/bookstore.xml",
+        "test_data/def_entity_refs/def_entity_refs.xml",
+        "test_data/leaf_without_value/leaf_without_value.xml",
+    ],
+)
+def test_load_minified(expected_path):
+    result_path = "test_data/test_minified.xml"
+    test_tree = load_xml_from_file(expected_path)
+    test_tree.to_xml(result_path, minify=True)
+    result = load_xml_from_file(result_path)
+    store = load_store_from_file(result_path)
+    os.remove(result_path)
+    assert result.equals(test_tree)
+    assert result.entities == test_tree.entities
+    assert store.to_element().equals(test_tree)
+
+
+@mark.it("Keeps a line break between the lines of a value written over several lines")
+def test_multiline_values():
+    test_tree = load_xml_from_file("test_data/real_files/real_file1.xml")
+    assert test_tree.children[0].children[5].value == (
+        "An in-depth look at creating applications\nwith XML."
+    )
+    assert test_tree.children[1].children[5].value == (
+        "A former architect battles corporate zombies,\nan evil sorceress, "
+        "and her own childhood to become queen\nof the world."
+    )
+    store = load_store_from_file("test_data/real_files/real_file1.xml")
+    assert store.to_element().equals(test_tree)
+
+
+class Testgenerate_element_lines:
+    @mark.it("Supplies each tag on its own line, with values joined to their tags")
+    def test_minified(self):
+        lines = ['<a x="1"><b>text</b><c/><d></d><e><f> </f></e></a>']
+        assert list(generate_element_lines(lines)) == [
+            '<a x="1">',
+            "<b>text</b>",
+            "<c/>",
+            "<d></d>",
+            "<e>",
+            "<f> </f>",
+            "</e>",
+            "</a>",
+        ]
+
+    @mark.it("Supplies the lines of an indented file unchanged")
+    def test_indented(self):
+        lines = ["<a>", "<b>text</b>", "", "<c/>", "</a>"]
+        assert list(generate_element_lines(lines)) == [
+            "<a>",
+            "<b>text</b>",
+            "<c/>",
+            "</a>",
+        ]
+
+    @mark.it("Supplies a start tag and stop tag on separate lines separately")
+    def test_empty_element(self):
+        lines = ["<a>", "<b>", "</b>", "<c>", "", "</c>", "</a>"]
+        assert list(generate_element_lines(lines)) == lines[:4] + lines[5:]
+
+    @mark.it("Joins the lines of a value with line breaks")
+    def test_multiline_value(self):
+        lines = ["<a>", "<b>x", "", "y</b>", "<c>text", "</c>", "</a>"]
+        assert list(generate_element_lines(lines)) == [
+            "<a>",
+            "<b>x\ny</b>",
+            "<c>text</c>",
+            "</a>",
+        ]
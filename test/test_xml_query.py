@@ -0,0 +1,37 @@
+from pytest import mark, raises
+from src.xml_query import compile_query
+
+
+class Testcompile_query:
+    @mark.it("Compiles a query into steps with axes, tags and predicates")
+    def test_steps(self):
+        query = compile_query('/bookstore//book[@category="web"][2]/title')
+        assert query.absolute
+        assert [step.axis for step in query.steps] == ["child", "descendant", "child"]
+        assert [step.tag for step in query.steps] == ["bookstore", "book", "title"]
+        predicates = query.steps[1].predicates
+        assert [pred.kind for pred in predicates] == ["compare", "position"]
+        assert predicates[0].index_key == "category"
+        assert predicates[0].literal == "web"
+        assert predicates[1].literal == 2
+
+    @mark.it("Parses numeric literals and value comparisons")
+    def test_numeric(self):
+        pred = compile_query("book[price <= 30]").steps[0].predicates[0]
+        assert (pred.operand, pred.op, pred.literal) == ("price", "<=", 30.0)
+        assert pred.index_key is None
+
+    @mark.it("Returns the cached plan for a repeated expression")
+    def test_cached(self):
+        assert compile_query("//book/title") is compile_query("//book/title")
+
+    @mark.it("Allows square brackets inside quoted literals")
+    def test_quoted_bracket(self):
+        pred = compile_query("a[@b='x]y']").steps[0].predicates[0]
+        assert pred.literal == "x]y"
+
+    @mark.it("Raises ValueError for empty and malformed queries")
+    def test_invalid(self):
+        for expr in ["", "/", "book[0]", "book[@id=bk101]", "book/", "a[b"]:
+            with raises(ValueError):
+                compile_query(expr)
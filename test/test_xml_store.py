@@ -0,0 +1,215 @@
+from pytest import mark, raises
+from src.xml_element import XMLElement
+from src.xml_load import load_xml_from_file, load_store_from_file
+from src.xml_store import XMLStore
+from test_data.book_store.book_store import build_bookstore_file
+import os
+
+
+class Testload_store_from_file:
+    @mark.it("Loads an XML file into a store with one entry per element")
+    def test_load(self):
+        store = load_store_from_file("test_data/book_store/bookstore.xml")
+        assert len(store) == 16
+        assert store.view().tag == "bookstore"
+        assert store.encoding == "UTF-8"
+        assert store.xml_version == "1.0"
+
+    @mark.it("Stores each distinct tag, key and value once in the string table")
+    def test_string_table(self):
+        store = load_store_from_file("test_data/book_store/bookstore.xml")
+        assert store.strings.count("book") == 1
+        assert store.strings.count("2005") == 1
+
+    @mark.it("Raises TypeError for files without a parsable XML tree")
+    def test_not_xml(self):
+        with raises(TypeError) as err:
+            load_store_from_file("test_data/not_xml/not_xml")
+        assert (
+            str(err.value) == "No parsable XML tree found at test_data/not_xml/not_xml."
+        )
+
+
+class Testto_xml:
+    @mark.parametrize(
+        "data_path,self_closing",
+        [
+            ("test_data/book_store/bookstore.xml", True),
+            ("test_data/multi_attrs/multi_attrs.xml", False),
+            ("test_data/entity_refs/predef_entity_refs.xml", False),
+            ("test_data/self_closing/self_closing.xml", True),
+            ("test_data/leaf_without_value/leaf_without_value.xml", False),
+        ],
+    )
+    @mark.it("Writes the same XML file as the XMLElement tree loaded from the file")
+    def test_same_as_element(self, data_path, self_closing):
+        expected_path = "test_data/expected_xml.xml"
+        result_path = "test_data/test_xml.xml"
+        load_xml_from_file(data_path).to_xml(expected_path, self_closing=self_closing)
+        load_store_from_file(data_path).to_xml(result_path, self_closing=self_closing)
+        with open(expected_path) as f:
+            expected = f.readlines()
+        with open(result_path) as f:
+            result = f.readlines()
+        os.remove(expected_path)
+        os.remove(result_path)
+        assert result == expected
+
+    @mark.it("Writes user-defined entity references and subtrees")
+    def test_entities_subtree(self):
+        test_tree = XMLElement("bookstore")
+        test_tree.add_entity({"Waterstones": "company"})
+        test_tree.make_child("book", {"shop": "Waterstones"})
+        test_tree.last_child.make_child("title", value="Waterstones & Co")
+        store = XMLStore.from_element(test_tree)
+        for xmlelt, view in [
+            (test_tree, store.view(0)),
+            (test_tree.last_child, store.view(1)),
+        ]:
+            xmlelt.to_xml("test_data/expected_xml.xml", tab_size=3)
+            view.to_xml("test_data/test_xml.xml", tab_size=3)
+            with open("test_data/expected_xml.xml") as f:
+                expected = f.read()
+            with open("test_data/test_xml.xml") as f:
+                result = f.read()
+            os.remove("test_data/expected_xml.xml")
+            os.remove("test_data/test_xml.xml")
+            assert result == expected
+
+
+class Testjson:
+    @mark.it("Returns the same json and dict as the XMLElement tree")
+    def test_json(self):
+        test_tree = build_bookstore_file()
+        store = XMLStore.from_element(test_tree)
+        assert store.view().dict == test_tree.dict
+        assert store.json(sort_keys=True) == test_tree.json(sort_keys=True)
+        assert store.view(1).json(indent=None) == test_tree.children[0].json(
+            indent=None
+        )
+
+
+class Testto_binary:
+    @mark.it("Round trips the store through a binary snapshot")
+    def test_round_trip(self):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Waterstones": "company"})
+        test_tree.children[0].add_attribute({"stock": 3, "sale": True, "new": False})
+        test_tree.children[1].make_child("format", {"pages": 223.5})
+        test_tree.children[2].children[0].value = "Learning XML — 2nd édition"
+        test_tree.encoding = "UTF-16"
+        test_tree.xml_version = "1.1"
+        store = XMLStore.from_element(test_tree)
+        store.to_binary("test_data/test_snapshot.xmlh")
+        result = XMLStore.from_binary("test_data/test_snapshot.xmlh")
+        os.remove("test_data/test_snapshot.xmlh")
+        assert len(result) == len(store)
+        assert result.strings == store.strings
+        assert [type(string) for string in result.strings] == [
+            type(string) for string in store.strings
+        ]
+        assert result.entities == {"Waterstones": "company"}
+        assert result.encoding == "UTF-16"
+        assert result.xml_version == "1.1"
+        assert result.to_element().equals(test_tree)
+
+    @mark.it("Loads the book store snapshot")
+    def test_load_snapshot(self):
+        store = XMLStore.from_binary("test_data/book_store/bookstore.xmlh")
+        assert store.dict() == build_bookstore_file().dict
+        assert store.view().last_child.last_child.value == 39.95
+
+    @mark.it("Can add elements to a loaded store")
+    def test_add_after_load(self):
+        store = XMLStore.from_binary("test_data/book_store/bookstore.xmlh")
+        index = store.add_element(1, "format", {"lang": "en"}, 2005)
+        assert store.view(index).path == [0, 4]
+        assert store.strings.count("lang") == 1
+        assert store.strings.count(2005) == 1
+
+    @mark.it("Loads deep trees without recursion")
+    def test_deep_tree(self):
+        test_tree = XMLElement.build(
+            (depth, "level", None, None) for depth in range(3000)
+        )
+        XMLStore.from_element(test_tree).to_binary("test_data/test_snapshot.xmlh")
+        result = XMLStore.from_binary("test_data/test_snapshot.xmlh")
+        os.remove("test_data/test_snapshot.xmlh")
+        assert result.view().size == 3000
+        assert result.to_element().equals(test_tree)
+
+    @mark.it("Raises TypeError for values which cannot be written")
+    def test_unsupported_value(self):
+        test_tree = XMLElement("bookstore", value=(1, 2))
+        with raises(TypeError) as err:
+            XMLStore.from_element(test_tree).to_binary("test_data/test_snapshot.xmlh")
+        assert not os.path.exists("test_data/test_snapshot.xmlh")
+        assert str(err.value) == "Cannot write value of type tuple to a binary snapshot"
+
+    @mark.it("Raises ValueError for files which are not snapshots")
+    def test_not_snapshot(self):
+        with raises(ValueError) as err:
+            XMLStore.from_binary("test_data/book_store/bookstore.xml")
+        assert (
+            str(err.value)
+            == "No binary snapshot found at test_data/book_store/bookstore.xml"
+        )
+
+    @mark.it("Raises ValueError for snapshots of another version")
+    def test_other_version(self):
+        with open("test_data/book_store/bookstore.xmlh", "rb") as f:
+            snapshot = bytearray(f.read())
+        snapshot[4] = 2
+        with open("test_data/test_snapshot.xmlh", "wb") as f:
+            f.write(snapshot)
+        with raises(ValueError) as err:
+            XMLStore.from_binary("test_data/test_snapshot.xmlh")
+        os.remove("test_data/test_snapshot.xmlh")
+        assert str(err.value) == "Unsupported binary snapshot version 2"
+
+
+class TestXMLStoreView:
+    @mark.it("Navigates the tree like an XMLElement")
+    def test_navigation(self):
+        test_tree = build_bookstore_file()
+        view = XMLStore.from_element(test_tree).view()
+        price = view.get_from_path([1, 3])
+        assert price.value == 29.99
+        assert price.path == [1, 3]
+        assert price.depth == 2
+        assert price.parent == view.children[1]
+        assert price.root == view
+        assert view.children[1].last_child == price
+        assert view.size == 16
+        assert [xmlelt.tag for xmlelt in view] == [xmlelt.tag for xmlelt in test_tree]
+        assert view.children[0].children[0].attributes == {"lang": "en"}
+        assert view.children[0].children[0].attribute_string == ' lang="en"'
+
+    @mark.it("Gives a read-only view of the store's entities, like an XMLElement")
+    def test_entities(self):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Waterstones": "company"})
+        store = XMLStore.from_element(test_tree)
+        view = store.view().children[1]
+        assert view.entities == test_tree.entities
+        with raises(TypeError):
+            view.entities["Foyles"] = "shop"
+        store.entities["Foyles"] = "shop"
+        assert view.entities["Foyles"] == "shop"
+        entities = view.copy_entities()
+        entities["Blackwells"] = "shop"
+        assert "Blackwells" not in store.entities
+
+    @mark.it("Raises IndexError if requested path is not in the tree")
+    def test_index_error(self):
+        view = XMLStore.from_element(XMLElement("bookstore")).view()
+        with raises(IndexError) as err:
+            view.get_from_path([0])
+        assert str(err.value) == "no element found at path [0]"
+
+    @mark.it("Materialises an equivalent XMLElement tree")
+    def test_to_element(self):
+        test_tree = build_bookstore_file()
+        result = XMLStore.from_element(test_tree).view().to_element()
+        assert isinstance(result, XMLElement)
+        assert result.dict == test_tree.dict
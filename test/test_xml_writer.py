@@ -0,0 +1,132 @@
+from pytest import mark, raises
+from src.xml_element import XMLElement
+from src.xml_writer import XMLWriter
+from test_data.book_store.book_store import build_bookstore_file
+import os
+
+result_path = "test_data/book_store/test_writer.xml"
+expected_path = "test_data/book_store/test_writer_expected.xml"
+
+
+def read_and_remove(*filepaths):
+    contents = []
+    for filepath in filepaths:
+        with open(filepath) as f:
+            contents.append(f.read())
+        os.remove(filepath)
+    return contents
+
+
+def write_books(writer: XMLWriter, test_tree: XMLElement):
+    for book in test_tree.children:
+        writer.start("book", book.copy_attributes())
+        for child in book.children:
+            writer.element(child.tag, child.copy_attributes(), child.value)
+        writer.end()
+
+
+class TestXMLWriter:
+    @mark.it("Writes the same document as to_xml")
+    @mark.parametrize("self_closing", [True, False])
+    def test_same_as_to_xml(self, self_closing):
+        test_tree = build_bookstore_file()
+        test_tree.add_entity({"Giada De Laurentiis": "giada"})
+        test_tree.children[0].make_child("format")
+        test_tree.to_xml(expected_path, 4, self_closing)
+        with XMLWriter(
+            result_path,
+            entities=test_tree.entities,
+            tab_size=4,
+            self_closing=self_closing,
+        ) as writer:
+            writer.start("bookstore")
+            write_books(writer, test_tree)
+        result, expected = read_and_remove(result_path, expected_path)
+        assert result == expected
+
+    @mark.it("Writes a single root element without children")
+    def test_leaf_root(self):
+        XMLElement("bookstore", {"category": "web"}).to_xml(expected_path)
+        with XMLWriter(result_path) as writer:
+            writer.element("bookstore", {"category": "web"})
+        result, expected = read_and_remove(result_path, expected_path)
+        assert result == expected
+
+    @mark.it("Writes subtrees at the current level of indentation")
+    def test_write_subtree(self):
+        test_tree = build_bookstore_file()
+        test_tree.to_xml(expected_path)
+        with XMLWriter(result_path) as writer:
+            writer.start("bookstore")
+            writer.write_subtree(test_tree.children[0])
+            writer.write_subtree(test_tree.children[1].clone())
+            writer.write_subtree(test_tree.children[2])
+        result, expected = read_and_remove(result_path, expected_path)
+        assert result == expected
+
+    @mark.it("Writes a whole tree as the root element")
+    def test_write_root(self):
+        test_tree = build_bookstore_file()
+        test_tree.to_xml(expected_path)
+        with XMLWriter(result_path) as writer:
+            writer.write_subtree(test_tree)
+        result, expected = read_and_remove(result_path, expected_path)
+        assert result == expected
+
+    @mark.it("Inserts the writer's entity references into subtree values")
+    def test_subtree_entities(self):
+        test_tree = XMLElement("bookstore")
+        test_tree.add_entity({"Waterstones": "ws"})
+        test_tree.make_child("book", {"shop": "Waterstones"}, "Waterstones Co")
+        with XMLWriter(result_path) as writer:
+            writer.start("shops")
+            writer.write_subtree(test_tree)
+        with XMLWriter(expected_path, entities={"Co": "co"}) as writer:
+            writer.start("shops")
+            writer.write_subtree(test_tree.children[0])
+        result, expected = read_and_remove(result_path, expected_path)
+        assert "&ws;" not in result
+        assert '<book shop="Waterstones">Waterstones Co</book>' in result
+        assert '<book shop="Waterstones">Waterstones &co;</book>' in expected
+
+    @mark.it("Raises ValueError for children of an element with a value")
+    def test_child_of_value(self):
+        with raises(ValueError) as err:
+            with XMLWriter(result_path) as writer:
+                writer.start("bookstore")
+                writer.text("closed")
+                writer.start("book")
+        os.remove(result_path)
+        assert (
+            str(err.value)
+            == "Cannot add children to an element with a value. Please set value to None."
+        )
+
+    @mark.it("Raises ValueError for a value after children")
+    def test_value_after_children(self):
+        with raises(ValueError) as err:
+            with XMLWriter(result_path) as writer:
+                writer.start("bookstore")
+                writer.element("book")
+                writer.text("closed")
+        os.remove(result_path)
+        assert str(err.value) == "Cannot add value to an element with children"
+
+    @mark.it("Raises ValueError for a second root element or an unmatched end")
+    def test_second_root(self):
+        with XMLWriter(result_path) as writer:
+            writer.element("bookstore")
+            with raises(ValueError) as err:
+                writer.start("bookstore")
+            assert str(err.value) == "Cannot write more than one root element"
+            with raises(ValueError) as err:
+                writer.end()
+            assert str(err.value) == "No element to end"
+        os.remove(result_path)
+
+    @mark.it("Raises ValueError for invalid tag names")
+    def test_invalid_name(self):
+        with raises(ValueError):
+            with XMLWriter(result_path) as writer:
+                writer.start("book store")
+        os.remove(result_path)
@@ -1,7 +1,6 @@
 from src.xml_element import XMLElement
 
 
-# from pickle import load
 def build_bookstore_file(filetype=None):
     root_element = XMLElement("bookstore")
     root_element.make_child("book", {"category": "cooking"})
@@ -22,8 +21,8 @@ def build_bookstore_file(filetype=None):
     # print(loaded_tree.tag, [child.value for child in loaded_tree.children[0].children])
     if filetype == "xml":
         root_element.to_xml("book_store/bookstore_export.xml", self_closing=False)
-    if filetype == "pkl":
-        root_element.to_pickle("book_store/bookstore.pkl")
+    if filetype == "xmlh":
+        root_element.to_binary("book_store/bookstore.xmlh")
     return root_element
 
 